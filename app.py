@@ -1,20 +1,34 @@
+import asyncio
 import time
 import streamlit as st
 from code_editor import code_editor
 from vanna_calls import (
     generate_questions_cached,
     generate_sql_cached,
-    run_sql_cached,
+    run_sql_streaming,
+    result_frame,
+    rewrite_for_preview,
+    forget_sql_result,
+    get_result_cache,
+    get_result_store,
+    get_replica,
+    get_query_budget,
+    current_user,
+    current_session,
     generate_plotly_code_cached,
     generate_plot_cached,
     generate_followup_cached,
     should_generate_chart_cached,
-    is_sql_valid_cached,
     generate_summary_cached,
+    get_pipelines,
+    submit_stage,
+    fan_out_question,
     setup_vanna
 )
 # app.py
-from connect_db import connect_to_db
+from connect_db import get_connection_pool
+from query_control import BudgetExceeded, QueryCancelled
+from result_compare import compare_results, result_summary
 
 avatar_url = "http://www.datap.ai/images/datapai-logo.png"
 
@@ -40,11 +54,8 @@ selected_db=st.session_state.selected_db
 if st.session_state.selected_db:
     st.write(f"Selected Database: {st.session_state.selected_db}")
 
-    # Assuming connect_to_db is a function that connects to the database
-    st.write(f"Connecting to {selected_db}...")
-
-    # Use the selected database in the connect_to_db function
-    conn = connect_to_db(st.session_state.selected_db)
+    # Connections are pooled across reruns and sessions; this only connects on first use
+    pool = get_connection_pool(st.session_state.selected_db)
 
 st.sidebar.title("Output Settings")
 st.sidebar.checkbox("Show SQL", value=True, key="show_sql")
@@ -53,14 +64,135 @@ st.sidebar.checkbox("Show Plotly Code", value=True, key="show_plotly_code")
 st.sidebar.checkbox("Show Chart", value=True, key="show_chart")
 st.sidebar.checkbox("Show Summary", value=True, key="show_summary")
 st.sidebar.checkbox("Show Follow-up Questions", value=True, key="show_followup")
+st.sidebar.checkbox("Preview Large Results", value=True, key="preview_results")
+st.sidebar.checkbox("Compare Databases", value=False, key="fan_out")
+if st.session_state.get("fan_out", False):
+    st.sidebar.multiselect("Databases to compare", db_options, default=db_options, key="fan_out_targets")
 st.sidebar.button("Reset", on_click=lambda: set_question(None), use_container_width=True)
 
-st.sidebar.write(st.session_state)
+st.sidebar.title("Result Cache")
+result_cache_stats = get_result_cache().stats()
+st.sidebar.metric("Cached results", result_cache_stats["entries"], f"{result_cache_stats['bytes'] / 2**20:,.1f} MB", delta_color="off")
+st.sidebar.write(
+    f"{result_cache_stats['hits']} hits · {result_cache_stats['misses']} misses · "
+    f"{result_cache_stats['evictions']} evictions · {result_cache_stats['invalidations']} invalidated"
+)
+
+query_budget_stats = get_query_budget().stats(current_user())
+st.sidebar.write(
+    f"Query time used: {query_budget_stats['runtime']:,.0f} of {query_budget_stats['max_runtime']:,.0f} s · "
+    f"{query_budget_stats['running']} of {query_budget_stats['max_concurrent']} queries running"
+)
+
+replica = get_replica(selected_db)
+if replica is not None:
+    replica_stats = replica.stats()
+    st.sidebar.write(
+        f"Local replica: {replica_stats['tables']} tables · {replica_stats['refreshes']} refreshes · "
+        f"{replica_stats['routed']} queries answered"
+    )
+    if replica_stats["error"]:
+        st.sidebar.caption(f"Last replica refresh failed: {replica_stats['error']}")
+
+result_store_stats = get_result_store().stats()
+st.sidebar.write(
+    f"Spilled results: {result_store_stats['files']} files ({result_store_stats['bytes'] / 2**20:,.1f} MB on disk) · "
+    f"{result_store_stats['expired']} expired"
+)
 
 my_question = st.session_state.get("my_question", default=None)
 def set_question(question):
     st.session_state["my_question"] = question
 
+def run_full_query(sql):
+    st.session_state["full_result_sql"] = sql
+
+def cancel_query(result):
+    # Stops the query on the database if this session started it. Results other sessions started, or
+    # that this one got from the result cache, may be read by other sessions too: those keep running,
+    # and only this session stops waiting for them. The rerun this click triggers starts over without it.
+    if result.started_by == current_session():
+        result.cancel()
+    st.session_state["my_question"] = None
+    st.session_state["query_cancelled"] = True
+
+if st.session_state.pop("query_cancelled", False):
+    st.info("Query cancelled")
+
+def wait_for(stage, placeholder, message):
+    # Poll instead of blocking, so a rerun interrupts this one straight away; the stage keeps running
+    start = time.monotonic()
+    while not stage.done():
+        placeholder.caption(f"{message} {time.monotonic() - start:,.0f} s")
+        time.sleep(0.1)
+    placeholder.empty()
+    return stage.result()
+
+def generate_chart(question, sql, df_key, df, show_chart):
+    if not should_generate_chart_cached(question=question, sql=sql, df_key=df_key, _df=df):
+        return None, None
+    code = generate_plotly_code_cached(question=question, sql=sql, df_key=df_key, _df=df)
+    fig = None
+    if code is not None and code != "" and show_chart:
+        fig = generate_plot_cached(code=code, df_key=df_key, _df=df)
+    return code, fig
+
+def show_fan_out(question, targets):
+    # The question runs on every target at once; each column fills in as its target answers
+    columns = dict(zip(targets, st.columns(len(targets))))
+    for target, column in columns.items():
+        column.subheader(target)
+
+    results = {}
+
+    async def start_queries():
+        async for target, sql, seconds, result, error in fan_out_question(question, targets):
+            column = columns[target]
+            if sql and st.session_state.get("show_sql", True):
+                column.code(sql, language="sql", line_numbers=True)
+            column.caption(f"SQL generated in {seconds:,.1f} s")
+            if error is not None:
+                column.error(str(error))
+            else:
+                results[target] = result
+
+    try:
+        asyncio.run(start_queries())
+    except BudgetExceeded as e:
+        st.error(str(e))
+        return
+
+    # Poll instead of blocking, so a new question interrupts this run straight away
+    placeholders_progress = {target: columns[target].empty() for target in results}
+    while not all(result.done for result in results.values()):
+        for target, result in results.items():
+            placeholders_progress[target].caption(f"Running query ... {result.elapsed:,.1f} s, {result.rows:,} rows")
+        time.sleep(0.25)
+
+    # Results are compared page by page, so spilled ones stay on disk
+    summaries = {target: None for target in targets}
+    latencies = {}
+    for target, result in results.items():
+        column = columns[target]
+        placeholders_progress[target].empty()
+        try:
+            summaries[target] = result_summary(result.pages(), columns=result.columns)
+        except Exception as e:
+            column.error(f"The query failed: {e}")
+            continue
+        latencies[target] = result.elapsed
+        column.metric("Query latency", f"{result.elapsed:,.2f} s")
+        if result.truncated:
+            column.warning(f"Truncated to the first {result.rows:,} rows")
+        if st.session_state.get("show_table", True):
+            column.dataframe(result.page(0, 20))
+
+    # etl/copy_data.py copies from SQLite, so that is what the copies are checked against
+    baseline = "SQLite3" if "SQLite3" in targets else targets[0]
+    comparison = compare_results(summaries, baseline)
+    comparison["latency (s)"] = comparison["database"].map(latencies).round(2)
+    st.chat_message("assistant", avatar=avatar_url).dataframe(comparison, hide_index=True)
+
 assistant_message_suggested = st.chat_message(
     "assistant", avatar=avatar_url
 )
@@ -88,93 +220,229 @@ if my_question:
     user_message = st.chat_message("user")
     user_message.write(f"{my_question}")
 
-    sql = generate_sql_cached(question=my_question,selected_db=selected_db)
+    if st.session_state.get("fan_out", False):
+        show_fan_out(my_question, st.session_state.get("fan_out_targets") or db_options)
+        st.stop()
+
+    # Every stage runs on the shared workers; a rerun for the same question in this session picks up
+    # the stages where they are, finished or not, instead of starting them again
+    pipeline = get_pipelines().get((current_session(), selected_db, my_question), session=current_session())
+    placeholder_status = st.empty()
+
+    sql = wait_for(
+        submit_stage(pipeline, "sql", generate_sql_cached, question=my_question, selected_db=selected_db),
+        placeholder_status,
+        "Generating SQL query ...",
+    )
 
     if sql:
-        if is_sql_valid_cached(sql=sql, selected_db=selected_db):
-            if st.session_state.get("show_sql", True):
-                assistant_message_sql = st.chat_message(
-                    "assistant", avatar=avatar_url
-                )
-                assistant_message_sql.code(sql, language="sql", line_numbers=True)
-        else:
+        # Exploratory queries run as a cheap preview unless the full result was asked for
+        query_sql = sql
+        rewrite = None
+        if st.session_state.get("preview_results", True) and st.session_state.get("full_result_sql") != sql:
+            rewrite = rewrite_for_preview(sql=sql, selected_db=selected_db)
+            query_sql = rewrite.sql
+
+        # Running the query is the validation, so the database only executes it once. Finished
+        # queries are looked up again, so the result cache can tell whether the data changed.
+        try:
+            result = wait_for(
+                submit_stage(pipeline, ("query", query_sql), run_sql_streaming, reuse=False, sql=query_sql, selected_db=selected_db),
+                placeholder_status,
+                "Checking the query ...",
+            )
+        except BudgetExceeded as e:
+            st.error(str(e))
+            st.stop()
+        except Exception as e:
+            print(f"SQL Validation Error: {e}")
             assistant_message = st.chat_message(
                 "assistant", avatar=avatar_url
             )
             assistant_message.write(sql)
             st.stop()
 
-        df = run_sql_cached(sql=sql)
+        # Poll instead of blocking, so a click on Cancel interrupts this run straight away
+        placeholder_cancel = st.empty()
+        placeholder_progress = st.empty()
+        if not result.done:
+            placeholder_cancel.button("Cancel query", on_click=cancel_query, args=(result,), key="cancel_query")
+        while not result.wait(0.25, first_chunk=True):
+            placeholder_progress.caption(f"Running query ... {result.elapsed:,.0f} s")
+        placeholder_progress.empty()
 
-        if df is not None:
-            st.session_state["df"] = df
-
-        if st.session_state.get("df") is not None:
-            if st.session_state.get("show_table", True):
-                df = st.session_state.get("df")
-                assistant_message_table = st.chat_message(
-                    "assistant",
-                    avatar=avatar_url,
-                )
-                if len(df) > 20:
-                    assistant_message_table.text("First 20 rows of data")
-                    assistant_message_table.dataframe(df.head(20))
-                else:
-                    assistant_message_table.dataframe(df)
+        try:
+            preview = result.preview()
+        except (QueryCancelled, TimeoutError) as e:
+            forget_sql_result(sql=query_sql, selected_db=selected_db)
+            placeholder_cancel.empty()
+            st.error(str(e))
+            st.stop()
+        except Exception as e:
+            print(f"SQL Validation Error: {e}")
+            forget_sql_result(sql=query_sql, selected_db=selected_db)
+            assistant_message = st.chat_message(
+                "assistant", avatar=avatar_url
+            )
+            assistant_message.write(sql)
+            st.stop()
 
-            if should_generate_chart_cached(question=my_question, sql=sql, df=df):
+        if st.session_state.get("show_sql", True):
+            assistant_message_sql = st.chat_message(
+                "assistant", avatar=avatar_url
+            )
+            assistant_message_sql.code(sql, language="sql", line_numbers=True)
 
-                code = generate_plotly_code_cached(question=my_question, sql=sql, df=df)
+        # The first page is shown as soon as it arrives, while the rest of the result is fetched
+        if st.session_state.get("show_table", True):
+            assistant_message_table = st.chat_message(
+                "assistant",
+                avatar=avatar_url,
+            )
+            placeholder_table_caption = assistant_message_table.empty()
+            placeholder_table = assistant_message_table.empty()
+            if len(preview) > 20:
+                placeholder_table_caption.text("First 20 rows of data")
+                placeholder_table.dataframe(preview.head(20))
+            else:
+                placeholder_table.dataframe(preview)
 
-                if st.session_state.get("show_plotly_code", False):
-                    assistant_message_plotly_code = st.chat_message(
-                        "assistant",
-                        avatar=avatar_url,
-                    )
-                    assistant_message_plotly_code.code(
-                        code, language="python", line_numbers=True
-                    )
+        try:
+            while not result.wait(0.25):
+                placeholder_progress.caption(f"Fetching results ... {result.rows:,} rows")
+            placeholder_progress.empty()
+            placeholder_cancel.empty()
+            df = result_frame(result)
+        except Exception as e:
+            print(f"SQL Fetch Error: {e}")
+            forget_sql_result(sql=query_sql, selected_db=selected_db)
+            st.error(f"Fetching the results failed: {e}")
+            st.stop()
 
-                if code is not None and code != "":
-                    if st.session_state.get("show_chart", True):
-                        assistant_message_chart = st.chat_message(
-                            "assistant",
-                            avatar=avatar_url,
-                        )
-                        fig = generate_plot_cached(code=code, df=df)
-                        if fig is not None:
-                            assistant_message_chart.plotly_chart(fig)
-                        else:
-                            assistant_message_chart.error("I couldn't generate a chart")
+        if result.served_by is not None:
+            st.caption(f"Answered from the {result.served_by} in {result.elapsed:,.2f} s")
+
+        if rewrite is not None and rewrite.rewritten:
+            applied = []
+            if rewrite.sample_percent is not None:
+                applied.append(f"a {rewrite.sample_percent:g}% sample of the first table")
+            if rewrite.limit is not None:
+                applied.append(f"at most {rewrite.limit:,} rows")
+            st.info(f"This is a preview, limited to {' and '.join(applied)}.")
+            st.button("Run full query", on_click=run_full_query, args=(sql,), key="run_full_query")
+
+        if result.truncated:
+            st.warning(
+                f"The result was truncated to the first {result.rows:,} rows ({result.bytes / 2**20:,.0f} MB); "
+                "refine the question or add a LIMIT to see the rest."
+            )
+
+        # Only the handle is kept per session; the rows stay in the result cache, or on disk if spilled
+        st.session_state["result"] = result
+        if len(df) < result.rows:
+            st.caption(f"The chart and summary are based on the first {len(df):,} of {result.rows:,} rows.")
+
+        if st.session_state.get("show_table", True) and result.rows > 20:
+            pages = (result.rows + 19) // 20
+            page = assistant_message_table.number_input(
+                f"Page (of {pages:,})", min_value=1, max_value=pages, value=1, step=1, key=f"result_page_{result.fingerprint}"
+            )
+            placeholder_table_caption.text(f"Rows {(page - 1) * 20 + 1:,} to {min(page * 20, result.rows):,} of {result.rows:,}")
+            placeholder_table.dataframe(result.page((page - 1) * 20, 20))
+
+        if df is not None:
+            # Chart, summary and follow-up questions only depend on the result, so they run at the
+            # same time and each placeholder is filled as soon as its stage finishes
+            stages = {}
+            placeholders = {}
+            show_chart = st.session_state.get("show_chart", True)
+
+            placeholders["chart"] = (st.empty(), st.empty())
+            stages["chart"] = submit_stage(
+                pipeline, ("chart", result.fingerprint, show_chart), generate_chart,
+                question=my_question, sql=sql, df_key=result.fingerprint, df=df, show_chart=show_chart,
+            )
 
             if st.session_state.get("show_summary", True):
-                assistant_message_summary = st.chat_message(
-                    "assistant",
-                    avatar=avatar_url,
+                placeholders["summary"] = st.empty()
+                stages["summary"] = submit_stage(
+                    pipeline, ("summary", result.fingerprint), generate_summary_cached,
+                    question=my_question, df_key=result.fingerprint, _df=df,
                 )
-                summary = generate_summary_cached(question=my_question, df=df)
-                if summary is not None:
-                    assistant_message_summary.text(summary)
 
             if st.session_state.get("show_followup", True):
-                assistant_message_followup = st.chat_message(
-                    "assistant",
-                    avatar=avatar_url,
-                )
-                followup_questions = generate_followup_cached(
-                    question=my_question, sql=sql, df=df
+                placeholders["followup"] = st.empty()
+                stages["followup"] = submit_stage(
+                    pipeline, ("followup", result.fingerprint), generate_followup_cached,
+                    question=my_question, sql=sql, df_key=result.fingerprint, _df=df,
                 )
-                st.session_state["df"] = None
 
-                if len(followup_questions) > 0:
-                    assistant_message_followup.text(
-                        "Here are some possible follow-up questions"
-                    )
-                    # Print the first 5 follow-up questions
-                    for i, question in enumerate(followup_questions[:5]):
-                        assistant_message_followup.button(
-                            question, on_click=set_question, args=(question,), key=f"followup_question_{i}"  # Added unique key
+            def fill_placeholder(stage, output):
+                if stage == "chart":
+                    code, fig = output
+                    placeholder_plotly_code, placeholder_chart = placeholders["chart"]
+
+                    if code is not None and code != "" and st.session_state.get("show_plotly_code", False):
+                        placeholder_plotly_code.chat_message(
+                            "assistant",
+                            avatar=avatar_url,
+                        ).code(
+                            code, language="python", line_numbers=True
+                        )
+
+                    if code is not None and code != "":
+                        if show_chart:
+                            assistant_message_chart = placeholder_chart.chat_message(
+                                "assistant",
+                                avatar=avatar_url,
+                            )
+                            if fig is not None:
+                                assistant_message_chart.plotly_chart(fig)
+                            else:
+                                assistant_message_chart.error("I couldn't generate a chart")
+
+                elif stage == "summary":
+                    summary = output
+                    if summary is not None:
+                        placeholders["summary"].chat_message(
+                            "assistant",
+                            avatar=avatar_url,
+                        ).text(summary)
+
+                elif stage == "followup":
+                    followup_questions = output
+
+                    if followup_questions:
+                        assistant_message_followup = placeholders["followup"].chat_message(
+                            "assistant",
+                            avatar=avatar_url,
+                        )
+                        assistant_message_followup.text(
+                            "Here are some possible follow-up questions"
                         )
+                        # Print the first 5 follow-up questions
+                        for i, question in enumerate(followup_questions[:5]):
+                            assistant_message_followup.button(
+                                question, on_click=set_question, args=(question,), key=f"followup_question_{i}"  # Added unique key
+                            )
+
+            labels = {"chart": "Generating chart ...", "summary": "Generating summary ...", "followup": "Generating follow-up questions ..."}
+            placeholder_stages = st.empty()
+            start = time.monotonic()
+            while stages:
+                for stage, future in list(stages.items()):
+                    if future.done():
+                        del stages[stage]
+                        try:
+                            fill_placeholder(stage, future.result())
+                        except Exception as e:
+                            print(f"{stage} failed: {e}")
+                if stages:
+                    placeholder_stages.caption(
+                        f"{', '.join(labels[stage] for stage in stages)} {time.monotonic() - start:,.0f} s"
+                    )
+                    time.sleep(0.1)
+            placeholder_stages.empty()
 
     else:
         assistant_message_error = st.chat_message(
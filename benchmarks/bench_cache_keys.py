@@ -0,0 +1,115 @@
+# benchmarks/bench_cache_keys.py
+#
+# Rerun latency of the five result-dependent stages (chart check, Plotly code, figure, summary,
+# follow-up questions) when st.cache_data hashes the DataFrame on every call, against keying them
+# on a result fingerprint computed once. Runs st.cache_data in bare mode; the stages do no work, so
+# only the cache lookups are measured.
+#
+#   python benchmarks/bench_cache_keys.py --rows 1000000 5000000
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_cache import result_fingerprint
+
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+
+@st.cache_data
+def should_generate_chart_hashed(question, sql, df):
+    return True
+
+@st.cache_data
+def generate_plotly_code_hashed(question, sql, df):
+    return "fig = px.bar(df)"
+
+@st.cache_data
+def generate_plot_hashed(code, df):
+    return None
+
+@st.cache_data
+def generate_summary_hashed(question, df):
+    return "summary"
+
+@st.cache_data
+def generate_followup_hashed(question, sql, df):
+    return ["followup"]
+
+
+@st.cache_data
+def should_generate_chart_keyed(question, sql, df_key, _df):
+    return True
+
+@st.cache_data
+def generate_plotly_code_keyed(question, sql, df_key, _df):
+    return "fig = px.bar(df)"
+
+@st.cache_data
+def generate_plot_keyed(code, df_key, _df):
+    return None
+
+@st.cache_data
+def generate_summary_keyed(question, df_key, _df):
+    return "summary"
+
+@st.cache_data
+def generate_followup_keyed(question, sql, df_key, _df):
+    return ["followup"]
+
+
+def rerun_hashed(question, sql, df):
+    should_generate_chart_hashed(question, sql, df)
+    code = generate_plotly_code_hashed(question, sql, df)
+    generate_plot_hashed(code, df)
+    generate_summary_hashed(question, df)
+    generate_followup_hashed(question, sql, df)
+
+
+def rerun_keyed(question, sql, df_key, df):
+    should_generate_chart_keyed(question, sql, df_key, df)
+    code = generate_plotly_code_keyed(question, sql, df_key, df)
+    generate_plot_keyed(code, df_key, df)
+    generate_summary_keyed(question, df_key, df)
+    generate_followup_keyed(question, sql, df_key, df)
+
+
+def timed(fn, repeat):
+    fn()  # the first call fills the caches
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 5_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    question = "What are the total sales per customer?"
+    sql = "SELECT * FROM InvoiceLine"
+    print(f"{'rows':>10} {'hash df':>10} {'fingerprint':>12}")
+    for rows in args.rows:
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({
+            "id": np.arange(rows),
+            "customer": rng.integers(0, 1000, rows),
+            "total": rng.random(rows) * 100,
+            "name": pd.Series(np.arange(rows) % 1000).astype(str).radd("customer "),
+        })
+        hashed = timed(lambda: rerun_hashed(question, sql, df), args.repeat)
+        df_key = result_fingerprint("SQLite3", sql, "version")
+        keyed = timed(lambda: rerun_keyed(question, sql, df_key, df), args.repeat)
+        print(f"{rows:>10,} {hashed * 1000:8.1f} ms {keyed * 1000:10.2f} ms")
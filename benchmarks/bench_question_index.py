@@ -0,0 +1,90 @@
+# benchmarks/bench_question_index.py
+#
+# Build time, query latency and hit rate of QuestionIndex on a synthetic set of question/SQL pairs.
+# Queries are rephrasings of indexed questions (which should hit) and unseen questions (which should miss).
+#
+#   python benchmarks/bench_question_index.py --pairs 100000 --threshold 0.8
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from question_index import QuestionIndex
+
+METRICS = ["total sales", "number of invoices", "average invoice total", "number of customers", "total tracks sold",
+           "average track length", "number of albums", "revenue", "number of employees", "total quantity"]
+DIMENSIONS = ["country", "city", "genre", "artist", "album", "media type", "sales agent", "billing state",
+              "customer", "playlist", "composer", "year", "month", "quarter", "support rep"]
+FILTERS = ["in 2009", "in 2010", "in 2011", "in 2012", "in 2013", "for rock", "for jazz", "for metal", "for latin",
+           "for the USA", "for Canada", "for Brazil", "for France", "for Germany", "above 10 dollars",
+           "below 5 dollars", "this year", "last year", "in the first quarter", "in December"]
+PREFIXES = ["What is the", "Show the", "List the", "Give me the", "Find the", "Calculate the", "Display the"]
+TOP_N = ["", "top 5 ", "top 10 ", "top 20 ", "bottom 5 "]
+
+
+def make_pairs(n, rng):
+    combos = list(itertools.product(PREFIXES, TOP_N, METRICS, DIMENSIONS, FILTERS))
+    rng.shuffle(combos)
+    pairs = []
+    for prefix, top, metric, dimension, where in combos[:n]:
+        question = f"{prefix} {top}{metric} by {dimension} {where}?"
+        pairs.append((question, f"-- {question}\nSELECT 1"))
+    return pairs
+
+
+def rephrase(question, rng):
+    question = question.rstrip("?")
+    edits = [
+        lambda q: q.lower(),
+        lambda q: q.upper(),
+        lambda q: "  ".join(q.split()),
+        lambda q: q + " please",
+        lambda q: q.replace(" by ", " per "),
+        lambda q: q + "??",
+    ]
+    for edit in rng.sample(edits, 2):
+        question = edit(question)
+    return question
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pairs", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    pairs = make_pairs(args.pairs, rng)
+
+    index = QuestionIndex(threshold=args.threshold)
+    start = time.perf_counter()
+    index.add_many([q for q, _ in pairs], [s for _, s in pairs])
+    index.build()
+    print(f"indexed {len(index)} pairs in {time.perf_counter() - start:.2f} s")
+
+    seen = rng.sample(pairs, args.queries)
+    unseen = [(f"How many {word} were {verb} by each {dimension}?", None)
+              for word, verb, dimension in zip(rng.choices(["songs", "orders", "refunds"], k=args.queries),
+                                               rng.choices(["returned", "shipped", "cancelled"], k=args.queries),
+                                               rng.choices(DIMENSIONS, k=args.queries))]
+
+    for name, queries in [("rephrased", [(rephrase(q, rng), s) for q, s in seen]), ("unseen", unseen)]:
+        latencies, hits, correct = [], 0, 0
+        for query, sql in queries:
+            start = time.perf_counter()
+            match = index.search(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if match is not None:
+                hits += 1
+                correct += match.sql == sql
+        print(
+            f"{name:<10} p50 {np.percentile(latencies, 50):6.2f} ms   p95 {np.percentile(latencies, 95):6.2f} ms   "
+            f"hit rate {hits / len(queries):6.1%}   correct {correct / len(queries):6.1%}"
+        )
@@ -0,0 +1,110 @@
+# benchmarks/bench_replica.py
+#
+# Aggregate queries on Chinook with its invoices scaled up (Invoice and InvoiceLine repeated --scale
+# times), run on SQLite against the local DuckDB replica of the same database. Each query is routed
+# the way run_sql_streaming routes it and, if routed, checked to return the same rows. The last ones
+# use what SQLite and DuckDB evaluate differently, so they have to stay on SQLite.
+#
+#   python benchmarks/bench_replica.py --scale 1000
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from replica import DuckDBReplica
+
+CHINOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Chinook.sqlite")
+
+QUERIES = {
+    "revenue by country": "SELECT BillingCountry, SUM(Total) AS revenue FROM Invoice GROUP BY BillingCountry ORDER BY revenue DESC",
+    "revenue by genre and year": (
+        "SELECT g.Name, strftime('%Y', i.InvoiceDate) AS year, SUM(il.UnitPrice * il.Quantity) AS revenue "
+        "FROM InvoiceLine il JOIN Invoice i ON i.InvoiceId = il.InvoiceId JOIN Track t ON t.TrackId = il.TrackId "
+        "JOIN Genre g ON g.GenreId = t.GenreId GROUP BY g.Name, year ORDER BY revenue DESC, g.Name, year"
+    ),
+    "top artists by tracks sold": (
+        "SELECT ar.Name, SUM(il.Quantity) AS sold FROM InvoiceLine il JOIN Track t ON t.TrackId = il.TrackId "
+        "JOIN Album al ON al.AlbumId = t.AlbumId JOIN Artist ar ON ar.ArtistId = al.ArtistId "
+        "GROUP BY ar.Name ORDER BY sold DESC, ar.Name LIMIT 10"
+    ),
+    "customers by support rep": (
+        "SELECT e.LastName, COUNT(DISTINCT c.CustomerId) AS customers, AVG(i.Total) AS average "
+        "FROM Invoice i JOIN Customer c ON c.CustomerId = i.CustomerId JOIN Employee e ON e.EmployeeId = c.SupportRepId "
+        "GROUP BY e.LastName ORDER BY e.LastName"
+    ),
+    "case-insensitive LIKE": "SELECT COUNT(*) FROM Artist WHERE Name LIKE 'the%'",
+    "integer division": "SELECT 7/2",
+    "integer division of a column": "SELECT Name, Milliseconds/1000 AS seconds FROM Track ORDER BY TrackId LIMIT 100",
+    "cast to integer": "SELECT SUM(CAST(Total AS INTEGER)) FROM Invoice",
+    "date vs number-like text": "SELECT round(SUM(Total), 2) FROM Invoice WHERE InvoiceDate > '2010'",
+}
+
+
+def create_scaled_chinook(path: str, scale: int):
+    shutil.copy(CHINOOK, path)
+    conn = sqlite3.connect(path)
+    (invoices,) = conn.execute("SELECT MAX(InvoiceId) FROM Invoice").fetchone()
+    (lines,) = conn.execute("SELECT MAX(InvoiceLineId) FROM InvoiceLine").fetchone()
+    conn.execute(f"CREATE TEMP TABLE copies AS WITH RECURSIVE n(k) AS (SELECT 1 UNION ALL SELECT k + 1 FROM n WHERE k < {scale - 1}) SELECT k FROM n")
+    conn.execute(
+        f"INSERT INTO Invoice SELECT InvoiceId + k * {invoices}, CustomerId, InvoiceDate, BillingAddress, BillingCity, "
+        "BillingState, BillingCountry, BillingPostalCode, Total FROM Invoice, copies"
+    )
+    conn.execute(
+        f"INSERT INTO InvoiceLine SELECT InvoiceLineId + k * {lines}, InvoiceId + k * {invoices}, TrackId, UnitPrice, Quantity "
+        "FROM InvoiceLine, copies"
+    )
+    conn.commit()
+    conn.close()
+
+
+def timed(run, repeat: int) -> tuple:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = run()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), rows
+
+
+def rounded(rows: list) -> list:
+    # Ties may come back in either order, and sums of floats differ in the last bits by summation order
+    return sorted(tuple(round(value, 4) if isinstance(value, float) else value for value in row) for row in rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "chinook.sqlite")
+        create_scaled_chinook(path, args.scale)
+        source = sqlite3.connect(path, check_same_thread=False)
+        (rows,) = source.execute("SELECT COUNT(*) FROM InvoiceLine").fetchone()
+        print(f"Chinook x{args.scale}: {rows:,} invoice lines")
+
+        replica = DuckDBReplica(os.path.join(tmp, "replica.duckdb"), "SQLite3")
+        tables = [(None, name) for (name,) in source.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        start = time.perf_counter()
+        replica.refresh(source, "benchmark", tables)
+        print(f"Replica refresh: {time.perf_counter() - start:.2f} s\n")
+
+        print(f"{'query':<28} {'SQLite':>9} {'replica':>9} {'speed-up':>9}")
+        for name, sql in QUERIES.items():
+            sqlite_time, sqlite_rows = timed(lambda: source.execute(sql).fetchall(), args.repeat)
+            replica_sql = replica.route(sql, "benchmark")
+            if replica_sql is None:
+                print(f"{name:<28} {sqlite_time:8.3f}s {'not routed':>9}")
+                continue
+            with replica.pool.connection() as conn:
+                replica_time, replica_rows = timed(lambda: conn.execute(replica_sql).fetchall(), args.repeat)
+            assert rounded(sqlite_rows) == rounded(replica_rows), name
+            print(f"{name:<28} {sqlite_time:8.3f}s {replica_time:8.3f}s {sqlite_time / replica_time:8.1f}x")
@@ -0,0 +1,102 @@
+# benchmarks/bench_result_arrow.py
+#
+# Row tuples -> pd.DataFrame (fetchall) against the Arrow result path (iter_arrow_chunks + arrow_to_pandas)
+# on a wide result, for DuckDB (native record batches) and SQLite (fetchmany + column-wise conversion).
+# Every run happens in a fresh process so peak RSS is measured per path.
+#
+#   python benchmarks/bench_result_arrow.py --rows 1000000
+import argparse
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUERY = "SELECT * FROM facts"
+
+
+def create_databases(directory, rows):
+    import duckdb
+
+    duckdb_path = os.path.join(directory, "facts.duckdb")
+    sqlite_path = os.path.join(directory, "facts.sqlite")
+
+    conn = duckdb.connect(duckdb_path)
+    conn.execute(
+        f"""
+        CREATE TABLE facts AS
+        SELECT
+            range AS id,
+            range % 1000 AS customer_id,
+            range % 97 AS product_id,
+            (range % 10) + 1 AS quantity,
+            round(random() * 100, 2) AS unit_price,
+            round(random() * 1000, 2) AS total,
+            'customer ' || (range % 1000) AS customer_name,
+            'product ' || (range % 97) AS product_name,
+            DATE '2020-01-01' + CAST(range % 1500 AS INTEGER) AS invoice_date,
+            random() < 0.5 AS paid
+        FROM range({rows})
+        """
+    )
+
+    lite = sqlite3.connect(sqlite_path)
+    cursor = conn.execute("SELECT * REPLACE (CAST(invoice_date AS VARCHAR) AS invoice_date) FROM facts")
+    columns = [column[0] for column in cursor.description]
+    lite.execute(f"CREATE TABLE facts ({', '.join(columns)})")
+    while rows := cursor.fetchmany(100000):
+        lite.executemany(f"INSERT INTO facts VALUES ({', '.join('?' * len(columns))})", rows)
+    lite.commit()
+    lite.close()
+    conn.close()
+    return {"DuckDB": duckdb_path, "SQLite3": sqlite_path}
+
+
+def run(db_type, path, mode):
+    import duckdb
+
+    from result_stream import StreamingResult, iter_arrow_chunks
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    conn = duckdb.connect(path, read_only=True) if db_type == "DuckDB" else sqlite3.connect(path, check_same_thread=False)
+    start = time.perf_counter()
+
+    cursor = conn.cursor()
+    cursor.execute(QUERY)
+    if mode == "rows":
+        import pandas as pd
+        columns = [column[0] for column in cursor.description]
+        df = pd.DataFrame(cursor.fetchall(), columns=columns)
+    else:
+        result = StreamingResult(iter_arrow_chunks(cursor, db_type, 100000), max_rows=10**9, max_bytes=2**40)
+        df = result.result()
+
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    print(f"{len(df)} {elapsed} {peak}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--run", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(*args.run)
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = create_databases(tmp, args.rows)
+        print(f"{'database':<8} {'path':<6} {'rows/s':>12} {'seconds':>8} {'peak RSS':>10}")
+        for db_type, path in paths.items():
+            for mode in ("rows", "arrow"):
+                output = subprocess.run(
+                    [sys.executable, __file__, "--run", db_type, path, mode], capture_output=True, text=True, check=True
+                ).stdout.split()
+                rows, elapsed, peak = int(output[0]), float(output[1]), int(output[2])
+                print(f"{db_type:<8} {mode:<6} {rows / elapsed:12,.0f} {elapsed:8.2f} {peak / 1024:8.0f} MB")
@@ -0,0 +1,78 @@
+# benchmarks/bench_result_spill.py
+#
+# Resident memory with one large result held per concurrent session, keeping every result in memory
+# against spilling it to a ResultStore and keeping only the handle. Each session reads one page of
+# its result, as the table does, and keeps the DataFrame the chart, summary and follow-up stages get
+# (the whole result in memory, the first --stage-rows rows of a spilled one). Every mode runs in a
+# fresh process.
+#
+#   python benchmarks/bench_result_spill.py --sessions 50 --rows 200000 --stage-rows 10000
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import duckdb
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_store import ResultStore
+from result_stream import StreamingResult, iter_arrow_chunks
+
+
+def current_rss() -> int:
+    # Pages actually resident now, unlike ru_maxrss, which only ever grows
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def run(mode: str, sessions: int, rows: int, stage_rows: int, directory: str):
+    store = ResultStore(directory, spill_bytes=0, janitor_interval=None) if mode == "spill" else None
+    conn = duckdb.connect()
+    baseline = current_rss()
+    start = time.perf_counter()
+
+    handles = []
+    for session in range(sessions):
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT range AS id, range * {session + 1} AS amount, 'customer ' || (range % 5000) AS customer, "
+            f"range * 0.01 AS price FROM range({rows})"
+        )
+        result = StreamingResult(iter_arrow_chunks(cursor, "DuckDB"), store=store)
+        result.wait()
+        result.page(rows // 2, 20)
+        # What a session keeps between reruns, and what its downstream stages hold on to
+        handles.append((result, result.frame(max_rows=stage_rows)) if mode == "spill" else result.result())
+
+    elapsed = time.perf_counter() - start
+    print(f"{elapsed} {current_rss() - baseline} {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--stage-rows", type=int, default=10_000)
+    parser.add_argument("--run", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run[0], args.sessions, args.rows, args.stage_rows, args.run[1])
+        sys.exit()
+
+    print(f"{'mode':<7} {'sessions':>8} {'seconds':>8} {'RSS held':>10} {'peak RSS':>10}")
+    for mode in ("memory", "spill"):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = subprocess.run(
+                [
+                    sys.executable, __file__, "--sessions", str(args.sessions), "--rows", str(args.rows),
+                    "--stage-rows", str(args.stage_rows), "--run", mode, tmp,
+                ],
+                capture_output=True, text=True, check=True,
+            ).stdout.split()
+        elapsed, held, peak = float(output[0]), int(output[1]), int(output[2])
+        print(f"{mode:<7} {args.sessions:>8} {elapsed:8.2f} {held / 2**20:7.0f} MB {peak / 2**20:7.0f} MB")
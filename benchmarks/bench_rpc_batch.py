@@ -0,0 +1,50 @@
+# benchmarks/bench_rpc_batch.py
+#
+# Bulk add_sql calls sent one by one, as JSON-RPC batches, and through the parallel
+# fallback used when the endpoint rejects batches. Every mode must return its
+# responses in request order.
+#
+#   python benchmarks/bench_rpc_batch.py --calls 500 --delay 0.005
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from remote import VannaDefault
+from stub_rpc_server import StubRPCServer
+from vanna.types import QuestionSQLPair
+
+
+class EchoStub(StubRPCServer):
+    # Echo the question back as the id so the caller can check ordering
+    def handle(self, request):
+        response = StubRPCServer.handle(self, request)
+        if request.get("method") == "add_sql":
+            response = {"result": dict(response["result"], id=request["params"][0]["question"])}
+        return response
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--delay", type=float, default=0.005, help="Simulated server time per method, in seconds")
+    args = parser.parse_args()
+
+    calls = [("add_sql", [QuestionSQLPair(question=f"q{i}", sql="SELECT 1", tag="bench")]) for i in range(args.calls)]
+    expected = [f"q{i}" for i in range(args.calls)]
+
+    for name, batch in [("sequential", None), ("batched", True), ("fallback", False)]:
+        with EchoStub(delay=lambda method: args.delay, batch=bool(batch)) as server:
+            vn = VannaDefault(model="chinook", api_key="bench", config={"endpoint": server.endpoint})
+
+            start = time.perf_counter()
+            if batch is None:
+                results = [vn._rpc_call(method=method, params=params) for method, params in calls]
+            else:
+                results = vn.rpc_batch_call(calls)
+            elapsed = time.perf_counter() - start
+
+            in_order = [d["result"]["id"] for d in results] == expected
+            print(f"{name:<12} {elapsed:7.3f} s   {server.calls:5d} server calls   in order: {in_order}")
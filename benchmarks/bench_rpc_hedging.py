@@ -0,0 +1,61 @@
+# benchmarks/bench_rpc_hedging.py
+#
+# Tail latency of generate_sql_from_question with and without hedged requests, against a stub
+# that answers most calls quickly but stalls on a small fraction of them. Also shows the circuit
+# breaker answering from cache once the endpoint goes away.
+#
+#   python benchmarks/bench_rpc_hedging.py --calls 500 --slow-rate 0.03
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from remote import VannaDefault
+from rpc_resilience import CircuitBreaker, ResilientRPC
+from stub_rpc_server import StubRPCServer
+
+
+def run(vn, calls):
+    latencies = []
+    for i in range(calls):
+        start = time.perf_counter()
+        vn.generate_sql(question=f"question {i % 50}")
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--fast", type=float, default=0.01, help="Typical server time, in seconds")
+    parser.add_argument("--slow", type=float, default=0.5, help="Server time of a stalled call, in seconds")
+    parser.add_argument("--slow-rate", type=float, default=0.03)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+
+    def delay(method):
+        return args.slow if rng.random() < args.slow_rate else args.fast * rng.uniform(0.8, 1.2)
+
+    with StubRPCServer(delay=delay) as server:
+        for hedge in (False, True):
+            resilience = ResilientRPC(hedge=hedge)
+            vn = VannaDefault(model="chinook", api_key="bench", config={"endpoint": server.endpoint, "resilience": resilience})
+            run(vn, 50)  # warm up the latency percentiles
+            latencies = run(vn, args.calls)
+            print(
+                f"hedge={str(hedge):<5}  p50 {np.percentile(latencies, 50):7.1f} ms   p95 {np.percentile(latencies, 95):7.1f} ms   "
+                f"p99 {np.percentile(latencies, 99):7.1f} ms   server calls {server.calls}"
+            )
+            server.calls = 0
+
+    # The server is gone: after a few failures the breaker opens and answers come from the last good responses
+    resilience.max_attempts = 1
+    resilience.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    served = [vn.generate_sql(question=f"question {i % 50}") for i in range(10)]
+    print(f"endpoint down: breaker {resilience.breaker.state}, {sum(sql is not None for sql in served)}/10 answers served from cache")
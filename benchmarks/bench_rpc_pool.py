@@ -0,0 +1,48 @@
+# benchmarks/bench_rpc_pool.py
+#
+# Per-call latency of VannaDefault._rpc_call with and without the pooled keep-alive transport.
+#
+#   python benchmarks/bench_rpc_pool.py --calls 500
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from remote import VannaDefault
+from rpc_transport import PooledTransport, UnpooledTransport
+from stub_rpc_server import StubRPCServer
+from vanna.types import Question
+
+
+def time_calls(vn, calls):
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        vn._rpc_call(method="generate_sql_from_question", params=[Question(question="How many customers are there?")])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<12} mean {statistics.mean(latencies):7.3f} ms   p50 {statistics.median(latencies):7.3f} ms   p95 {p95:7.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--gzip", action="store_true", help="Gzip request bodies")
+    args = parser.parse_args()
+
+    with StubRPCServer() as server:
+        for name, transport in [
+            ("unpooled", UnpooledTransport(gzip_requests=args.gzip)),
+            ("pooled", PooledTransport(gzip_requests=args.gzip)),
+        ]:
+            vn = VannaDefault(model="chinook", api_key="bench", config={"endpoint": server.endpoint, "transport": transport})
+            time_calls(vn, 10)  # warm up
+            report(name, time_calls(vn, args.calls))
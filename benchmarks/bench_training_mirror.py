@@ -0,0 +1,66 @@
+# benchmarks/bench_training_mirror.py
+#
+# Full refresh of get_training_data (download + pd.read_json on every call) against the local
+# training data mirror: first sync, incremental sync after a small change, and local lookups.
+#
+#   python benchmarks/bench_training_mirror.py --entries 50000 --changed 0.01
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from remote import VannaDefault
+from stub_rpc_server import StubRPCServer
+from training_mirror import TrainingDataMirror
+
+
+def training_data(entries, version=0, changed=0.0):
+    n_changed = int(entries * changed)
+    rows = []
+    for i in range(entries):
+        kind = ("sql", "ddl", "documentation")[i % 3]
+        suffix = f" -- v{version}" if version and i < n_changed else ""
+        rows.append({
+            "id": f"{i}-{kind}",
+            "question": f"How many rows are in table {i}?" if kind == "sql" else None,
+            "content": (f"SELECT COUNT(*) FROM table_{i}" if kind == "sql" else f"CREATE TABLE table_{i} (id INT, name VARCHAR(255), amount DECIMAL)") + suffix,
+            "training_data_type": kind,
+        })
+    return {"data": pd.DataFrame(rows).to_json()}
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"{label:<28} {time.perf_counter() - start:8.3f} s")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=50000)
+    parser.add_argument("--changed", type=float, default=0.01)
+    args = parser.parse_args()
+
+    results = {"get_training_data": training_data(args.entries)}
+
+    with StubRPCServer(results=results) as server, tempfile.TemporaryDirectory() as tmp:
+        plain = VannaDefault(model="chinook", api_key="bench", config={"endpoint": server.endpoint})
+        timed("full refresh (read_json)", plain.get_training_data)
+
+        mirror = TrainingDataMirror(os.path.join(tmp, "mirror.sqlite"), max_age=0)
+        vn = VannaDefault(model="chinook", api_key="bench", config={"endpoint": server.endpoint, "training_mirror": mirror})
+        timed("mirror: first sync", vn.get_training_data)
+
+        results["get_training_data"].update(training_data(args.entries, version=1, changed=args.changed))
+        timed(f"mirror: sync, {args.changed:.0%} changed", vn.get_training_data)
+        timed("mirror: sync, no change", vn.get_training_data)
+
+        mirror.max_age = 3600
+        ddl = timed("mirror: local lookup (ddl)", lambda: vn.get_training_data(training_data_type="ddl"))
+        print(f"{len(ddl)} ddl entries")
@@ -0,0 +1,116 @@
+# benchmarks/stub_rpc_server.py
+#
+# A local stand-in for https://ask.vanna.ai/rpc used by the benchmarks in this folder.
+# It speaks the same {"method": ..., "params": [...]} protocol and answers with canned results.
+import gzip
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_RESULTS = {
+    "generate_sql_from_question": {"raw_answer": "", "prefix": "", "postfix": "", "sql": "SELECT 1"},
+    "generate_plotly_code": {"plotly_code": "fig = px.bar(df)"},
+    "generate_followup_questions": {"questions": ["What about last year?"]},
+    "generate_questions": {"questions": ["How many customers are there?"]},
+    "generate_question": {"question": "How many customers are there?"},
+    "add_ddl": {"success": True, "message": "", "id": "1-ddl"},
+    "add_documentation": {"success": True, "message": "", "id": "1-doc"},
+    "add_sql": {"success": True, "message": "", "id": "1-sql"},
+    "remove_training_data": {"success": True, "message": ""},
+    "get_training_data": {"data": "[]"},
+}
+
+
+class StubRPCServer:
+    """
+    Runs a threaded HTTP/1.1 JSON-RPC stub on localhost in a background thread.
+
+    Args:
+        delay (callable): Optional `delay(method) -> seconds` used to simulate server latency.
+        results (dict): Overrides for the canned method results.
+        batch (bool): Accept JSON-RPC batch requests; otherwise they are rejected with a 400.
+    """
+
+    def __init__(self, delay=None, results=None, batch=True):
+        self.delay = delay
+        self.batch = batch
+        self.results = dict(CANNED_RESULTS)
+        if results is not None:
+            self.results.update(results)
+        self.calls = 0
+        self._connections = set()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                # Avoid Nagle/delayed-ACK stalls on reused keep-alive connections
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                stub._connections.add(self.connection)
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+
+                request = json.loads(body)
+                status = 200
+
+                if isinstance(request, list):
+                    if stub.batch:
+                        response = [dict(stub.handle(item), id=item.get("id")) for item in reversed(request)]
+                    else:
+                        status, response = 400, {"error": "Batch requests are not supported"}
+                else:
+                    response = stub.handle(request)
+
+                response = json.dumps(response).encode("utf-8")
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/rpc"
+
+    def handle(self, request):
+        self.calls += 1
+        method = request.get("method")
+
+        if self.delay is not None:
+            time.sleep(self.delay(method))
+
+        if method not in self.results:
+            return {"error": f"Unknown method {method}"}
+
+        return {"result": self.results[method]}
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        # Drop kept-alive connections too, so clients really see the server go away
+        for connection in list(self._connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
@@ -5,9 +5,10 @@ import psycopg2
 import sqlite3
 import duckdb
 
-# Function to connect to Snowflake
-def connect_to_snowflake():
-    conn = snowflake.connector.connect(
+from db_pool import ConnectionPool
+
+def open_snowflake():
+    return snowflake.connector.connect(
         user=st.secrets["SNOWFLAKE_USER"],
         password=st.secrets["SNOWFLAKE_PASSWORD"],
         account=st.secrets["SNOWFLAKE_ACCOUNT"],
@@ -16,12 +17,9 @@ def connect_to_snowflake():
         role=st.secrets["SNOWFLAKE_ROLE"],
         schema=st.secrets["SNOWFLAKE_SCHEMA"]
     )
-    st.write("Connected to Snowflake")
-    return conn
 
-# Function to connect to Redshift
-def connect_to_redshift():
-    conn = psycopg2.connect(
+def open_redshift():
+    return psycopg2.connect(
         dbname=st.secrets["REDSHIFT_DBNAME"],
         user=st.secrets["REDSHIFT_USER"],
         password=st.secrets["REDSHIFT_PASSWORD"],
@@ -29,6 +27,23 @@ def connect_to_redshift():
         port=st.secrets["REDSHIFT_PORT"]
     )
 
+def open_sqlite():
+    # Pooled connections are handed to whichever thread acquires them
+    return sqlite3.connect(st.secrets["SQLITE3_DB_PATH"], check_same_thread=False)
+
+def open_duckdb():
+    return duckdb.connect(database=st.secrets["DUCKDB_DB_PATH"])
+
+# Function to connect to Snowflake
+def connect_to_snowflake():
+    conn = open_snowflake()
+    st.write("Connected to Snowflake")
+    return conn
+
+# Function to connect to Redshift
+def connect_to_redshift():
+    conn = open_redshift()
+
     st.write("Connected to Redshift")
     return conn
 
@@ -40,7 +55,7 @@ def connect_to_sqlite():
 
 # Function to connect to DuckDB
 def connect_to_duckdb():
-    conn = duckdb.connect(database=st.secrets["DUCKDB_DB_PATH"])
+    conn = open_duckdb()
     st.write("Connected to DuckDB")
     return conn
 
@@ -58,3 +73,61 @@ def connect_to_db(db_type):
         st.write("Unsupported database type")
         return None
 
+def query_timeout():
+    # Seconds a query may run before it is cancelled
+    return float(st.secrets.get("QUERY_TIMEOUT", 300))
+
+# Session setup run once per pooled connection. The server-side statement timeout backs up the
+# app's own cancellation, in case the app goes away while a query is running.
+def init_snowflake_session(conn):
+    cursor = conn.cursor()
+    cursor.execute(f"USE ROLE {st.secrets['SNOWFLAKE_ROLE']}")
+    cursor.execute(f"USE DATABASE {st.secrets['SNOWFLAKE_DATABASE']}")
+    cursor.execute(f"USE SCHEMA {st.secrets['SNOWFLAKE_SCHEMA']}")
+    cursor.execute(f"ALTER SESSION SET STATEMENT_TIMEOUT_IN_SECONDS = {int(query_timeout())}")
+
+def init_redshift_session(conn):
+    # Autocommit keeps the search_path for the life of the connection and stops a failed
+    # query from leaving an aborted transaction behind for the next user
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute(f"SET search_path TO {st.secrets['REDSHIFT_SCHEMA']};")
+    cursor.execute(f"SET statement_timeout TO {int(query_timeout() * 1000)};")
+
+def reset_sqlite_session(conn):
+    conn.rollback()
+
+@st.cache_resource
+def duckdb_base_connection():
+    # DuckDB opens a database file once per process; pooled connections are cursors on it
+    return open_duckdb()
+
+@st.cache_resource
+def get_connection_pool(db_type):
+    """
+    One connection pool per database type, shared by every session.
+    """
+    min_size = int(st.secrets.get("DB_POOL_MIN_SIZE", 1))
+    max_size = int(st.secrets.get("DB_POOL_MAX_SIZE", 4))
+    max_idle = float(st.secrets.get("DB_POOL_MAX_IDLE", 600))
+
+    if db_type == "Snowflake":
+        return ConnectionPool(open_snowflake, min_size, max_size, max_idle, init_session=init_snowflake_session)
+    elif db_type == "Redshift":
+        return ConnectionPool(open_redshift, min_size, max_size, max_idle, init_session=init_redshift_session)
+    elif db_type == "SQLite3":
+        return ConnectionPool(open_sqlite, min_size, max_size, max_idle, reset_session=reset_sqlite_session)
+    elif db_type == "DuckDB":
+        return ConnectionPool(lambda: duckdb_base_connection().cursor(), min_size, max_size, max_idle)
+    else:
+        raise ValueError(f"Unsupported database type: {db_type}")
+
+def pooled_connection(db_type):
+    """
+    **Example:**
+    ```python
+    with pooled_connection("Snowflake") as conn:
+        conn.cursor().execute(sql)
+    ```
+    """
+    return get_connection_pool(db_type).connection()
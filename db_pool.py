@@ -0,0 +1,163 @@
+# db_pool.py
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of database connections for one database.
+
+    Connections are opened with `connect()` and passed through `init_session(conn)` once, so per-session
+    setup such as `USE ROLE` or `SET search_path` isn't repeated for every query. A connection that has
+    been idle for longer than `health_check_after` seconds is checked with `health_check_sql` before it
+    is handed out, and connections idle for longer than `max_idle` are closed, down to `min_size`.
+
+    **Example:**
+    ```python
+    pool = ConnectionPool(connect_to_sqlite, min_size=1, max_size=4)
+    with pool.connection() as conn:
+        conn.cursor().execute("SELECT 1")
+    ```
+
+    Args:
+        connect (callable): Opens a new connection.
+        min_size (int): Connections opened up front and kept open while idle.
+        max_size (int): Maximum number of open connections; further callers wait for one to be released.
+        max_idle (float): Seconds after which an idle connection above `min_size` is closed.
+        health_check_after (float): Idle seconds after which a connection is checked before reuse.
+        health_check_sql (str): Query used to check a connection.
+        init_session (callable): Called with each new connection before it is first used.
+        reset_session (callable): Called with each connection as it is released, e.g. to roll back an open transaction.
+        acquire_timeout (float): Seconds to wait for a free connection before raising.
+    """
+
+    def __init__(
+        self,
+        connect,
+        min_size: int = 1,
+        max_size: int = 4,
+        max_idle: float = 600,
+        health_check_after: float = 30,
+        health_check_sql: str = "SELECT 1",
+        init_session=None,
+        reset_session=None,
+        acquire_timeout: float = 30,
+    ):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.health_check_after = health_check_after
+        self.health_check_sql = health_check_sql
+        self.init_session = init_session
+        self.reset_session = reset_session
+        self.acquire_timeout = acquire_timeout
+
+        self._lock = threading.Condition()
+        self._idle = []  # (connection, released_at), most recently released last
+        self._size = 0
+
+        for _ in range(min_size):
+            self._idle.append((self._open(), time.monotonic()))
+            self._size += 1
+
+    def _open(self):
+        conn = self._connect()
+        if self.init_session is not None:
+            try:
+                self.init_session(conn)
+            except Exception:
+                conn.close()
+                raise
+        return conn
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception as e:
+            print(f"Error closing pooled connection: {e}")
+
+    def _is_healthy(self, conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.health_check_sql)
+            cursor.fetchall()
+            return True
+        except Exception as e:
+            print(f"Discarding unhealthy pooled connection: {e}")
+            return False
+
+    def _evict_idle(self, now):
+        # Caller holds the lock. Oldest connections are at the front of the idle list.
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.pop(0)
+            self._size -= 1
+            self._close(conn)
+
+    def acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._evict_idle(now)
+
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                    conn, released_at = None, None
+                else:
+                    if not self._lock.wait(timeout=deadline - now) and time.monotonic() >= deadline:
+                        raise TimeoutError(f"No pooled connection became available within {self.acquire_timeout} s")
+                    continue
+
+            # Opening and health checks happen outside the lock, so they don't block other callers
+            try:
+                if conn is None:
+                    return self._open()
+                if now - released_at <= self.health_check_after or self._is_healthy(conn):
+                    return conn
+                self._close(conn)
+                return self._open()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                    self._lock.notify()
+                raise
+
+    def release(self, conn, discard: bool = False):
+        if not discard and self.reset_session is not None:
+            try:
+                self.reset_session(conn)
+            except Exception as e:
+                print(f"Discarding pooled connection that could not be reset: {e}")
+                discard = True
+
+        with self._lock:
+            if discard:
+                self._size -= 1
+                self._close(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"open": self._size, "idle": len(self._idle), "in_use": self._size - len(self._idle)}
+
+    def close(self):
+        with self._lock:
+            for conn, _ in self._idle:
+                self._close(conn)
+            self._size -= len(self._idle)
+            self._idle = []
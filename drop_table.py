@@ -27,6 +27,13 @@ SNOWFLAKE_DATABASE = os.getenv("SNOWFLAKE_DATABASE")
 SNOWFLAKE_SCHEMA = os.getenv("SNOWFLAKE_SCHEMA")
 SNOWFLAKE_ROLE = os.getenv("SNOWFLAKE_ROLE")
 
+def list_tables(sqlite_path=SQLITE3_DB_PATH):
+    # The SQLite3 database is the source of truth for the tables copied to Redshift and Snowflake
+    sqlite_conn = sqlite3.connect(sqlite_path)
+    tables = pd.read_sql_query("SELECT name FROM sqlite_master WHERE type='table';", sqlite_conn)
+    sqlite_conn.close()
+    return tables['name'].tolist()
+
 def drop_tables_redshift(tables):
     # Create engine for Redshift
     redshift_engine = create_engine(f'postgresql://{REDSHIFT_USER}:{REDSHIFT_PASSWORD}@{REDSHIFT_HOST}:{REDSHIFT_PORT}/{REDSHIFT_DBNAME}')
@@ -46,12 +53,8 @@ def drop_tables_snowflake(tables):
             conn.execute(f"DROP TABLE IF EXISTS {table};")
 
 if __name__ == "__main__":
-    # Connect to SQLite3
-    sqlite_conn = sqlite3.connect(SQLITE3_DB_PATH)
-    
     # Get list of tables from SQLite3 database
-    tables = pd.read_sql_query("SELECT name FROM sqlite_master WHERE type='table';", sqlite_conn)
-    table_names = tables['name'].tolist()
+    table_names = list_tables()
     
     # Drop tables in Redshift
     drop_tables_redshift(table_names)
@@ -60,7 +63,4 @@ if __name__ == "__main__":
     # Drop tables in Snowflake
     drop_tables_snowflake(table_names)
     print("Tables dropped in Snowflake.")
-    
-    # Close SQLite3 connection
-    sqlite_conn.close()
 
@@ -0,0 +1,178 @@
+# pipeline.py
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def _size(value) -> int:
+    # Rough bytes a stage's output keeps alive: results and DataFrames report their own, a chart is
+    # sized by its data
+    if hasattr(value, "resident_bytes"):
+        return value.resident_bytes
+    if hasattr(value, "memory_usage"):
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, "to_plotly_json"):
+        return _size(value.to_plotly_json())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_size(key) + _size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class Pipeline:
+    """
+    The stages answering one question (SQL, query, chart, summary, follow-up questions, ...), each
+    running as a future on a shared worker pool.
+
+    A stage is submitted once under its key. Script reruns that submit the same key get the same
+    future back, whether it is still running or has finished, so a rerun triggered by a widget picks up
+    the work where it is instead of starting it again. Failed stages are run again. Stages submitted
+    with `reuse=False` are forgotten as soon as they finish, so their output is only kept by whoever
+    else holds it (the query stage's result by the result cache), and run again when submitted next.
+
+    **Example:**
+    ```python
+    pipeline = pipelines.get((session_id, "SQLite3", question), session=session_id)
+    sql = pipeline.submit("sql", generate_sql, question)
+    while not sql.done():
+        placeholder.caption("Generating SQL ...")
+        time.sleep(0.1)
+    ```
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor):
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._stages = {}  # key -> (future, submitted at)
+        self._sizes = {}  # key -> bytes of the output of a finished stage
+        self.last_used = time.monotonic()
+
+    def submit(self, key, fn, *args, reuse: bool = True, **kwargs):
+        """
+        Returns:
+            concurrent.futures.Future: The future of the stage under `key`, submitted now unless an
+            earlier one can be reused.
+        """
+        with self._lock:
+            self.last_used = time.monotonic()
+            stage = self._stages.get(key)
+            if stage is not None:
+                future = stage[0]
+                if not future.done() or (reuse and not future.cancelled() and future.exception() is None):
+                    return future
+            future = self._executor.submit(fn, *args, **kwargs)
+            self._stages[key] = (future, time.monotonic())
+            self._sizes.pop(key, None)
+        future.add_done_callback(lambda future: self._finished(key, future, reuse))
+        return future
+
+    def _finished(self, key, future, reuse: bool):
+        size = 0
+        if reuse and not future.cancelled() and future.exception() is None:
+            try:
+                size = _size(future.result())
+            except Exception:
+                pass
+        with self._lock:
+            stage = self._stages.get(key)
+            if stage is None or stage[0] is not future:
+                return
+            if reuse:
+                self._sizes[key] = size
+            else:
+                del self._stages[key]
+
+    def get(self, key):
+        with self._lock:
+            stage = self._stages.get(key)
+        return stage[0] if stage is not None else None
+
+    @property
+    def running(self) -> bool:
+        with self._lock:
+            return any(not future.done() for future, _ in self._stages.values())
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def stages(self) -> dict:
+        with self._lock:
+            return {key: future.done() for key, (future, _) in self._stages.items()}
+
+
+class PipelineRegistry:
+    """
+    The pipelines of recent questions, sharing one worker pool. The least recently used pipelines are
+    dropped, as long as none of their stages is running, once the outputs of their finished stages
+    take more than `max_bytes`, and once their session has more than `max_per_session` of them.
+
+    Pipelines are keyed by whoever asks; keying them by session as well as by question keeps one
+    session's stages, and their cancellation, apart from another's.
+
+    Args:
+        max_workers (int): Stages that run at the same time, across all pipelines.
+        max_bytes (int): Total size of the kept stage outputs.
+        max_per_session (int): Pipelines kept per session.
+    """
+
+    def __init__(self, max_workers: int = 8, max_bytes: int = 64 * 1024 * 1024, max_per_session: int = 16):
+        self.max_bytes = max_bytes
+        self.max_per_session = max_per_session
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline")
+        self._lock = threading.Lock()
+        self._pipelines = OrderedDict()  # key -> Pipeline, least recently used first
+        self._sessions = {}  # key -> session the pipeline belongs to
+
+    def get(self, key, session=None) -> Pipeline:
+        """
+        Returns:
+            Pipeline: The pipeline under `key`, created for `session` unless there is one already.
+        """
+        with self._lock:
+            pipeline = self._pipelines.get(key)
+            if pipeline is None:
+                pipeline = self._pipelines[key] = Pipeline(self._executor)
+                self._sessions[key] = session
+            self._pipelines.move_to_end(key)
+            self._evict(session)
+            return pipeline
+
+    def _drop(self, key):
+        del self._pipelines[key]
+        del self._sessions[key]
+
+    def _evict(self, session):
+        # Caller holds the lock. The pipeline just asked for, the last one, is always kept.
+        if session is not None:
+            own = [key for key in list(self._pipelines)[:-1] if self._sessions[key] == session]
+            for key in own[: max(0, len(own) + 1 - self.max_per_session)]:
+                if not self._pipelines[key].running:
+                    self._drop(key)
+
+        # Stages finish in the background, so sizes are re-read every time
+        sizes = {key: pipeline.nbytes for key, pipeline in self._pipelines.items()}
+        total = sum(sizes.values())
+        for key in list(self._pipelines)[:-1]:
+            if total <= self.max_bytes:
+                break
+            if not self._pipelines[key].running:
+                self._drop(key)
+                total -= sizes[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            pipelines = list(self._pipelines.values())
+        return {
+            "pipelines": len(pipelines),
+            "running": sum(1 for pipeline in pipelines if pipeline.running),
+            "bytes": sum(pipeline.nbytes for pipeline in pipelines),
+        }
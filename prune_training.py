@@ -0,0 +1,113 @@
+# prune_training.py
+#
+# Remove stale training data in bulk, e.g. after a schema migration.
+#
+#   python prune_training.py --ids 1-ddl 2-sql
+#   python prune_training.py --tables Invoice InvoiceLine --type sql --dry-run
+#   python prune_training.py --dropped-tables
+import argparse
+import re
+
+import pandas as pd
+
+
+def references_tables(tables):
+    """
+    Predicate matching training entries whose question or content mentions any of `tables`
+    as a whole identifier, optionally schema-qualified or quoted. Matching is case-insensitive.
+    """
+    names = sorted({table.split(".")[-1] for table in tables}, key=len, reverse=True)
+    if not names:
+        return lambda row: False
+
+    pattern = re.compile(r"(?<![\w$])[\"`\[]?(?:" + "|".join(re.escape(name) for name in names) + r")[\"`\]]?(?![\w$])", re.IGNORECASE)
+
+    def predicate(row) -> bool:
+        return any(isinstance(text, str) and pattern.search(text) for text in (row["question"], row["content"]))
+
+    return predicate
+
+
+def select_training_ids(training_data: pd.DataFrame, predicate=None, training_data_type: str = None) -> list:
+    """
+    Returns:
+        list: The ids of the training entries of the given type that satisfy `predicate`.
+    """
+    if training_data is None or len(training_data) == 0:
+        return []
+    if training_data_type is not None:
+        training_data = training_data[training_data["training_data_type"] == training_data_type]
+    if predicate is not None:
+        training_data = training_data[training_data.apply(predicate, axis=1)]
+    return training_data["id"].tolist()
+
+
+def prune_training_data(vn, ids=None, predicate=None, training_data_type: str = None, dry_run: bool = False, max_workers: int = 8) -> pd.DataFrame:
+    """
+    Remove training data by id, by predicate, or both.
+
+    **Example:**
+    ```python
+    report = prune_training_data(vn, predicate=references_tables(["Invoice"]), training_data_type="sql")
+    ```
+
+    Args:
+        vn (VannaDefault): The model to prune.
+        ids (Iterable[str]): Ids to remove.
+        predicate (callable): `predicate(row) -> bool` selecting further entries from `vn.get_training_data()`.
+        training_data_type (str): Only select entries of this type with `predicate`.
+        dry_run (bool): Report what would be removed without removing anything.
+        max_workers (int): Maximum number of concurrent removal requests.
+
+    Returns:
+        pd.DataFrame: One row per id with its `status` ("removed", "error" or "selected" on a dry run) and `error`.
+    """
+    selected = list(ids or [])
+    if predicate is not None or training_data_type is not None:
+        selected += select_training_ids(vn.get_training_data(), predicate, training_data_type)
+    selected = list(dict.fromkeys(selected))
+
+    if dry_run or not selected:
+        return pd.DataFrame({"id": selected, "status": "selected", "error": None}, columns=["id", "status", "error"])
+
+    return vn.remove_training_data_bulk(selected, max_workers=max_workers)
+
+
+if __name__ == "__main__":
+    import streamlit as st
+    from remote import VannaDefault
+
+    parser = argparse.ArgumentParser(description="Remove training data from the Vanna model in bulk")
+    parser.add_argument("--ids", nargs="*", default=[], help="Training data ids to remove")
+    parser.add_argument("--tables", nargs="*", default=[], help="Remove entries that reference these tables")
+    parser.add_argument("--dropped-tables", action="store_true", help="Remove entries that reference the tables drop_table.py drops")
+    parser.add_argument("--type", choices=["sql", "ddl", "documentation"], help="Only select entries of this type")
+    parser.add_argument("--model", default="chinook")
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    tables = list(args.tables)
+    if args.dropped_tables:
+        from drop_table import list_tables
+        tables += list_tables()
+
+    if not args.ids and not tables and args.type is None:
+        parser.error("nothing to prune: pass --ids, --tables, --dropped-tables or --type")
+
+    vn = VannaDefault(api_key=st.secrets.get("VANNA_API_KEY"), model=args.model)
+    report = prune_training_data(
+        vn,
+        ids=args.ids,
+        predicate=references_tables(tables) if tables else None,
+        training_data_type=args.type,
+        dry_run=args.dry_run,
+        max_workers=args.max_workers,
+    )
+
+    for status, count in report["status"].value_counts().items():
+        print(f"{status}: {count}")
+    for row in report[report["status"] == "error"].itertuples():
+        print(f"  {row.id}: {row.error}")
+    if args.dry_run:
+        print("\n".join(report["id"]))
@@ -0,0 +1,191 @@
+# query_control.py
+import threading
+import time
+from collections import defaultdict, deque
+
+
+class QueryCancelled(Exception):
+    pass
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class RunningQuery:
+    """
+    A query running on one connection, which can be cancelled from another thread and is cancelled
+    automatically once it has run for `timeout` seconds.
+
+    Cancelling stops the query on the server, not only the wait for it:
+
+    - Snowflake: the query is submitted with `execute_async` and cancelled with `SYSTEM$CANCEL_QUERY`. A
+      cancel requested while it is being submitted is issued as soon as the query id is known.
+    - Redshift: psycopg2's `connection.cancel()`, which sends a cancel request for the running statement.
+    - SQLite and DuckDB: `connection.interrupt()`.
+
+    The timeout also covers fetching, so a cursor that streams its result can't outlive it either.
+
+    **Example:**
+    ```python
+    running = RunningQuery(conn, "SQLite3", timeout=60)
+    cursor = conn.cursor()
+    try:
+        running.execute(cursor, sql)
+        rows = cursor.fetchall()
+    except Exception as e:
+        raise running.translate(e)
+    finally:
+        running.finish()
+    ```
+
+    Args:
+        conn: The DB-API connection the query runs on.
+        db_type (str): "Snowflake", "Redshift", "SQLite3" or "DuckDB".
+        timeout (float): Seconds after which the query is cancelled. None disables the timeout.
+    """
+
+    def __init__(self, conn, db_type: str, timeout: float = None):
+        self.conn = conn
+        self.db_type = db_type
+        self.timeout = timeout
+        self.query_id = None
+        self.cancelled = False
+        self.timed_out = False
+        self.started_at = None
+
+        self._lock = threading.Lock()
+        self._timer = None
+        self._finished = False
+
+    def execute(self, cursor, sql: str):
+        self.started_at = time.monotonic()
+        if self.timeout:
+            self._timer = threading.Timer(self.timeout, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+
+        if self.cancelled:
+            raise QueryCancelled("Query cancelled")
+
+        if self.db_type == "Snowflake":
+            # Submitting asynchronously gives us the query id to cancel while waiting for the result
+            cursor.execute_async(sql)
+            self.query_id = cursor.sfqid
+            if self.cancelled or self.timed_out:
+                # Asked for while the query was being submitted, before there was an id to cancel
+                self._interrupt()
+            cursor.get_results_from_sfqid(self.query_id)
+        else:
+            cursor.execute(sql)
+
+    @property
+    def elapsed(self) -> float:
+        return 0.0 if self.started_at is None else time.monotonic() - self.started_at
+
+    def _interrupt(self):
+        with self._lock:
+            if self._finished:
+                return
+            try:
+                if self.db_type == "Snowflake":
+                    if self.query_id is not None:
+                        self.conn.cursor().execute("SELECT SYSTEM$CANCEL_QUERY(%s)", (self.query_id,))
+                elif self.db_type == "Redshift":
+                    self.conn.cancel()
+                else:
+                    self.conn.interrupt()
+            except Exception as e:
+                print(f"Error cancelling query: {e}")
+
+    def _expire(self):
+        self.timed_out = True
+        self._interrupt()
+
+    def cancel(self):
+        self.cancelled = True
+        self._interrupt()
+
+    def translate(self, error: Exception) -> Exception:
+        """
+        Returns:
+            Exception: A TimeoutError or QueryCancelled if `error` was caused by the timeout or `cancel()`,
+            else `error` itself.
+        """
+        if self.timed_out:
+            return TimeoutError(f"Query cancelled after exceeding the {self.timeout:g} s statement timeout")
+        if self.cancelled:
+            return QueryCancelled("Query cancelled")
+        return error
+
+    def finish(self):
+        with self._lock:
+            self._finished = True
+        if self._timer is not None:
+            self._timer.cancel()
+
+
+class QueryBudget:
+    """
+    Per-user limits on the number of queries running at once and on the total query runtime within a
+    sliding window.
+
+    **Example:**
+    ```python
+    budget = QueryBudget(max_concurrent=2, max_runtime=900, window=3600)
+    budget.acquire(user)  # raises BudgetExceeded
+    try:
+        run_query()
+    finally:
+        budget.release(user, runtime)
+    ```
+
+    Args:
+        max_concurrent (int): Queries a user may have running at the same time.
+        max_runtime (float): Seconds of query runtime a user may use within `window`.
+        window (float): Length of the sliding window in seconds.
+    """
+
+    def __init__(self, max_concurrent: int = 2, max_runtime: float = 900, window: float = 3600):
+        self.max_concurrent = max_concurrent
+        self.max_runtime = max_runtime
+        self.window = window
+
+        self._lock = threading.Lock()
+        self._running = defaultdict(int)
+        self._usage = defaultdict(deque)  # user -> (finished at, runtime), oldest first
+
+    def _used(self, user, now) -> float:
+        # Caller holds the lock
+        usage = self._usage[user]
+        while usage and now - usage[0][0] > self.window:
+            usage.popleft()
+        return sum(runtime for _, runtime in usage)
+
+    def acquire(self, user):
+        with self._lock:
+            if self._running[user] >= self.max_concurrent:
+                raise BudgetExceeded(
+                    f"You already have {self._running[user]} queries running; wait for one to finish or cancel it"
+                )
+            used = self._used(user, time.monotonic())
+            if used >= self.max_runtime:
+                raise BudgetExceeded(
+                    f"You have used {used:,.0f} s of query time in the last {self.window / 60:g} minutes, "
+                    f"the limit is {self.max_runtime:,.0f} s"
+                )
+            self._running[user] += 1
+
+    def release(self, user, runtime: float):
+        with self._lock:
+            self._running[user] = max(0, self._running[user] - 1)
+            self._usage[user].append((time.monotonic(), runtime))
+
+    def stats(self, user) -> dict:
+        with self._lock:
+            return {
+                "running": self._running[user],
+                "max_concurrent": self.max_concurrent,
+                "runtime": self._used(user, time.monotonic()),
+                "max_runtime": self.max_runtime,
+            }
@@ -0,0 +1,297 @@
+# question_index.py
+import re
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from sql_cache import normalize_question
+
+
+@dataclass
+class QuestionMatch:
+    question: str
+    sql: str
+    score: float
+
+
+# Numbers (with any sign, decimals or thousands separators) and quoted text
+_LITERAL = re.compile(r"-?\d[\d,]*(?:\.\d+)?|'[^']*'|\"[^\"]*\"|\u2018[^\u2019]*\u2019|\u201c[^\u201d]*\u201d")
+
+
+# Words that turn a question around without changing much of its text, by their canonical form
+_MODIFIERS = {
+    "asc": "asc", "ascending": "asc", "desc": "desc", "descending": "desc",
+    "top": "top", "bottom": "bottom", "min": "min", "minimum": "min", "max": "max", "maximum": "max",
+    "most": "most", "least": "least", "before": "before", "after": "after",
+    "not": "not", "no": "not", "without": "not",
+}
+_WORD = re.compile(r"[a-z]+")
+_CONTRACTED_NOT = re.compile(r"n['\u2019]t\b")
+
+
+def question_literals(question: str) -> tuple:
+    """
+    The numbers and quoted strings of a question, in order. Questions that differ only in one of them
+    look alike to the n-gram vectors, but need different SQL.
+
+    **Example:**
+    ```python
+    question_literals("Invoices over 1,000 dollars from 'Brazil' in 2011")
+    # ('1000', "'Brazil'", '2011')
+    ```
+    """
+    return tuple(
+        literal if literal[0] not in "-0123456789" else literal.replace(",", "").rstrip(".")
+        for literal in _LITERAL.findall(question)
+    )
+
+
+def question_signature(question: str) -> tuple:
+    """
+    What two questions must have in common to share SQL, however alike they look otherwise: their
+    literals (see `question_literals`), and their direction and negation words, in order ("sorted by
+    date descending" needs different SQL than "ascending").
+
+    **Example:**
+    ```python
+    question_signature("Top 5 customers who did not buy in 2011")
+    # (('5', '2011'), ('top', 'not'))
+    ```
+    """
+    modifiers = tuple(_MODIFIERS[word] for word in _WORD.findall(_CONTRACTED_NOT.sub(" not", question.lower())) if word in _MODIFIERS)
+    return question_literals(question), modifiers
+
+
+def _char_ngrams(texts, ngram_range, n_features):
+    """
+    Hash the character n-grams of each text into `n_features` buckets.
+
+    Returns:
+        (doc_ids, term_ids): One entry per n-gram occurrence.
+    """
+    padded = [f" {normalize_question(text)} " for text in texts]
+    lengths = np.fromiter((len(text.encode("utf-8")) for text in padded), dtype=np.int64, count=len(padded))
+    buffer = np.frombuffer("".join(padded).encode("utf-8"), dtype=np.uint8).astype(np.uint64)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    doc_of_byte = np.repeat(np.arange(len(padded)), lengths)
+
+    doc_ids, term_ids = [], []
+    for n in range(ngram_range[0], ngram_range[1] + 1):
+        if len(buffer) < n:
+            continue
+        windows = len(buffer) - n + 1
+
+        # Polynomial rolling hash of every n-byte window, vectorized over the whole corpus
+        h = np.zeros(windows, dtype=np.uint64)
+        for k in range(n):
+            h = h * np.uint64(1000003) + buffer[k:k + windows]
+        h = h * np.uint64(31) + np.uint64(n)
+
+        # Keep only the windows that don't run past the end of their own text
+        valid = (np.arange(windows) + n) <= (starts + lengths)[doc_of_byte[:windows]]
+        doc_ids.append(doc_of_byte[:windows][valid])
+        term_ids.append((h[valid] % np.uint64(n_features)).astype(np.int64))
+
+    if not doc_ids:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(doc_ids), np.concatenate(term_ids)
+
+
+class QuestionIndex:
+    """
+    In-memory TF-IDF index over character n-grams of previously answered questions, used to answer
+    near-duplicate questions locally instead of asking the remote model again.
+
+    The index keeps each question's normalized vector in flat NumPy arrays, plus postings grouped by
+    n-gram. A search first scores candidates through the postings of the query's selective n-grams
+    (those in at most `max_df` of the questions), then rescores the best `candidates` exactly
+    against the full query vector. Questions added after the last build go into a small tail that
+    is scored with the frozen IDF weights, and the index is rebuilt once the tail grows past
+    `rebuild_ratio` of the indexed questions.
+
+    A question only matches if its numbers, quoted strings and direction and negation words are the
+    same as the query's (see `question_signature`), so "invoices in 2011" is never answered with the
+    SQL for 2010, nor "sorted by date descending" with the SQL for ascending. The index is safe to
+    share between threads.
+
+    **Example:**
+    ```python
+    index = QuestionIndex(threshold=0.9)
+    index.add_training_data(vn.get_training_data())
+    match = index.search("how many customers are there")
+    if match is not None:
+        sql = match.sql
+    ```
+
+    Args:
+        threshold (float): Minimum cosine similarity for a question to count as a match.
+        ngram_range (tuple): Smallest and largest character n-gram lengths.
+        n_features (int): Number of hash buckets for the n-grams.
+        max_df (float): N-grams found in more than this fraction of questions are not used to find candidates.
+        candidates (int): Number of candidates rescored exactly per search.
+        rebuild_ratio (float): Rebuild the index when the tail exceeds this fraction of it.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        ngram_range=(3, 5),
+        n_features: int = 2 ** 20,
+        max_df: float = 0.2,
+        candidates: int = 32,
+        rebuild_ratio: float = 0.1,
+    ):
+        self.threshold = threshold
+        self.ngram_range = ngram_range
+        self.n_features = n_features
+        self.max_df = max_df
+        self.candidates = candidates
+        self.rebuild_ratio = rebuild_ratio
+
+        self._lock = threading.RLock()
+        self._questions = []
+        self._sqls = []
+        self._signatures = []
+        self._signature_ids = np.zeros(0, dtype=np.int64)  # hash of the signature of each indexed question
+        self._indexed = 0
+        self._idf = np.zeros(0)
+        self._df = np.zeros(0, dtype=np.int64)
+        # Vectors, one row per question: terms and weights of row i are at [_row_ptr[i], _row_ptr[i + 1])
+        self._row_ptr = np.zeros(1, dtype=np.int64)
+        self._row_terms = np.zeros(0, dtype=np.int32)
+        self._row_weights = np.zeros(0, dtype=np.float32)
+        # Postings, grouped by term: positions into the row arrays for term t are at [_term_ptr[t], _term_ptr[t + 1])
+        self._term_ptr = np.zeros(1, dtype=np.int64)
+        self._postings = np.zeros(0, dtype=np.int32)
+        self._posting_docs = np.zeros(0, dtype=np.int32)
+        self._tail = []
+
+    def __len__(self):
+        with self._lock:
+            return len(self._questions)
+
+    def add(self, question: str, sql: str):
+        self.add_many([question], [sql])
+
+    def add_many(self, questions, sqls):
+        questions, sqls = list(questions), list(sqls)
+        with self._lock:
+            first = len(self._questions)
+            self._questions.extend(questions)
+            self._sqls.extend(sqls)
+            self._signatures.extend(question_signature(question) for question in questions)
+
+            if len(self._questions) - self._indexed > max(1000, self.rebuild_ratio * self._indexed):
+                self.build()
+                return
+
+            for i, question in enumerate(questions):
+                terms, weights = self._vectorize(question)
+                self._tail.append((first + i, terms, weights))
+
+    def add_training_data(self, training_data: pd.DataFrame):
+        """
+        Seed the index with the question/SQL pairs returned by `VannaDefault.get_training_data`.
+        """
+        if training_data is None or len(training_data) == 0:
+            return
+        pairs = training_data[training_data["training_data_type"] == "sql"].dropna(subset=["question", "content"])
+        self.add_many(pairs["question"], pairs["content"])
+
+    def build(self):
+        with self._lock:
+            n_docs = len(self._questions)
+            doc_ids, term_ids = _char_ngrams(self._questions, self.ngram_range, self.n_features)
+
+            # Term frequency per (doc, term) pair, sorted by doc then term
+            pairs, tf = np.unique(doc_ids * self.n_features + term_ids, return_counts=True)
+            docs, terms = pairs // self.n_features, pairs % self.n_features
+
+            self._df = np.bincount(terms, minlength=self.n_features)
+            self._idf = np.log((1 + n_docs) / (1 + self._df)) + 1
+
+            weights = (1 + np.log(tf)) * self._idf[terms]
+            norms = np.sqrt(np.bincount(docs, weights=weights ** 2, minlength=n_docs))
+            weights = weights / norms[docs]
+
+            self._row_ptr = np.concatenate(([0], np.cumsum(np.bincount(docs, minlength=n_docs))))
+            self._row_terms = terms.astype(np.int32)
+            self._row_weights = weights.astype(np.float32)
+
+            self._postings = np.argsort(terms, kind="stable").astype(np.int32)
+            self._posting_docs = docs[self._postings].astype(np.int32)
+            self._term_ptr = np.concatenate(([0], np.cumsum(self._df)))
+
+            self._signature_ids = np.fromiter((hash(signature) for signature in self._signatures), dtype=np.int64, count=n_docs)
+            self._indexed = n_docs
+            self._tail = []
+
+    def _vectorize(self, question: str):
+        _, term_ids = _char_ngrams([question], self.ngram_range, self.n_features)
+        terms, tf = np.unique(term_ids, return_counts=True)
+        idf = self._idf[terms] if len(self._idf) else np.ones(len(terms))
+        weights = (1 + np.log(tf)) * idf
+        norm = np.sqrt(np.sum(weights ** 2))
+        return terms, (weights / norm if norm > 0 else weights)
+
+    def _score(self, query_terms, query_weights, terms, weights) -> float:
+        _, query_at, doc_at = np.intersect1d(query_terms, terms, assume_unique=True, return_indices=True)
+        return float(np.dot(query_weights[query_at], weights[doc_at]))
+
+    def search(self, question: str):
+        """
+        Returns:
+            QuestionMatch or None: The most similar indexed question with the same signature, or None if
+            nothing reaches the threshold.
+        """
+        signature = question_signature(question)
+        with self._lock:
+            if not self._questions:
+                return None
+            if self._indexed == 0:
+                self.build()
+
+            query_terms, query_weights = self._vectorize(question)
+            best, best_score = -1, 0.0
+
+            # Only the selective n-grams are used to find candidates; very common ones would touch every question
+            selective = self._df[query_terms] <= max(self.max_df * self._indexed, 1)
+            if not selective.any():
+                selective[:] = True
+            terms, weights = query_terms[selective], query_weights[selective]
+
+            lo, hi = self._term_ptr[terms], self._term_ptr[terms + 1]
+            counts = hi - lo
+            if counts.sum() > 0:
+                positions = np.arange(counts.sum()) + np.repeat(lo - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+                postings = self._postings[positions]
+                partial = np.bincount(
+                    self._posting_docs[positions],
+                    weights=self._row_weights[postings] * np.repeat(weights, counts),
+                    minlength=self._indexed,
+                )
+                # Questions with another signature are left out before the best candidates are picked
+                partial[self._signature_ids != hash(signature)] = 0
+
+                k = min(self.candidates, self._indexed)
+                for doc in np.argpartition(-partial, k - 1)[:k]:
+                    if partial[doc] <= 0 or self._signatures[doc] != signature:
+                        continue
+                    row = slice(self._row_ptr[doc], self._row_ptr[doc + 1])
+                    score = self._score(query_terms, query_weights, self._row_terms[row], self._row_weights[row])
+                    if score > best_score:
+                        best, best_score = int(doc), score
+
+            for doc, terms, weights in self._tail:
+                if self._signatures[doc] != signature:
+                    continue
+                score = self._score(query_terms, query_weights, terms, weights)
+                if score > best_score:
+                    best, best_score = doc, score
+
+            if best < 0 or best_score < self.threshold:
+                return None
+
+            return QuestionMatch(question=self._questions[best], sql=self._sqls[best], score=best_score)
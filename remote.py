@@ -1,5 +1,7 @@
+import asyncio
 import dataclasses
 import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable, List, Tuple, Union
 
 import requests
@@ -8,7 +10,12 @@ from io import StringIO
 import sys
 sys.path.append('/home/ec2-user/git/vanna-streamlit')  # Replace '/path/to/directory' with the actual directory path
 
-from connect_db import connect_to_db
+from connect_db import connect_to_db, get_connection_pool, pooled_connection
+from query_control import RunningQuery
+from result_stream import StreamingResult, close_result_cursor, iter_arrow_chunks, open_result_cursor
+from rpc_transport import PooledTransport
+from rpc_resilience import ResilientRPC
+from training_mirror import content_hash
 
 from vanna.base import VannaBase
 from vanna.types import (
@@ -58,6 +65,19 @@ class VannaDefault(VannaBase):
             if config is None or "unauthenticated_endpoint" not in config
             else config["unauthenticated_endpoint"]
         )
+        self._transport = (
+            PooledTransport()
+            if config is None or "transport" not in config
+            else config["transport"]
+        )
+        self._resilience = (
+            ResilientRPC()
+            if config is None or "resilience" not in config
+            else config["resilience"]
+        )
+        self._training_mirror = None if config is None else config.get("training_mirror")
+        # Flipped to False the first time the endpoint rejects a batch request outright
+        self._batch_supported = True
 
     def _unauthenticated_rpc_call(self, method, params):
         headers = {
@@ -68,10 +88,9 @@ class VannaDefault(VannaBase):
             "params": [self._dataclass_to_dict(obj) for obj in params],
         }
 
-        response = requests.post(
-            self._unauthenticated_endpoint, headers=headers, data=json.dumps(data)
+        return self._transport.post_json(
+            self._unauthenticated_endpoint, headers=headers, payload=data
         )
-        return response.json()
 
     def _rpc_call(self, method, params):
         if method != "list_orgs":
@@ -92,33 +111,215 @@ class VannaDefault(VannaBase):
             "params": [self._dataclass_to_dict(obj) for obj in params],
         }
 
-        response = requests.post(self._endpoint, headers=headers, data=json.dumps(data))
-        return response.json()
+        connect_timeout = self._transport.timeout[0]
+
+        return self._resilience.call(
+            method,
+            data,
+            lambda timeout: self._transport.post_json(
+                self._endpoint, headers=headers, payload=data, timeout=(connect_timeout, timeout)
+            ),
+        )
+
+    def rpc_batch_call(self, calls: List[Tuple[str, list]], batch_size: int = 100, max_workers: int = 8) -> List[dict]:
+        """
+        **Example:**
+        ```python
+        first_d, second_d = vn.rpc_batch_call([
+            ("remove_training_data", [StringData(data="1-ddl")]),
+            ("remove_training_data", [StringData(data="2-sql")]),
+        ])
+        ```
+
+        Send several RPC calls in as few HTTP requests as possible. Calls are packed into
+        JSON-RPC batches of up to `batch_size` methods, sent through the resilience layer. Only
+        batches the endpoint rejects (a 4xx status, or an answer that isn't a list) are resent as
+        single calls on up to `max_workers` threads, as they weren't applied. A batch that fails in
+        transit may already have been applied, so its calls are reported as errors instead of
+        being sent again.
+
+        Args:
+            calls (List[Tuple[str, list]]): (method, params) pairs, as passed to `_rpc_call`.
+            batch_size (int): Maximum number of calls per HTTP request.
+            max_workers (int): Maximum number of concurrent requests.
+
+        Returns:
+            List[dict]: One response per call, in the same order as `calls`.
+        """
+        calls = list(calls)
+        chunks = [calls[i:i + batch_size] for i in range(0, len(calls), batch_size)]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            if self._batch_supported:
+                results = list(executor.map(self._send_batch, chunks))
+            else:
+                results = [None] * len(chunks)
+
+            # Only the chunks the endpoint rejected are resent as single calls
+            for i, chunk in enumerate(chunks):
+                if results[i] is None:
+                    results[i] = list(executor.map(lambda call: self._rpc_call(method=call[0], params=call[1]), chunk))
+
+        return [d for result in results for d in result]
+
+    def _send_batch(self, calls: List[Tuple[str, list]]):
+        # Returns None if the endpoint rejected the batch, otherwise one response per call
+        headers = {
+            "Content-Type": "application/json",
+            "Vanna-Key": self._api_key,
+            "Vanna-Org": self._model,
+        }
+
+        data = [
+            {
+                "id": i,
+                "method": method,
+                "params": [self._dataclass_to_dict(obj) for obj in params],
+            }
+            for i, (method, params) in enumerate(calls)
+        ]
+
+        connect_timeout = self._transport.timeout[0]
+        rejected = []
+
+        def send(timeout):
+            response = self._transport.post(self._endpoint, headers=headers, payload=data, timeout=(connect_timeout, timeout))
+            # Timeouts and rate limiting are transient, not a rejection of batching
+            if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                rejected.append(f"HTTP {response.status_code}")
+                return {}
+            response.raise_for_status()
+            d = response.json()
+            if not isinstance(d, list):
+                rejected.append(f"not a list: {d}")
+                return {}
+            return d
+
+        # The slowest method in the batch sets its timeout; a batch is never retried, as it may
+        # hold calls that aren't idempotent
+        d = self._resilience.call(
+            "batch", data, send, timeout=max(self._resilience.timeout(method) for method, _ in calls)
+        )
+
+        if rejected:
+            print(f"Batch RPC rejected, sending calls one by one: {rejected[0]}")
+            self._batch_supported = False
+            return None
+
+        if not isinstance(d, list):
+            return [{"error": d.get("error", "Batch request failed")} for _ in calls]
+
+        # Batch responses may come back in any order, so put them back in request order
+        by_id = {item["id"]: item for item in d if isinstance(item, dict) and "id" in item}
+        if len(by_id) == len(d):
+            return [by_id.get(i, {"error": "No response returned for this call"}) for i in range(len(calls))]
+        if len(d) == len(calls):
+            return d
+        return [{"error": "Batch response doesn't match the calls"} for _ in calls]
 
     def connect_db_2(selected_db: str):
         conn =connect_to_db(selected_db)
         return conn
 
-    def is_sql_valid(self, sql: str, selected_db: str):
-        try:
-            if 'SQL' not in st.session_state:
-                st.session_state["SQL"] = sql
-            # Connect to the selected database
-            conn = connect_to_db(selected_db)
-
-            # Execute the query
-            cursor = conn.cursor()
+    def explain_sql(self, sql: str, selected_db: str) -> str:
+        """
+        Wrap a query in the selected database's EXPLAIN statement, which plans it without running it.
+        """
+        sql = sql.strip().rstrip(";")
+        if selected_db == "Snowflake":
+            return f"EXPLAIN USING TEXT {sql}"
+        elif selected_db == "SQLite3":
+            return f"EXPLAIN QUERY PLAN {sql}"
+        else:
+            return f"EXPLAIN {sql}"
 
-            cursor.execute(sql)
+    def is_sql_valid(self, sql: str, selected_db: str, timeout: float = 30):
+        """
+        Check that a query compiles against the selected database, without executing it.
 
-            # Close the connection
-            conn.close()
+        Args:
+            sql (str): The SQL query to check.
+            selected_db (str): The selected database (e.g., "Snowflake", "Redshift", "SQLite3", "DuckDB").
+            timeout (float): Seconds after which planning is cancelled and the query treated as invalid.
+        """
+        try:
+            # Plan the query on a pooled connection to the selected database
+            with pooled_connection(selected_db) as conn:
+                running = RunningQuery(conn, selected_db, timeout=timeout)
+                try:
+                    running.execute(conn.cursor(), self.explain_sql(sql, selected_db))
+                except Exception as e:
+                    raise running.translate(e)
+                finally:
+                    running.finish()
 
             return True
         except Exception as e:
             print(f"SQL Validation Error: {e}")
             return False
 
+    def stream_sql(
+        self,
+        sql: str,
+        selected_db: str,
+        chunk_rows: int = 10000,
+        max_rows: int = 1_000_000,
+        max_bytes: int = 256 * 1024 * 1024,
+        timeout: float = None,
+        store=None,
+        pool=None,
+    ) -> StreamingResult:
+        """
+        **Example:**
+        ```python
+        result = vn.stream_sql("SELECT * FROM InvoiceLine", selected_db="SQLite3", timeout=300)
+        preview = result.preview()
+        df = result.result()
+        ```
+
+        Run a query on the selected database and fetch its result in chunks on a background thread,
+        holding a pooled connection until fetching stops. The query itself also runs on that thread, so
+        `result.cancel()` can stop it on the server at any point.
+
+        Args:
+            sql (str): The SQL query to run.
+            selected_db (str): The selected database (e.g., "Snowflake", "Redshift", "SQLite3", "DuckDB").
+            chunk_rows (int): Rows per chunk for drivers read with `fetchmany` or record batches.
+            max_rows (int): Stop fetching after this many rows.
+            max_bytes (int): Stop fetching once the fetched rows take this much memory.
+            timeout (float): Seconds after which the query is cancelled on the server, fetching included.
+            store (ResultStore): Spill large results to this store instead of keeping them in memory.
+            pool (ConnectionPool): Run on this pool of `selected_db` connections instead of the shared
+                one, e.g. a local replica's.
+
+        Returns:
+            StreamingResult: The result being fetched. If the query fails, times out or is cancelled,
+            `preview()` and `result()` raise the error.
+        """
+        pool = pool or get_connection_pool(selected_db)
+        conn = pool.acquire()
+        running = RunningQuery(conn, selected_db, timeout=timeout)
+        cursor = None
+
+        def chunks():
+            nonlocal cursor
+            try:
+                cursor = open_result_cursor(conn, selected_db)
+                running.execute(cursor, sql)
+                yield from iter_arrow_chunks(cursor, selected_db, chunk_rows)
+            except Exception as e:
+                raise running.translate(e)
+
+        def release():
+            running.finish()
+            if cursor is not None:
+                close_result_cursor(conn, cursor, selected_db)
+            pool.release(conn)
+
+        return StreamingResult(
+            chunks(), max_rows=max_rows, max_bytes=max_bytes, on_close=release, on_cancel=running.cancel, store=store
+        )
+
     def is_sql_valid2(self, sql: str):
         try:
             # Here, you would actually execute the query in a safe way to check its validity
@@ -197,6 +398,9 @@ class VannaDefault(VannaBase):
     def system_message(self, message: str) -> any:
         return {"role": "system", "content": message}
 
+    def assistant_message(self, message: str) -> any:
+        return {"role": "assistant", "content": message}
+
     def _dataclass_to_dict(self, obj):
         return dataclasses.asdict(obj)
 
@@ -207,25 +411,40 @@ class VannaDefault(VannaBase):
         **Example:**
         ```python
         training_data = vn.get_training_data()
+        ddl = vn.get_training_data(training_data_type="ddl")
         ```
 
+        When a training data mirror is configured, the data is served from the local mirror and
+        only re-downloaded once the mirror is stale. If the download fails, the stale mirror is returned.
+
+        Args:
+            training_data_type (str): Only return entries of this type ("sql", "ddl" or "documentation"). Requires a mirror.
+
         Returns:
             pd.DataFrame or None: The training data, or None if an error occurred.
 
         """
+        mirror = self._training_mirror
+        if mirror is not None and not mirror.is_stale():
+            return mirror.get(kwargs.get("training_data_type"))
+
         params = []
 
         d = self._rpc_call(method="get_training_data", params=params)
 
         if "result" not in d:
-            return None
+            return None if mirror is None else mirror.get(kwargs.get("training_data_type"))
 
         # Load the result into a dataclass
         training_data = DataFrameJSON(**d["result"])
 
-        df = pd.read_json(StringIO(training_data.data))
+        if mirror is None:
+            df = pd.read_json(StringIO(training_data.data))
+            return df
 
-        return df
+        mirror.sync_json(training_data.data)
+
+        return mirror.get(kwargs.get("training_data_type"))
 
     def remove_training_data(self, id: str, **kwargs) -> bool:
         """
@@ -251,8 +470,52 @@ class VannaDefault(VannaBase):
         if not status.success:
             raise Exception(f"Error removing training data: {status.message}")
 
+        if self._training_mirror is not None:
+            self._training_mirror.remove(id)
+
         return status.success
 
+    def remove_training_data_bulk(self, ids, max_workers: int = 8, batch_size: int = 100) -> pd.DataFrame:
+        """
+        Remove many training data entries from the model
+
+        **Example:**
+        ```python
+        report = vn.remove_training_data_bulk(["1-ddl", "2-sql"])
+        report[report["status"] == "error"]
+        ```
+
+        Args:
+            ids (Iterable[str]): The IDs of the training data to remove.
+            max_workers (int): Maximum number of concurrent requests.
+            batch_size (int): Maximum number of removals per request.
+
+        Returns:
+            pd.DataFrame: One row per id with its `status` ("removed" or "error") and `error`.
+        """
+        ids = list(dict.fromkeys(ids))
+
+        responses = self.rpc_batch_call(
+            [("remove_training_data", [StringData(data=id)]) for id in ids], batch_size=batch_size, max_workers=max_workers
+        )
+
+        rows = []
+        for id, d in zip(ids, responses):
+            if "result" not in d:
+                rows.append({"id": id, "status": "error", "error": d.get("error", "No result returned")})
+                continue
+
+            status = Status(**d["result"])
+            if not status.success:
+                rows.append({"id": id, "status": "error", "error": status.message})
+                continue
+
+            rows.append({"id": id, "status": "removed", "error": None})
+            if self._training_mirror is not None:
+                self._training_mirror.remove(id)
+
+        return pd.DataFrame(rows, columns=["id", "status", "error"])
+
     def generate_questions(self) -> List[str]:
         """
         **Example:**
@@ -302,6 +565,9 @@ class VannaDefault(VannaBase):
 
         status = StatusWithId(**d["result"])
 
+        if self._training_mirror is not None:
+            self._training_mirror.upsert(status.id, "ddl", None, ddl)
+
         return status.id
 
     def add_documentation(self, documentation: str, **kwargs) -> str:
@@ -330,6 +596,9 @@ class VannaDefault(VannaBase):
 
         status = StatusWithId(**d["result"])
 
+        if self._training_mirror is not None:
+            self._training_mirror.upsert(status.id, "documentation", None, documentation)
+
         return status.id
 
     def add_question_sql(self, question: str, sql: str, **kwargs) -> str:
@@ -366,8 +635,134 @@ class VannaDefault(VannaBase):
 
         status = StatusWithId(**d["result"])
 
+        if self._training_mirror is not None:
+            self._training_mirror.upsert(status.id, "sql", question, sql)
+
         return status.id
 
+    def add_ddl_bulk(self, ddl, max_workers: int = 8, batch_size: int = 100) -> pd.DataFrame:
+        """
+        Adds many DDL statements to the model's training data
+
+        **Example:**
+        ```python
+        results = vn.add_ddl_bulk(ddl_statements)
+        results[results["status"] == "error"]
+        ```
+
+        Args:
+            ddl (Iterable[str] or pd.DataFrame): The DDL statements, or a DataFrame with a `ddl` column.
+            max_workers (int): Maximum number of concurrent requests.
+            batch_size (int): Maximum number of statements per request.
+
+        Returns:
+            pd.DataFrame: One row per statement with its `id`, `status` ("added", "duplicate" or "error") and `error`.
+        """
+        if isinstance(ddl, pd.DataFrame):
+            ddl = ddl["ddl"]
+        rows = [{"question": None, "content": item} for item in ddl]
+
+        return self._add_training_data_bulk(
+            "ddl", "add_ddl", rows, lambda row: [StringData(data=row["content"])], max_workers, batch_size
+        )
+
+    def add_documentation_bulk(self, documentation, max_workers: int = 8, batch_size: int = 100) -> pd.DataFrame:
+        """
+        Adds many documentation strings to the model's training data
+
+        **Example:**
+        ```python
+        results = vn.add_documentation_bulk(docs)
+        ```
+
+        Args:
+            documentation (Iterable[str] or pd.DataFrame): The documentation strings, or a DataFrame with a `documentation` column.
+            max_workers (int): Maximum number of concurrent requests.
+            batch_size (int): Maximum number of strings per request.
+
+        Returns:
+            pd.DataFrame: One row per string with its `id`, `status` ("added", "duplicate" or "error") and `error`.
+        """
+        if isinstance(documentation, pd.DataFrame):
+            documentation = documentation["documentation"]
+        rows = [{"question": None, "content": item} for item in documentation]
+
+        return self._add_training_data_bulk(
+            "documentation", "add_documentation", rows, lambda row: [StringData(data=row["content"])], max_workers, batch_size
+        )
+
+    def add_question_sql_bulk(self, question_sql, tag: str = "Manually Trained", max_workers: int = 8, batch_size: int = 100) -> pd.DataFrame:
+        """
+        Adds many question and SQL pairs to the model's training data
+
+        **Example:**
+        ```python
+        results = vn.add_question_sql_bulk(pd.DataFrame({"question": questions, "sql": sqls}))
+        ```
+
+        Args:
+            question_sql (Iterable[Tuple[str, str]] or pd.DataFrame): (question, sql) pairs, or a DataFrame with `question` and `sql` columns.
+            tag (str): A tag to associate with every pair.
+            max_workers (int): Maximum number of concurrent requests.
+            batch_size (int): Maximum number of pairs per request.
+
+        Returns:
+            pd.DataFrame: One row per pair with its `id`, `status` ("added", "duplicate" or "error") and `error`.
+        """
+        if isinstance(question_sql, pd.DataFrame):
+            question_sql = zip(question_sql["question"], question_sql["sql"])
+        rows = [{"question": question, "content": sql} for question, sql in question_sql]
+
+        return self._add_training_data_bulk(
+            "sql",
+            "add_sql",
+            rows,
+            lambda row: [QuestionSQLPair(question=row["question"], sql=row["content"], tag=tag)],
+            max_workers,
+            batch_size,
+        )
+
+    def _add_training_data_bulk(self, training_data_type, method, rows, make_params, max_workers, batch_size) -> pd.DataFrame:
+        # Skip entries that are already trained, or that appear earlier in the same input
+        trained = self.get_training_data()
+        if trained is None or len(trained) == 0:
+            seen = set()
+        else:
+            seen = {
+                content_hash(kind, question, content)
+                for kind, question, content in zip(trained["training_data_type"], trained["question"], trained["content"])
+            }
+
+        pending = []
+        for row in rows:
+            row["hash"] = content_hash(training_data_type, row["question"], row["content"])
+            row["id"], row["error"] = None, None
+            if row["hash"] in seen:
+                row["status"] = "duplicate"
+            else:
+                seen.add(row["hash"])
+                pending.append(row)
+
+        responses = self.rpc_batch_call(
+            [(method, make_params(row)) for row in pending], batch_size=batch_size, max_workers=max_workers
+        )
+
+        for row, d in zip(pending, responses):
+            if "result" not in d:
+                row["status"], row["error"] = "error", d.get("error", "No result returned")
+                continue
+
+            status = StatusWithId(**d["result"])
+            if not status.success:
+                row["status"], row["error"] = "error", status.message
+                continue
+
+            row["status"], row["id"] = "added", status.id
+            if self._training_mirror is not None:
+                self._training_mirror.upsert(status.id, training_data_type, row["question"], row["content"])
+
+        return pd.DataFrame(rows, columns=["question", "content", "id", "status", "error"])
+
     def generate_embedding(self, data: str, **kwargs) -> List[float]:
         """
         Not necessary for remote models as embeddings are generated on the server side.
@@ -605,4 +1000,43 @@ class VannaDefault(VannaBase):
         # Load the result into a dataclass
         question_string_list = QuestionStringList(**d["result"])
 
-        return question_string_list.questions        
+        return question_string_list.questions
+
+
+class AsyncVannaDefault(VannaDefault):
+    """
+    VannaDefault with awaitable variants of the network-bound methods.
+
+    Each `*_async` method runs its blocking counterpart on a worker thread, sharing the
+    pooled transport, so several RPC round trips can be awaited concurrently:
+
+    **Example:**
+    ```python
+    code, followups = await asyncio.gather(
+        vn.generate_plotly_code_async(question=question, sql=sql, df_metadata=df_metadata),
+        vn.generate_followup_questions_async(question=question, df=df),
+    )
+    ```
+
+    Make sure the transport's `pool_maxsize` is at least the number of calls you expect to
+    have in flight at once.
+    """
+
+    async def generate_sql_async(self, question: str, **kwargs) -> str:
+        return await asyncio.to_thread(self.generate_sql, question=question, **kwargs)
+
+    async def generate_questions_async(self) -> List[str]:
+        return await asyncio.to_thread(self.generate_questions)
+
+    async def generate_plotly_code_async(
+        self, question: str = None, sql: str = None, df_metadata: str = None, **kwargs
+    ) -> str:
+        return await asyncio.to_thread(
+            self.generate_plotly_code, question=question, sql=sql, df_metadata=df_metadata, **kwargs
+        )
+
+    async def generate_summary_async(self, question: str, df: pd.DataFrame, **kwargs) -> str:
+        return await asyncio.to_thread(self.generate_summary, question=question, df=df, **kwargs)
+
+    async def generate_followup_questions_async(self, question: str, df: pd.DataFrame, **kwargs) -> List[str]:
+        return await asyncio.to_thread(self.generate_followup_questions, question=question, df=df, **kwargs)
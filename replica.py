@@ -0,0 +1,260 @@
+# replica.py
+import threading
+import time
+
+import duckdb
+import sqlglot
+from sqlglot import exp
+
+from db_pool import ConnectionPool
+from result_stream import close_result_cursor, iter_arrow_chunks, open_result_cursor
+from schema_catalog import DIALECTS
+from sql_rewrite import duckdb_divergence
+
+
+def _quoted(name: str) -> str:
+    return exp.to_identifier(name, quoted=True).sql(dialect="duckdb")
+
+
+class DuckDBReplica:
+    """
+    Local DuckDB copy of the tables of another database, which answers interactive queries on those
+    tables without the round trip to (or the cost of) the warehouse, and without SQLite's row-at-a-time
+    execution.
+
+    The replica remembers the source's data version it was copied at (see `result_cache.data_version`).
+    `route()` only rewrites a query for the replica while that is still the source's current version,
+    every table the query reads was copied and the query is built only from expressions DuckDB evaluates
+    the same as the source (see `sql_rewrite.duckdb_divergence`), so routed queries return what the
+    source would. When the source has moved on, the next scheduled refresh is brought forward.
+
+    Tables are streamed into the replica in Arrow chunks; each is replaced in its own transaction, so
+    queries running meanwhile see either the old or the new copy. The copied version is stored in the
+    replica file, so a restart doesn't copy unchanged data again.
+
+    **Example:**
+    ```python
+    replica = DuckDBReplica("replica/SQLite3.duckdb", "SQLite3")
+    replica.refresh(sqlite_conn, version, tables=[(None, "Invoice"), (None, "InvoiceLine")])
+    replica_sql = replica.route("SELECT BillingCountry, SUM(Total) FROM Invoice GROUP BY 1", version)
+    if replica_sql is not None:
+        with replica.pool.connection() as conn:
+            conn.execute(replica_sql).fetchall()
+    ```
+
+    Args:
+        path (str): The DuckDB file holding the replica.
+        source_db (str): "Snowflake", "Redshift" or "SQLite3".
+        chunk_rows (int): Rows per chunk when copying.
+        max_connections (int): Queries the replica runs at once.
+    """
+
+    def __init__(self, path: str, source_db: str, chunk_rows: int = 100_000, max_connections: int = 4):
+        if source_db not in DIALECTS or source_db == "DuckDB":
+            raise ValueError(f"Unsupported replica source: {source_db}")
+
+        self.path = path
+        self.source_db = source_db
+        self.chunk_rows = chunk_rows
+
+        self.version = None  # Data version of the source the tables were copied at
+        self.refreshed_at = None
+        self.refreshes = 0
+        self.routed = 0
+        self.last_error = None
+
+        self._conn = duckdb.connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS _replica_meta (version VARCHAR, refreshed_at DOUBLE)")
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._tables = {}  # lower-case name -> name as copied
+        self._load_meta()
+
+        # Pooled connections are cursors on the one connection, as DuckDB opens a file once per process
+        self.pool = ConnectionPool(self._conn.cursor, min_size=1, max_size=max_connections)
+        self._wake = threading.Event()
+
+    def _load_meta(self):
+        meta = self._conn.execute("SELECT version, refreshed_at FROM _replica_meta").fetchall()
+        tables = self._conn.execute(
+            "SELECT table_name FROM duckdb_tables() WHERE schema_name = 'main' AND table_name <> '_replica_meta'"
+        ).fetchall()
+        if meta:
+            self.version, self.refreshed_at = meta[0]
+        self._tables = {name.lower(): name for (name,) in tables}
+
+    def tables(self) -> list:
+        with self._lock:
+            return sorted(self._tables.values())
+
+    # Copying
+
+    def _copy_table(self, source_conn, source_name: str, name: str):
+        cursor = open_result_cursor(source_conn, self.source_db)
+        target = self._conn.cursor()
+        quoted = _quoted(name)
+        try:
+            cursor.execute(f"SELECT * FROM {source_name}")
+            target.execute("BEGIN TRANSACTION")
+            created = False
+            untyped = set()  # Columns that were all NULL so far, created with a placeholder type
+            for chunk in iter_arrow_chunks(cursor, self.source_db, self.chunk_rows):
+                target.register("_replica_chunk", chunk)
+                if not created:
+                    target.execute(f"CREATE OR REPLACE TABLE {quoted} AS SELECT * FROM _replica_chunk")
+                    untyped = {field.name for field in chunk.schema if field.type == "null"}
+                    created = True
+                else:
+                    for field in chunk.schema:
+                        if field.name in untyped and field.type != "null":
+                            column_type = target.execute(f"SELECT typeof({_quoted(field.name)}) FROM _replica_chunk LIMIT 1").fetchone()[0]
+                            target.execute(f"ALTER TABLE {quoted} ALTER {_quoted(field.name)} SET DATA TYPE {column_type}")
+                            untyped.discard(field.name)
+                    target.execute(f"INSERT INTO {quoted} SELECT * FROM _replica_chunk")
+                target.unregister("_replica_chunk")
+            target.execute("COMMIT")
+        except Exception:
+            target.execute("ROLLBACK")
+            raise
+        finally:
+            close_result_cursor(source_conn, cursor, self.source_db)
+            target.close()
+
+    def refresh(self, source_conn, version: str, tables: list, database: str = None, schema: str = None) -> bool:
+        """
+        Copy `tables` from the source, unless the replica already holds them at `version`.
+
+        Args:
+            source_conn: A DB-API connection to the source database.
+            version (str): The source's current data version, probed before copying, so that changes
+                made while copying trigger another refresh rather than being missed.
+            tables (list): (schema, table) pairs as keyed in `SchemaCatalog.tables()`.
+            database (str): Database the source tables are qualified with.
+            schema (str): Schema the source tables are qualified with, if the catalog doesn't say.
+
+        Returns:
+            bool: Whether anything was copied.
+        """
+        with self._refresh_lock:
+            names = {table.lower(): (table_schema, table) for table_schema, table in tables}
+            with self._lock:
+                if version == self.version and set(names) <= set(self._tables):
+                    return False
+
+            dialect = DIALECTS[self.source_db]
+            for table_schema, table in names.values():
+                source_name = exp.table_(
+                    exp.to_identifier(table, quoted=True),
+                    db=(table_schema or schema) if self.source_db != "SQLite3" else None,
+                    catalog=database if self.source_db != "SQLite3" else None,
+                ).sql(dialect=dialect)
+                self._copy_table(source_conn, source_name, table)
+
+            # Refreshes run on the scheduler's thread, so they use their own cursor
+            target = self._conn.cursor()
+            try:
+                for lower, name in list(self._tables.items()):
+                    if lower not in names:
+                        target.execute(f"DROP TABLE IF EXISTS {_quoted(name)}")
+
+                refreshed_at = time.time()
+                target.execute("DELETE FROM _replica_meta")
+                target.execute("INSERT INTO _replica_meta VALUES (?, ?)", (version, refreshed_at))
+            finally:
+                target.close()
+            with self._lock:
+                self._tables = {table.lower(): table for _, table in names.values()}
+                self.version = version
+                self.refreshed_at = refreshed_at
+                self.refreshes += 1
+            return True
+
+    def start_schedule(self, refresh, interval: float):
+        """
+        Call `refresh()` now and then every `interval` seconds, or sooner when `route()` finds the
+        replica behind the source, on a daemon thread.
+        """
+        def run():
+            while True:
+                try:
+                    refresh()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = e
+                    print(f"Replica refresh failed: {e}")
+                self._wake.wait(interval)
+                self._wake.clear()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    # Routing
+
+    def route(self, sql: str, version: str, schema: str = None):
+        """
+        Rewrite a query on the source into one on the replica, if the replica can answer it.
+
+        Args:
+            sql (str): The query, in the source's dialect.
+            version (str): The source's current data version.
+            schema (str): The source schema the replica mirrors; tables qualified with another schema
+                aren't in the replica.
+
+        Returns:
+            str: The query for the replica, or None if it has to run on the source.
+        """
+        with self._lock:
+            if self.version is None:
+                return None
+            if version != self.version:
+                # Behind the source: answer from the source until the brought-forward refresh is done
+                self._wake.set()
+                return None
+            known = dict(self._tables)
+
+        try:
+            expressions = [expression for expression in sqlglot.parse(sql, read=DIALECTS[self.source_db]) if expression is not None]
+        except Exception:
+            return None
+        if len(expressions) != 1 or not isinstance(expressions[0], exp.Query):
+            return None
+        expression = expressions[0]
+
+        divergence = duckdb_divergence(expression, self.source_db)
+        if divergence is not None:
+            print(f"Not routing to the replica: DuckDB may evaluate {divergence} differently from {self.source_db}")
+            return None
+
+        ctes = {cte.alias_or_name.lower() for cte in expression.find_all(exp.CTE)}
+        for table in expression.find_all(exp.Table):
+            if not table.name or (not table.db and table.name.lower() in ctes):
+                continue
+            if table.db and (schema is None or table.db.lower() != schema.lower()):
+                return None
+            if table.name.lower() not in known:
+                return None
+            table.set("this", exp.to_identifier(known[table.name.lower()], quoted=True))
+            table.set("db", None)
+            table.set("catalog", None)
+
+        try:
+            replica_sql = expression.sql(dialect="duckdb")
+            # Binding catches functions that didn't translate, without running the query
+            with self.pool.connection() as conn:
+                conn.execute(f"EXPLAIN {replica_sql}")
+        except Exception as e:
+            print(f"Not routing to the replica: {e}")
+            return None
+
+        with self._lock:
+            self.routed += 1
+        return replica_sql
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tables": len(self._tables),
+                "refreshes": self.refreshes,
+                "routed": self.routed,
+                "refreshed_at": self.refreshed_at,
+                "error": str(self.last_error) if self.last_error is not None else None,
+            }
@@ -0,0 +1,221 @@
+# result_cache.py
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import sqlglot
+
+from schema_catalog import DIALECTS
+
+
+def normalize_sql(sql: str, db_type: str) -> str:
+    """
+    Normalize a query so that differences in whitespace, keyword case, comments and a trailing semicolon
+    map to the same key. Identifiers and literals are left as written.
+
+    **Example:**
+    ```python
+    normalize_sql("select *\n  from Album;  -- all albums", "SQLite3")
+    # 'SELECT * FROM Album'
+    ```
+    """
+    try:
+        return sqlglot.transpile(sql, read=DIALECTS.get(db_type), write=DIALECTS.get(db_type), comments=False)[0]
+    except Exception:
+        return " ".join(sql.strip().rstrip(";").split())
+
+
+def result_fingerprint(db_type: str, sql: str, version: str) -> str:
+    """
+    Identify a query result by what produced it, i.e. the database, the normalized SQL and the data
+    version, so downstream caches can be keyed on it without hashing the rows.
+    """
+    return hashlib.sha256(f"{db_type}\0{normalize_sql(sql, db_type)}\0{version}".encode("utf-8")).hexdigest()
+
+
+def _file_version(path: str) -> tuple:
+    versions = []
+    for file in (path, path + "-wal", path + ".wal"):
+        try:
+            stat = os.stat(file)
+            versions.append((file, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            pass
+    return tuple(versions)
+
+
+def data_version(conn, db_type: str, schema: str = None, path: str = None) -> str:
+    """
+    Cheap token that changes whenever the data of the database (or schema) may have changed.
+
+    - SQLite: modification time and size of the database file and its WAL. `PRAGMA data_version` is
+      only comparable within one connection, and pooled queries run on several.
+    - DuckDB: the catalog's per-table size estimates, plus the file and WAL modification times.
+    - Snowflake: the latest `LAST_ALTERED` of the schema's tables, which DML also advances.
+    - Redshift: row counts and block usage of the schema's tables from `svv_table_info`.
+
+    Args:
+        conn: A DB-API connection to the database.
+        db_type (str): "Snowflake", "Redshift", "SQLite3" or "DuckDB".
+        schema (str): The schema to watch (Snowflake and Redshift).
+        path (str): The database file (SQLite and DuckDB).
+    """
+    cursor = conn.cursor()
+
+    if db_type == "SQLite3":
+        version = _file_version(path)
+    elif db_type == "DuckDB":
+        cursor.execute("SELECT schema_name, table_name, estimated_size FROM duckdb_tables() ORDER BY 1, 2")
+        version = (cursor.fetchall(), _file_version(path) if path else ())
+    elif db_type == "Snowflake":
+        cursor.execute("SELECT COUNT(*), MAX(last_altered) FROM information_schema.tables WHERE table_schema = %s", (schema,))
+        version = cursor.fetchall()
+    elif db_type == "Redshift":
+        cursor.execute('SELECT table_id, tbl_rows, size FROM svv_table_info WHERE "schema" = %s ORDER BY table_id', (schema,))
+        version = cursor.fetchall()
+    else:
+        raise ValueError(f"Unsupported database type: {db_type}")
+
+    return hashlib.sha256(repr(version).encode("utf-8")).hexdigest()
+
+
+def _size(value) -> int:
+    # StreamingResult reports the bytes it holds in memory; anything else is assumed to be a DataFrame
+    if hasattr(value, "resident_bytes"):
+        return value.resident_bytes
+    try:
+        return int(value.memory_usage(deep=False).sum())
+    except Exception:
+        return 0
+
+
+class ResultCache:
+    """
+    In-memory, byte-bounded LRU cache of query results.
+
+    Entries are keyed on the database and the normalized SQL, and remember the data version of the
+    database when they were stored; a lookup with a different version is a miss, so results are
+    invalidated as soon as the data changes rather than after a fixed TTL. Data versions are probed at
+    most once every `probe_interval` seconds per database.
+
+    **Example:**
+    ```python
+    cache = ResultCache(max_bytes=512 * 1024 * 1024)
+    version = cache.version("SQLite3", lambda: data_version(conn, "SQLite3", path=path))
+    result = cache.get("SQLite3", sql, version)
+    if result is None:
+        result = run(sql)
+        cache.set("SQLite3", sql, version, result)
+    ```
+
+    Args:
+        max_bytes (int): Total size of the cached results above which the least recently used are evicted.
+        probe_interval (float): Seconds a probed data version is reused before probing again.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, probe_interval: float = 30):
+        self.max_bytes = max_bytes
+        self.probe_interval = probe_interval
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (data version, result), least recently used first
+        self._versions = {}  # db_type -> (data version, probed at)
+
+    def _key(self, db_type: str, sql: str) -> tuple:
+        return db_type, normalize_sql(sql, db_type)
+
+    def version(self, db_type: str, probe) -> str:
+        """
+        Returns:
+            str: The data version of `db_type`, from `probe()` unless it was probed within `probe_interval`.
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._versions.get(db_type)
+            if cached is not None and now - cached[1] < self.probe_interval:
+                return cached[0]
+
+        version = probe()
+        with self._lock:
+            self._versions[db_type] = (version, now)
+        return version
+
+    def get(self, db_type: str, sql: str, version: str):
+        """
+        Returns:
+            The cached result, or None on a miss or if the data changed since it was stored.
+        """
+        key = self._key(db_type, sql)
+        with self._lock:
+            entry = self._entries.get(key)
+
+            # Failed, cancelled and expired results are only kept while they are being shown
+            if entry is not None and (
+                entry[0] != version
+                or getattr(entry[1], "error", None) is not None
+                or getattr(entry[1], "cancelled", False)
+                or getattr(entry[1], "expired", False)
+            ):
+                del self._entries[key]
+                self.invalidations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self._evict()
+            return entry[1]
+
+    def set(self, db_type: str, sql: str, version: str, result):
+        with self._lock:
+            key = self._key(db_type, sql)
+            self._entries[key] = (version, result)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        # Caller holds the lock. Results still being fetched grow, so sizes are re-read every time.
+        total = sum(_size(result) for _, result in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, (_, result) = self._entries.popitem(last=False)
+            total -= _size(result)
+            self.evictions += 1
+
+    def recent(self, db_type: str, version: str, limit: int = 8) -> list:
+        """
+        Returns:
+            list: (normalized SQL, result) of up to `limit` cached results of `db_type` at `version`, most
+            recently used first.
+        """
+        with self._lock:
+            entries = [
+                (key[1], result)
+                for key, (entry_version, result) in reversed(self._entries.items())
+                if key[0] == db_type and entry_version == version
+            ]
+        return entries[:limit]
+
+    def delete(self, db_type: str, sql: str):
+        with self._lock:
+            self._entries.pop(self._key(db_type, sql), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": sum(_size(result) for _, result in self._entries.values()),
+            }
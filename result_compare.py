@@ -0,0 +1,128 @@
+# result_compare.py
+import datetime
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+
+def _normalize_value(value) -> str:
+    if value is None or value is pd.NaT or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    if isinstance(value, (datetime.datetime, datetime.date, pd.Timestamp)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.hex()
+    return str(value)
+
+
+def _normalize_column(column: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(column) or pd.api.types.is_numeric_dtype(column):
+        # 1, 1.0 and Decimal('1.000') are the same number in different warehouses, and aggregates
+        # may differ in the last bits depending on the order they were summed in
+        return column.astype("float64").round(6)
+    if column.dtype == object or pd.api.types.is_string_dtype(column):
+        try:
+            # Decimals, and numbers stored as text (e.g. the VARCHAR columns etl/copy_data.py creates)
+            return pd.to_numeric(column, errors="raise").astype("float64").round(6)
+        except (ValueError, TypeError):
+            pass
+    return column.map(_normalize_value).astype(object)
+
+
+def normalize_result(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert a result to the same types whichever warehouse returned it: column names lower-cased
+    (Snowflake upper-cases unquoted identifiers), numbers as rounded floats whatever their type, and
+    everything else as text.
+    """
+    normalized = pd.DataFrame(
+        {i: _normalize_column(df.iloc[:, i]).reset_index(drop=True) for i in range(df.shape[1])},
+        index=pd.RangeIndex(len(df)),
+    )
+    normalized.columns = [str(column).lower() for column in df.columns]
+    return normalized
+
+
+def result_checksum(df: pd.DataFrame) -> str:
+    """
+    Checksum of a result's values that doesn't depend on row order, since queries without an ORDER BY
+    may return rows in any order. Rows are hashed one by one and the hashes summed, so a duplicated
+    or missing row still changes it.
+
+    **Example:**
+    ```python
+    result_checksum(pd.DataFrame({"n": [1, 2]})) == result_checksum(pd.DataFrame({"N": [2.0, 1.0]}))
+    # True
+    ```
+    """
+    return result_summary([df], columns=list(df.columns))["checksum"]
+
+
+def result_summary(pages, columns: list = None) -> dict:
+    """
+    Row count, column names and `result_checksum` of a result read in pages, e.g. with
+    `StreamingResult.pages()`, so a spilled result is never loaded whole. Row hashes are summed page by
+    page, which gives the same checksum as hashing the whole result, as long as a text column holds
+    numbers in all of its pages or in none.
+
+    Args:
+        pages (Iterable[pd.DataFrame]): The result's rows, in consecutive pages.
+        columns (list): The result's column names, used if there are no pages.
+
+    Returns:
+        dict: "rows", "columns" (lower-cased) and "checksum".
+    """
+    rows, total = 0, 0
+    for page in pages:
+        columns = list(page.columns)
+        rows += len(page)
+        if len(page):
+            total += int(pd.util.hash_pandas_object(normalize_result(page), index=False).sum())
+    columns = [str(column).lower() for column in columns or []]
+    checksum = hashlib.sha256(f"{len(columns)}\0{total & 0xFFFFFFFFFFFFFFFF}".encode("utf-8")).hexdigest()[:16]
+    return {"rows": rows, "columns": columns, "checksum": checksum}
+
+
+def compare_results(results: dict, baseline: str) -> pd.DataFrame:
+    """
+    Compare the results of the same question on several databases against the result on `baseline`.
+
+    Args:
+        results (dict): Maps a database name to the `result_summary` of its result, or to None if it failed.
+        baseline (str): The database the others are compared with.
+
+    Returns:
+        pd.DataFrame: One row per database with its row and column count, checksum and how it differs
+        from the baseline.
+    """
+    expected = results.get(baseline)
+    rows = []
+    for db, summary in results.items():
+        if summary is None:
+            rows.append({"database": db, "rows": None, "columns": None, "checksum": None, "diff": "failed"})
+            continue
+
+        if db == baseline:
+            diff = "baseline"
+        elif expected is None:
+            diff = "no baseline"
+        elif summary["rows"] != expected["rows"]:
+            diff = f"{summary['rows'] - expected['rows']:+,} rows"
+        elif len(summary["columns"]) != len(expected["columns"]):
+            diff = f"{len(summary['columns']) - len(expected['columns']):+} columns"
+        elif summary["checksum"] != expected["checksum"]:
+            diff = "values differ"
+        elif summary["columns"] != expected["columns"]:
+            diff = "same values, column names differ"
+        else:
+            diff = "match"
+
+        rows.append({
+            "database": db,
+            "rows": summary["rows"],
+            "columns": len(summary["columns"]),
+            "checksum": summary["checksum"],
+            "diff": diff,
+        })
+    return pd.DataFrame(rows)
@@ -0,0 +1,143 @@
+# result_store.py
+import os
+import threading
+import time
+import uuid
+
+import pyarrow as pa
+
+from result_stream import concat_chunks
+
+
+class ResultStore:
+    """
+    Directory of query results spilled to disk as uncompressed Arrow IPC files, which can be
+    memory-mapped, so reading a page or a column back only touches the pages it needs and the
+    operating system can drop them again under memory pressure.
+
+    Files are deleted with `release()` once their result is no longer referenced, and a janitor
+    thread deletes any file that hasn't been read for `max_age` seconds, e.g. one left behind by a
+    session that ended or a process that crashed.
+
+    **Example:**
+    ```python
+    store = ResultStore("result_spill", spill_bytes=64 * 1024 * 1024)
+    if store.should_spill(result_bytes):
+        path = store.write(chunks)
+        table = store.read(path)  # memory-mapped
+    ```
+
+    Args:
+        directory (str): Directory holding the spilled results; created if needed.
+        spill_bytes (int): Results at least this large are spilled.
+        max_age (float): Seconds after its last read that a file is deleted by the janitor.
+        janitor_interval (float): Seconds between janitor runs. None doesn't start the janitor.
+    """
+
+    def __init__(self, directory: str, spill_bytes: int = 64 * 1024 * 1024, max_age: float = 3600, janitor_interval: float = 300):
+        self.directory = directory
+        self.spill_bytes = spill_bytes
+        self.max_age = max_age
+
+        self.spilled = 0
+        self.expired = 0
+
+        self._lock = threading.Lock()
+        self._last_read = {}  # path -> time of the last read
+        os.makedirs(directory, exist_ok=True)
+
+        if janitor_interval:
+            self._janitor = threading.Thread(target=self._run_janitor, args=(janitor_interval,), daemon=True)
+            self._janitor.start()
+
+    def should_spill(self, nbytes: int) -> bool:
+        return self.spill_bytes is not None and nbytes >= self.spill_bytes
+
+    def write(self, chunks: list) -> str:
+        """
+        Write Arrow tables or record batches to a new file as one table.
+
+        Returns:
+            str: The path of the file.
+        """
+        path = os.path.join(self.directory, f"{uuid.uuid4().hex}.arrow")
+        table = concat_chunks(chunks)
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+        with self._lock:
+            self._last_read[path] = time.time()
+            self.spilled += 1
+        return path
+
+    def read(self, path: str) -> pa.Table:
+        """
+        Returns:
+            pa.Table: The spilled result, memory-mapped rather than read into memory.
+
+        Raises:
+            FileNotFoundError: If the file expired and was deleted.
+        """
+        with self._lock:
+            if path in self._last_read:
+                self._last_read[path] = time.time()
+        return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(path)
+
+    def release(self, path: str):
+        with self._lock:
+            self._last_read.pop(path, None)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error removing spilled result {path}: {e}")
+
+    def cleanup(self) -> int:
+        """
+        Delete files that haven't been read for `max_age` seconds, including files of earlier
+        processes, which are judged by their modification time.
+
+        Returns:
+            int: The number of files deleted.
+        """
+        now = time.time()
+        with self._lock:
+            last_read = dict(self._last_read)
+
+        deleted = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                last = last_read.get(path, os.path.getmtime(path))
+            except OSError:
+                continue
+            if now - last > self.max_age:
+                self.release(path)
+                deleted += 1
+
+        with self._lock:
+            self.expired += deleted
+        return deleted
+
+    def _run_janitor(self, interval: float):
+        while True:
+            time.sleep(interval)
+            try:
+                self.cleanup()
+            except Exception as e:
+                print(f"Result store cleanup failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            paths = list(self._last_read)
+        size = 0
+        for path in paths:
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return {"files": len(paths), "bytes": size, "spilled": self.spilled, "expired": self.expired}
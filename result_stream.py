@@ -0,0 +1,408 @@
+# result_stream.py
+import threading
+import time
+import uuid
+import weakref
+
+import pandas as pd
+import pyarrow as pa
+
+
+def _description_columns(cursor) -> list:
+    return [column[0] for column in cursor.description]
+
+
+def open_result_cursor(conn, db_type: str):
+    """
+    Open a cursor that streams its results instead of buffering them on the client.
+
+    psycopg2 reads the whole result set on `execute()` unless a named (server-side) cursor is used,
+    and Redshift only allows those inside a transaction, so autocommit is switched off for the
+    duration of the query; `close_result_cursor` restores it.
+    """
+    if db_type == "Redshift":
+        conn.autocommit = False
+        return conn.cursor(name=f"result_{uuid.uuid4().hex}")
+    return conn.cursor()
+
+
+def close_result_cursor(conn, cursor, db_type: str):
+    try:
+        cursor.close()
+    except Exception as e:
+        print(f"Error closing result cursor: {e}")
+    if db_type == "Redshift":
+        conn.rollback()
+        conn.autocommit = True
+
+
+def rows_to_arrow(rows: list, columns: list) -> pa.Table:
+    """
+    Convert DB-API row tuples to an Arrow table one column at a time, so each value is converted once
+    into a typed column instead of being boxed into a pandas object row.
+
+    SQLite columns can hold values of different types; such a column is read as text.
+    """
+    arrays = []
+    for values in zip(*rows):
+        try:
+            arrays.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array([None if value is None else str(value) for value in values], type=pa.string()))
+    return pa.Table.from_arrays(arrays, names=columns)
+
+
+def _as_text(column) -> pa.ChunkedArray:
+    # The same text rows_to_arrow makes of a mixed column
+    return pa.chunked_array([pa.array([None if value is None else str(value) for value in column.to_pylist()], type=pa.string())])
+
+
+def concat_chunks(chunks: list) -> pa.Table:
+    """
+    Concatenate Arrow tables or record batches into one table, unifying their types: an all-null
+    chunk takes the type of the others, and a column whose type differs between chunks (a SQLite
+    column holding numbers in one chunk and text in a later one) is read as text in every chunk.
+    Concatenating only references the chunks, it doesn't copy them.
+    """
+    tables = [pa.Table.from_batches([chunk]) if isinstance(chunk, pa.RecordBatch) else chunk for chunk in chunks]
+    if len(tables) == 1:
+        return tables[0]
+    try:
+        return pa.concat_tables(tables, promote_options="permissive")
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+
+    mixed = set()
+    for i in range(tables[0].num_columns):
+        types = {table.schema.field(i).type for table in tables} - {pa.null()}
+        if len(types) > 1:
+            mixed.add(i)
+    tables = [
+        pa.Table.from_arrays(
+            [_as_text(column) if i in mixed and column.type != pa.string() else column for i, column in enumerate(table.columns)],
+            names=table.column_names,
+        )
+        for table in tables
+    ]
+    return pa.concat_tables(tables, promote_options="permissive")
+
+
+def iter_arrow_chunks(cursor, db_type: str, chunk_rows: int = 10000):
+    """
+    Yield the result of an executed query as Arrow tables or record batches of about `chunk_rows` rows.
+
+    Snowflake and DuckDB hand over their native Arrow result batches without any per-row work. Redshift
+    (psycopg2) and SQLite only return row tuples, which are read with `fetchmany` and converted column
+    by column with `rows_to_arrow`.
+    """
+    if db_type == "Snowflake":
+        if cursor.description is not None:
+            yield from cursor.fetch_arrow_batches()
+    elif db_type == "DuckDB":
+        if cursor.description is not None:
+            yield from cursor.fetch_record_batch(chunk_rows)
+    else:
+        # Named cursors only describe their result after the first fetch
+        rows = cursor.fetchmany(chunk_rows)
+        if cursor.description is None:
+            return
+        columns = _description_columns(cursor)
+        if not rows:
+            # An empty result still has columns
+            yield pa.Table.from_arrays([pa.array([], type=pa.null()) for _ in columns], names=columns)
+        while rows:
+            yield rows_to_arrow(rows, columns)
+            rows = cursor.fetchmany(chunk_rows)
+
+
+def arrow_to_pandas(chunks: list, columns: list = None) -> pd.DataFrame:
+    """
+    Build one DataFrame from Arrow chunks. Chunk types are unified (see `concat_chunks`), and each
+    column is converted into its own block while the Arrow buffers are released, so the result is
+    never held twice in full.
+    """
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    table = concat_chunks(chunks)
+    chunks.clear()
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+class StreamingResult:
+    """
+    The result of a query, fetched in Arrow chunks by a background thread.
+
+    The first chunk is available through `preview()` as soon as it arrives, while the rest is fetched
+    until the result ends or `max_rows` / `max_bytes` is reached, in which case `truncated` is set and
+    the remaining rows are never transferred. The chunks are converted to pandas once, by `result()`.
+    A result spilled to a `store` is never converted whole: read it with `page()`, or `frame()` for
+    a DataFrame of its first rows.
+
+    **Example:**
+    ```python
+    result = StreamingResult(chunks, max_rows=1_000_000, on_close=release_connection)
+    st.dataframe(result.preview().head(20))
+    df = result.result()
+    if result.truncated:
+        st.warning(f"Showing the first {result.rows} rows")
+    ```
+
+    Args:
+        chunks (Iterator[pa.Table | pa.RecordBatch]): The result, e.g. from `iter_arrow_chunks`.
+        max_rows (int): Stop fetching after this many rows.
+        max_bytes (int): Stop fetching once the fetched chunks take this much memory.
+        on_close (callable): Called once fetching has stopped, e.g. to release the connection.
+        columns (list): Column names, used for an empty result.
+        on_cancel (callable): Called by `cancel()`, e.g. to stop the query on the server.
+        store (ResultStore): Where results above its spill threshold are written once fetched, instead
+            of being kept in memory.
+    """
+
+    def __init__(
+        self,
+        chunks,
+        max_rows: int = 1_000_000,
+        max_bytes: int = 256 * 1024 * 1024,
+        on_close=None,
+        columns=None,
+        on_cancel=None,
+        store=None,
+    ):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.rows = 0
+        self.bytes = 0
+        self.truncated = False
+        self.error = None
+        self.fingerprint = None  # Set by whoever caches the result, see result_cache.result_fingerprint
+        self.served_by = None  # Set by whoever runs the query somewhere else than asked, e.g. a replica
+        self.started_by = None  # Set by whoever runs the query: the session allowed to cancel it
+
+        self._chunks = []
+        self._columns = columns
+        self._preview = None
+        self._preview_bytes = 0
+        self._df = None
+        self._df_bytes = 0
+        self._head = None  # (max_rows, DataFrame, bytes) of a spilled result, see frame()
+        self._on_close = on_close
+        self._on_cancel = on_cancel
+        self._store = store
+        self._path = None
+        self._callbacks = []
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._first_chunk = threading.Event()
+        self._done = threading.Event()
+        self._cancelled = threading.Event()
+
+        self._thread = threading.Thread(target=self._fetch, args=(chunks,), daemon=True)
+        self._thread.start()
+
+    def _fetch(self, chunks):
+        chunks = iter(chunks)
+        try:
+            for chunk in chunks:
+                if not self._columns:
+                    self._columns = list(chunk.schema.names)
+
+                if self.rows + chunk.num_rows > self.max_rows:
+                    chunk = chunk.slice(0, self.max_rows - self.rows)
+                    self.truncated = True
+
+                self._chunks.append(chunk)
+                self.rows += chunk.num_rows
+                self.bytes += chunk.nbytes
+                if self._preview is None:
+                    self._preview = chunk.to_pandas()
+                    self._preview_bytes = int(self._preview.memory_usage(deep=True).sum())
+                    self._first_chunk.set()
+
+                if self.rows >= self.max_rows or self.bytes >= self.max_bytes:
+                    # Only truncated if there is anything left to read
+                    self.truncated = self.truncated or next(chunks, None) is not None
+                    break
+                if self._cancelled.is_set():
+                    self.truncated = True
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+            self.finished_at = time.monotonic()
+            if self.error is None and self._store is not None and self._chunks and self._store.should_spill(self.bytes):
+                self._spill()
+            with self._lock:
+                self._first_chunk.set()
+                self._done.set()
+                callbacks, self._callbacks = self._callbacks, []
+            for callback in callbacks:
+                callback(self)
+
+    def _spill(self):
+        try:
+            self._path = self._store.write(self._chunks)
+        except Exception as e:
+            print(f"Keeping result in memory, spilling failed: {e}")
+            return
+        self._chunks = []
+        # The file goes when the last reference to this result does
+        weakref.finalize(self, self._store.release, self._path)
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def spilled(self) -> bool:
+        return self._path is not None
+
+    @property
+    def expired(self) -> bool:
+        """
+        Whether the result was spilled and its file has since been removed by the store's janitor.
+        """
+        return self._path is not None and not self._store.exists(self._path)
+
+    @property
+    def resident_bytes(self) -> int:
+        """
+        Bytes of the result held in memory: the preview, plus the fetched chunks or, once converted, the
+        DataFrame `result()` returns. Spilled results only add the rows `frame()` converted.
+        """
+        # Read without the lock, which is held while converting, as the result cache asks under its own
+        if self._path is not None:
+            head = self._head
+            return self._preview_bytes + (head[2] if head is not None else 0)
+        return self._preview_bytes + (self._df_bytes if self._df is not None else self.bytes)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def add_done_callback(self, callback):
+        """
+        Call `callback(result)` once fetching has stopped, or right away if it already has.
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def cancel(self):
+        """
+        Stop fetching after the current chunk, and the query itself if an `on_cancel` was given; the
+        rows fetched so far are kept.
+        """
+        self._cancelled.set()
+        if self._on_cancel is not None and not self.done:
+            self._on_cancel()
+
+    def wait(self, timeout: float = None, first_chunk: bool = False) -> bool:
+        """
+        Returns:
+            bool: Whether fetching stopped (or the first chunk arrived) within `timeout` seconds.
+        """
+        return (self._first_chunk if first_chunk else self._done).wait(timeout)
+
+    def preview(self, timeout: float = None) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: The first chunk of the result, waiting up to `timeout` seconds for it to arrive.
+        """
+        self._first_chunk.wait(timeout)
+        if self.error is not None and self._preview is None:
+            raise self.error
+        return self._preview if self._preview is not None else pd.DataFrame(columns=self._columns)
+
+    def result(self, timeout: float = None) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: Every fetched row, waiting up to `timeout` seconds for fetching to stop.
+
+        Raises:
+            TimeoutError: If fetching is still running after `timeout` seconds.
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Result still fetching after {timeout} s")
+        if self.error is not None:
+            raise self.error
+        if self._path is not None:
+            # Numeric columns without nulls stay backed by the memory-mapped file
+            return self._store.read(self._path).to_pandas(split_blocks=True)
+        with self._lock:
+            # Converted once; the Arrow chunks are released as the DataFrame is built
+            if self._df is None:
+                df = arrow_to_pandas(self._chunks, self._columns)
+                # Strings take far more room as Python objects than in Arrow
+                self._df_bytes = int(df.memory_usage(deep=True).sum())
+                self._df = df
+            return self._df
+
+    def frame(self, max_rows: int, timeout: float = None) -> pd.DataFrame:
+        """
+        The result as one DataFrame, for consumers that can't page through it (charts, summaries). A
+        result held in memory is returned whole, as by `result()`. Of a spilled result only the first
+        `max_rows` rows are converted, once, so it is never loaded back into memory in full.
+
+        Raises:
+            TimeoutError: If fetching is still running after `timeout` seconds.
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Result still fetching after {timeout} s")
+        if self.error is not None:
+            raise self.error
+        if self._path is None:
+            return self.result()
+        with self._lock:
+            if self._head is None or self._head[0] != max_rows:
+                head = self._store.read(self._path).slice(0, max_rows).to_pandas()
+                self._head = (max_rows, head, int(head.memory_usage(deep=True).sum()))
+            return self._head[1]
+
+    @property
+    def columns(self) -> list:
+        return list(self._columns or [])
+
+    def scannable(self):
+        """
+        Returns:
+            pa.Table | pd.DataFrame: Every fetched row in whichever form the result holds them (memory-mapped
+            if spilled), for DuckDB to scan without converting or copying them.
+        """
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        if self._path is not None:
+            return self._store.read(self._path)
+        with self._lock:
+            if self._df is not None:
+                return self._df
+            if not self._chunks:
+                return pd.DataFrame(columns=self._columns)
+            return concat_chunks(self._chunks)
+
+    def pages(self, rows: int = 100_000):
+        """
+        Yields:
+            pd.DataFrame: The whole result, `rows` rows at a time, see `page()`.
+        """
+        self._done.wait()
+        for offset in range(0, self.rows, rows):
+            yield self.page(offset, rows)
+
+    def page(self, offset: int, rows: int) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: `rows` rows of the result starting at `offset`, read without converting the rest.
+        """
+        if self._path is not None and self.done:
+            return self._store.read(self._path).slice(offset, rows).to_pandas()
+        return self.result().iloc[offset: offset + rows]
@@ -0,0 +1,242 @@
+# rpc_resilience.py
+import json
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Methods that only read from the model, so they can safely be retried, hedged and served from cache
+IDEMPOTENT_METHODS = {"generate_sql_from_question", "generate_questions", "get_training_data"}
+
+# Idempotent methods whose responses are too large to keep: the whole training set is already held
+# by the training data mirror, which also answers while the endpoint is down
+UNCACHED_METHODS = {"get_training_data"}
+
+DEFAULT_TIMEOUTS = {
+    "generate_sql_from_question": 30.0,
+    "generate_plotly_code": 30.0,
+    "generate_followup_questions": 30.0,
+    "generate_questions": 30.0,
+    "get_training_data": 120.0,
+}
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and stays open for `reset_timeout` seconds.
+    After that a single trial call is let through (half-open); it closes the breaker if it succeeds
+    and re-opens it if it fails.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class LatencyTracker:
+    """
+    Keeps the last `window` latencies of each method to estimate when a request is running late.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, method: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(method, deque(maxlen=self._window)).append(seconds)
+
+    def percentile(self, method: str, q: float):
+        with self._lock:
+            samples = sorted(self._samples.get(method, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class ResilientRPC:
+    """
+    Wraps RPC calls with per-method timeouts, retries, hedged requests and a circuit breaker.
+
+    - Every call gets the timeout configured for its method in `timeouts`.
+    - Idempotent methods are retried up to `max_attempts` times with jittered exponential backoff.
+    - With `hedge=True`, an idempotent call that is still running after the method's p95 latency
+      gets a duplicate request, and whichever answers first wins.
+    - After repeated failures the circuit breaker opens; while it is open, idempotent calls are
+      answered from the last good response for the same method and params (except for
+      `UNCACHED_METHODS`), and other calls fail fast.
+
+    Args:
+        timeouts (dict): Read timeout in seconds per method, overriding `DEFAULT_TIMEOUTS`.
+        default_timeout (float): Read timeout for methods not in `timeouts`.
+        max_attempts (int): Attempts per idempotent call, including the first one.
+        base_delay (float): Backoff before the first retry, in seconds.
+        max_delay (float): Upper bound on the backoff, in seconds.
+        hedge (bool): Send hedged duplicate requests for idempotent methods.
+        hedge_quantile (float): Latency quantile after which a hedge is sent.
+        breaker (CircuitBreaker): The circuit breaker to use.
+        cache_size (int): Number of last good responses kept for serving while the circuit is open.
+        max_workers (int): Threads available for hedged requests.
+    """
+
+    def __init__(
+        self,
+        timeouts: dict = None,
+        default_timeout: float = 60.0,
+        max_attempts: int = 3,
+        base_delay: float = 0.2,
+        max_delay: float = 2.0,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        breaker: CircuitBreaker = None,
+        cache_size: int = 1000,
+        max_workers: int = 16,
+    ):
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts is not None:
+            self.timeouts.update(timeouts)
+        self.default_timeout = default_timeout
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.latencies = LatencyTracker()
+
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rpc-hedge")
+
+    def call(self, method: str, payload: dict, send, timeout: float = None):
+        """
+        Args:
+            method (str): The RPC method name.
+            payload (dict): The request body, used as the cache key for the last good response.
+            send (callable): `send(timeout) -> dict` performing one HTTP request.
+            timeout (float): Read timeout overriding the one configured for `method`.
+
+        Returns:
+            dict: The RPC response, or `{"error": ...}` when no answer could be obtained.
+        """
+        idempotent = method in IDEMPOTENT_METHODS
+        cache_key = json.dumps(payload, sort_keys=True, default=str) if idempotent and method not in UNCACHED_METHODS else None
+
+        if not self.breaker.allow():
+            cached = self._cached(cache_key)
+            if cached is not None:
+                return cached
+            return {"error": f"{method} skipped: the Vanna endpoint is unavailable (circuit open)"}
+
+        if timeout is None:
+            timeout = self.timeout(method)
+        attempts = self.max_attempts if idempotent else 1
+        error = None
+
+        for attempt in range(attempts):
+            if attempt > 0:
+                # Full jitter: sleep a random time up to the exponential backoff
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))))
+            try:
+                if idempotent and self.hedge:
+                    d = self._hedged(method, send, timeout)
+                else:
+                    d = self._timed(method, send, timeout)
+            except Exception as e:
+                error = e
+                continue
+
+            self.breaker.record_success()
+            if cache_key is not None and "result" in d:
+                self._remember(cache_key, d)
+            return d
+
+        self.breaker.record_failure()
+        print(f"RPC Error calling {method}: {error}")
+
+        cached = self._cached(cache_key)
+        if cached is not None:
+            return cached
+        return {"error": f"{method} failed: {error}"}
+
+    def timeout(self, method: str) -> float:
+        return self.timeouts.get(method, self.default_timeout)
+
+    def _timed(self, method, send, timeout):
+        start = time.monotonic()
+        d = send(timeout)
+        self.latencies.record(method, time.monotonic() - start)
+        return d
+
+    def _hedged(self, method, send, timeout):
+        hedge_after = self.latencies.percentile(method, self.hedge_quantile)
+        primary = self._executor.submit(self._timed, method, send, timeout)
+        if hedge_after is None:
+            return primary.result()
+
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        pending = {primary, self._executor.submit(self._timed, method, send, timeout)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _remember(self, key, d):
+        with self._cache_lock:
+            self._cache[key] = d
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def _cached(self, key):
+        if key is None:
+            return None
+        with self._cache_lock:
+            return self._cache.get(key)
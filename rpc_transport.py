@@ -0,0 +1,133 @@
+# rpc_transport.py
+import gzip
+import json
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PooledTransport:
+    """
+    Thread-safe, connection-pooled HTTP transport for the Vanna RPC endpoints.
+
+    A single urllib3 connection pool is shared by every thread; each thread gets
+    its own `requests.Session` mounted on that pool, so concurrent Streamlit
+    sessions reuse warm keep-alive connections instead of paying a fresh TCP+TLS
+    handshake per RPC call.
+
+    Args:
+        pool_connections (int): Number of distinct hosts to keep pools for.
+        pool_maxsize (int): Maximum number of connections kept per host.
+        connect_timeout (float): Seconds to wait for the TCP/TLS connection.
+        read_timeout (float): Seconds to wait for the server to send a response.
+        keep_alive (bool): Keep connections open between calls.
+        gzip_requests (bool): Gzip request bodies (the server must accept `Content-Encoding: gzip`).
+        gzip_responses (bool): Ask the server for gzip-compressed responses.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 4,
+        pool_maxsize: int = 16,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 60.0,
+        keep_alive: bool = True,
+        gzip_requests: bool = False,
+        gzip_responses: bool = True,
+    ):
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self.keep_alive = keep_alive
+        self.gzip_requests = gzip_requests
+        self.gzip_responses = gzip_responses
+
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=False,
+        )
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", self._adapter)
+            session.mount("http://", self._adapter)
+            self._local.session = session
+        return session
+
+    def _encode(self, headers: dict, payload):
+        headers = dict(headers)
+        body = json.dumps(payload).encode("utf-8")
+
+        if self.gzip_requests:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+
+        headers["Accept-Encoding"] = "gzip, deflate" if self.gzip_responses else "identity"
+
+        if not self.keep_alive:
+            headers["Connection"] = "close"
+
+        return headers, body
+
+    def post(self, url: str, headers: dict, payload, timeout=None) -> requests.Response:
+        """
+        POST a JSON payload and return the response, whatever its status code.
+
+        Args:
+            url (str): The endpoint to call.
+            headers (dict): Request headers, including `Content-Type`.
+            payload: Any JSON-serialisable object.
+            timeout (float or tuple): Overrides the transport's (connect, read) timeout.
+
+        Returns:
+            requests.Response: The response.
+        """
+        headers, body = self._encode(headers, payload)
+
+        return self._session().post(
+            url,
+            headers=headers,
+            data=body,
+            timeout=self.timeout if timeout is None else timeout,
+        )
+
+    def post_json(self, url: str, headers: dict, payload, timeout=None):
+        """
+        POST a JSON payload and return the decoded JSON response. Arguments are as for `post()`.
+
+        Raises:
+            requests.HTTPError: On a server error (5xx), a timeout (408) or rate limiting (429), so
+                that retries and the circuit breaker see the call fail rather than an answer.
+        """
+        response = self.post(url, headers=headers, payload=payload, timeout=timeout)
+        if response.status_code >= 500 or response.status_code in (408, 429):
+            response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        self._adapter.close()
+
+
+class UnpooledTransport(PooledTransport):
+    """
+    A transport that opens a new connection for every call, matching a bare
+    `requests.post`. Kept for benchmarking and debugging against `PooledTransport`.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["keep_alive"] = False
+        PooledTransport.__init__(self, **kwargs)
+
+    def post(self, url: str, headers: dict, payload, timeout=None) -> requests.Response:
+        headers, body = self._encode(headers, payload)
+
+        return requests.post(
+            url,
+            headers=headers,
+            data=body,
+            timeout=self.timeout if timeout is None else timeout,
+        )
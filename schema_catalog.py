@@ -0,0 +1,305 @@
+# schema_catalog.py
+import hashlib
+import logging
+import threading
+import time
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import OptimizeError, ParseError
+from sqlglot.optimizer.qualify import qualify
+
+logger = logging.getLogger(__name__)
+
+# sqlglot dialect of each database type offered in the app
+DIALECTS = {
+    "Snowflake": "snowflake",
+    "Redshift": "redshift",
+    "SQLite3": "sqlite",
+    "DuckDB": "duckdb",
+}
+
+# DB-API parameter placeholder of each driver
+PLACEHOLDERS = {
+    "Snowflake": "%s",
+    "Redshift": "%s",
+    "SQLite3": "?",
+    "DuckDB": "?",
+}
+
+
+# Names every database of a type has without them being in the catalog: system tables, and columns
+# that any table can be queried for without declaring them
+SYSTEM_TABLE_PREFIXES = {
+    "Snowflake": (),
+    "Redshift": ("pg_", "stl_", "stv_", "svl_", "svv_"),
+    "SQLite3": ("sqlite_",),
+    "DuckDB": ("sqlite_", "pg_", "duckdb_"),
+}
+PSEUDO_COLUMNS = {
+    "Snowflake": {"metadata$action", "metadata$isupdate", "metadata$row_id", "metadata$filename", "metadata$file_row_number"},
+    "Redshift": set(),
+    "SQLite3": {"rowid", "oid", "_rowid_"},
+    "DuckDB": {"rowid"},
+}
+
+
+def unquote_sqlite_strings(expression: exp.Expression, columns) -> exp.Expression:
+    """
+    Replace the double-quoted names in a SQLite query that are neither one of `columns` nor an alias
+    of the query with the strings SQLite reads them as, e.g. Country = "Brazil". Changes `expression`
+    in place.
+    """
+    names = {column.lower() for column in columns}
+    names |= {alias.alias.lower() for alias in expression.find_all(exp.Alias)}
+    for column in list(expression.find_all(exp.Column)):
+        if not column.table and column.this.quoted and column.name.lower() not in names:
+            column.replace(exp.Literal.string(column.name))
+    return expression
+
+
+def _token(*values) -> str:
+    return hashlib.sha256(repr(values).encode("utf-8")).hexdigest()
+
+
+class SchemaCatalog:
+    """
+    In-memory catalog of the tables and views, their columns and types of one database, used to check
+    generated SQL locally before it is sent to the warehouse.
+
+    `refresh()` first runs a cheap probe of the table metadata (the stored DDL on SQLite and DuckDB,
+    `last_altered` on Snowflake) and only re-reads the columns of tables that were added or changed.
+    Redshift has no per-table change marker, so its probe reads the column list itself.
+
+    **Example:**
+    ```python
+    catalog = SchemaCatalog("SQLite3")
+    catalog.refresh(conn)
+    catalog.validate("SELECT Title FROM Album")  # []
+    catalog.validate("SELECT Name FROM Album")   # ["Unknown column 'name' ..."]
+    ```
+
+    Args:
+        db_type (str): "Snowflake", "Redshift", "SQLite3" or "DuckDB".
+        database (str): The database to introspect (Snowflake only).
+        schema (str): The schema to introspect and to resolve unqualified table names in. Defaults to
+            "main" on DuckDB; ignored on SQLite.
+        max_age (float): Seconds after which `is_stale()` asks for a refresh.
+    """
+
+    def __init__(self, db_type: str, database: str = None, schema: str = None, max_age: float = 300):
+        if db_type not in DIALECTS:
+            raise ValueError(f"Unsupported database type: {db_type}")
+
+        self.db_type = db_type
+        self.dialect = DIALECTS[db_type]
+        self.database = database if db_type == "Snowflake" else None
+        self.schema = None if db_type == "SQLite3" else (schema or ("main" if db_type == "DuckDB" else None))
+        self.max_age = max_age
+        self.last_refresh = None
+
+        self._lock = threading.Lock()
+        self._tables = {}  # (schema, table) -> {column: type}; schema is None on SQLite
+        self._versions = {}  # (schema, table) -> change token from the last probe
+
+    def is_stale(self) -> bool:
+        return self.last_refresh is None or time.time() - self.last_refresh > self.max_age
+
+    def tables(self) -> dict:
+        with self._lock:
+            return {key: dict(columns) for key, columns in self._tables.items()}
+
+    # Introspection
+
+    def _probe(self, cursor) -> tuple:
+        """
+        Returns:
+            tuple: A change token per table, and the columns of every table if the probe already read them.
+        """
+        if self.db_type == "SQLite3":
+            cursor.execute("SELECT name, sql FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'")
+            return {(None, name): _token(sql) for name, sql in cursor.fetchall()}, None
+        elif self.db_type == "DuckDB":
+            cursor.execute(
+                "SELECT schema_name, table_name, sql FROM duckdb_tables() WHERE schema_name = ? "
+                "UNION ALL SELECT schema_name, view_name, sql FROM duckdb_views() WHERE schema_name = ? AND NOT internal",
+                (self.schema, self.schema),
+            )
+            return {(schema, table): _token(sql) for schema, table, sql in cursor.fetchall()}, None
+        elif self.db_type == "Snowflake":
+            cursor.execute(
+                "SELECT table_schema, table_name, last_altered FROM information_schema.tables WHERE table_schema = %s",
+                (self.schema,),
+            )
+            return {(schema, table): _token(last_altered) for schema, table, last_altered in cursor.fetchall()}, None
+        else:
+            columns = self._read_columns(cursor, None)
+            return {key: _token(sorted(table_columns.items())) for key, table_columns in columns.items()}, columns
+
+    def _read_columns(self, cursor, tables) -> dict:
+        """
+        Read the columns of `tables`, or of every table and view in the schema when `tables` is None.
+        """
+        placeholder = PLACEHOLDERS[self.db_type]
+        names = sorted({table for _, table in tables}) if tables is not None else None
+
+        if self.db_type == "SQLite3":
+            query = (
+                "SELECT NULL, m.name, p.name, p.type FROM sqlite_master m JOIN pragma_table_info(m.name) p "
+                "WHERE m.type IN ('table', 'view') AND m.name NOT LIKE 'sqlite_%'"
+            )
+            params = []
+            if names is not None:
+                query += f" AND m.name IN ({', '.join([placeholder] * len(names))})"
+                params += names
+            query += " ORDER BY m.name, p.cid"
+        else:
+            query = (
+                "SELECT table_schema, table_name, column_name, data_type FROM information_schema.columns "
+                f"WHERE table_schema = {placeholder}"
+            )
+            params = [self.schema]
+            if names is not None:
+                query += f" AND table_name IN ({', '.join([placeholder] * len(names))})"
+                params += names
+            query += " ORDER BY table_schema, table_name, ordinal_position"
+
+        columns = {}
+        if names == []:
+            return columns
+
+        cursor.execute(query, params)
+        for schema, table, column, data_type in cursor.fetchall():
+            columns.setdefault((schema, table), {})[column] = data_type
+        return columns
+
+    def refresh(self, conn) -> dict:
+        """
+        Bring the catalog in line with the database, reading only the columns of new and changed tables.
+
+        Args:
+            conn: A DB-API connection to the database.
+
+        Returns:
+            dict: The tables added, changed and dropped since the last refresh.
+        """
+        cursor = conn.cursor()
+        versions, columns = self._probe(cursor)
+
+        with self._lock:
+            previous = dict(self._versions)
+
+        added = [key for key in versions if key not in previous]
+        changed = [key for key in versions if key in previous and previous[key] != versions[key]]
+        dropped = [key for key in previous if key not in versions]
+
+        if columns is None:
+            columns = self._read_columns(cursor, added + changed)
+
+        with self._lock:
+            for key in dropped:
+                self._tables.pop(key, None)
+            for key in added + changed:
+                self._tables[key] = columns.get(key, {})
+            self._versions = versions
+            self.last_refresh = time.time()
+
+        return {"added": added, "changed": changed, "dropped": dropped}
+
+    # Validation
+
+    def _mapping(self) -> dict:
+        # The nested {database: {schema: {table: {column: type}}}} shape sqlglot expects for this database
+        with self._lock:
+            tables = {key: dict(columns) for key, columns in self._tables.items()}
+
+        mapping = {}
+        for (schema, table), columns in tables.items():
+            if self.db_type == "SQLite3":
+                mapping[table] = columns
+            elif self.db_type == "Snowflake":
+                mapping.setdefault(self.database, {}).setdefault(schema, {})[table] = columns
+            else:
+                mapping.setdefault(schema, {})[table] = columns
+        return mapping
+
+    def validate(self, sql: str) -> list:
+        """
+        Check a query against the catalog without contacting the database.
+
+        Only problems the catalog can vouch for are reported: syntax errors in the database's dialect,
+        tables missing from the catalogued schema, and columns that no table in scope has or that more
+        than one table has. Queries on schemas outside the catalog, on system tables or selecting
+        pseudo-columns such as `rowid` are passed through unchecked, and on SQLite a double-quoted
+        name that isn't a column is taken as the string SQLite reads it as.
+
+        Args:
+            sql (str): The SQL query to check.
+
+        Returns:
+            list: Error messages; empty if the query looks valid.
+        """
+        try:
+            expressions = [expression for expression in sqlglot.parse(sql, read=self.dialect) if expression is not None]
+        except ParseError as e:
+            return [f"Syntax error: {e.errors[0]['description'] if e.errors else e}"]
+
+        if len(expressions) != 1:
+            return [f"Expected a single statement, got {len(expressions)}"]
+        expression = expressions[0]
+
+        with self._lock:
+            if not self._tables:
+                return []
+            known = {(schema.lower() if schema else None, table.lower()): columns for (schema, table), columns in self._tables.items()}
+
+        # Tables defined by the query itself, i.e. CTEs, are not expected in the catalog
+        ctes = {cte.alias_or_name.lower() for cte in expression.find_all(exp.CTE)}
+
+        referenced = []
+        for table in expression.find_all(exp.Table):
+            if not table.name or (not table.db and table.name.lower() in ctes):
+                continue
+            if table.catalog and self.database and table.catalog.lower() != self.database.lower():
+                return []
+            schema = (table.db or self.schema or "").lower() or None
+            if self.db_type != "SQLite3" and schema != (self.schema or "").lower():
+                return []
+            key = (schema, table.name.lower())
+            if key not in known and table.name.lower().startswith(SYSTEM_TABLE_PREFIXES[self.db_type]):
+                return []
+            if key not in known:
+                return [f"Unknown table '{table.sql(dialect=self.dialect)}'"]
+            referenced.append(key)
+
+        if self.db_type == "SQLite3":
+            unquote_sqlite_strings(expression, [column for key in referenced for column in known[key]])
+
+        try:
+            qualify(
+                expression.copy(),
+                schema=self._mapping(),
+                db=self.schema,
+                catalog=self.database,
+                dialect=self.dialect,
+                validate_qualify_columns=True,
+                identify=False,
+            )
+        except OptimizeError as e:
+            message = str(e)
+            if "could not be resolved" in message:
+                column = message.split("'")[1] if "'" in message else ""
+                if column.lower() in PSEUDO_COLUMNS[self.db_type]:
+                    return []
+                owners = [key[1] for key in dict.fromkeys(referenced) if column in {c.lower() for c in known[key]}]
+                if len(owners) > 1:
+                    return [f"Ambiguous column '{column}', found in {', '.join(owners)}"]
+                return [f"Unknown column '{column}'"]
+            if "Unknown column" in message:
+                return [message]
+            # Anything else is a limitation of the local check, not evidence the query is wrong
+            logger.info("Skipping offline validation: %s", message)
+        except Exception as e:
+            logger.info("Skipping offline validation: %s", e)
+
+        return []
@@ -0,0 +1,198 @@
+# schema_sync.py
+#
+# Push the DDL of the live schemas behind connect_db.connect_to_db into the model's training data,
+# re-training only the tables whose DDL changed since the last run.
+#
+#   python schema_sync.py --db SQLite3 --db DuckDB
+#   python schema_sync.py --db Snowflake --dry-run
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+from itertools import groupby
+
+import streamlit as st
+
+COLUMNS_QUERY = """
+    SELECT table_schema, table_name, column_name, data_type, is_nullable
+    FROM information_schema.columns
+    WHERE {where}
+    ORDER BY table_schema, table_name, ordinal_position
+"""
+
+
+def fingerprint(ddl: str) -> str:
+    return hashlib.sha256(ddl.encode("utf-8")).hexdigest()
+
+
+def render_ddl(table: str, columns: list) -> str:
+    """
+    Render a CREATE TABLE statement from (column_name, data_type, is_nullable) tuples.
+    """
+    lines = [
+        f"    {name} {data_type}{'' if str(is_nullable).upper() in ('YES', 'Y', 'TRUE') else ' NOT NULL'}"
+        for name, data_type, is_nullable in columns
+    ]
+    return f"CREATE TABLE {table} (\n" + ",\n".join(lines) + "\n);"
+
+
+def _tables_from_information_schema(cursor, where: str, params=(), qualifier: str = None) -> dict:
+    cursor.execute(COLUMNS_QUERY.format(where=where), params)
+    tables = {}
+    for (schema, table), rows in groupby(cursor.fetchall(), key=lambda row: (row[0], row[1])):
+        name = f"{qualifier}.{schema}.{table}" if qualifier else f"{schema}.{table}"
+        tables[name] = render_ddl(name, [row[2:] for row in rows])
+    return tables
+
+
+def introspect_tables(conn, db_type: str) -> dict:
+    """
+    Read the DDL of every table in the configured database with one catalog query.
+
+    Args:
+        conn: A connection returned by `connect_db.connect_to_db(db_type)`.
+        db_type (str): "Snowflake", "Redshift", "SQLite3" or "DuckDB".
+
+    Returns:
+        dict: Maps each (qualified) table name to its CREATE TABLE statement.
+    """
+    cursor = conn.cursor()
+
+    if db_type == "SQLite3":
+        cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")
+        return {name: sql.strip() + ";" for name, sql in cursor.fetchall() if sql}
+    elif db_type == "DuckDB":
+        return _tables_from_information_schema(cursor, "table_schema NOT IN ('information_schema', 'pg_catalog')")
+    elif db_type == "Redshift":
+        return _tables_from_information_schema(cursor, "table_schema = %s", (st.secrets["REDSHIFT_SCHEMA"],))
+    elif db_type == "Snowflake":
+        return _tables_from_information_schema(
+            cursor, "table_schema = %s", (st.secrets["SNOWFLAKE_SCHEMA"],), qualifier=st.secrets["SNOWFLAKE_DATABASE"]
+        )
+    else:
+        raise ValueError(f"Unsupported database type: {db_type}")
+
+
+class SchemaSyncState:
+    """
+    Remembers, per database and table, the fingerprint of the DDL last pushed and its training data id.
+
+    Args:
+        path (str): Path of the SQLite file holding the state.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_sync (
+                db_type TEXT,
+                table_name TEXT,
+                fingerprint TEXT,
+                training_id TEXT,
+                PRIMARY KEY (db_type, table_name)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, db_type: str) -> dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT table_name, fingerprint, training_id FROM schema_sync WHERE db_type = ?", (db_type,)
+            ).fetchall()
+        return {table: (fp, training_id) for table, fp, training_id in rows}
+
+    def set(self, db_type: str, table: str, fingerprint: str, training_id: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO schema_sync VALUES (?, ?, ?, ?)", (db_type, table, fingerprint, training_id))
+            self._conn.commit()
+
+    def delete(self, db_type: str, table: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM schema_sync WHERE db_type = ? AND table_name = ?", (db_type, table))
+            self._conn.commit()
+
+
+def sync_schema(vn, conn, db_type: str, state: SchemaSyncState, dry_run: bool = False) -> dict:
+    """
+    Train the model on the DDL of new and changed tables, and forget the DDL of dropped tables.
+
+    Args:
+        vn (VannaDefault): The model to train.
+        conn: A connection to the database to introspect.
+        db_type (str): "Snowflake", "Redshift", "SQLite3" or "DuckDB".
+        state (SchemaSyncState): Fingerprints from previous runs.
+        dry_run (bool): Only report what would change.
+
+    Returns:
+        dict: The tables added, changed, dropped and unchanged, and any errors.
+    """
+    tables = introspect_tables(conn, db_type)
+    previous = state.get(db_type)
+
+    fingerprints = {table: fingerprint(ddl) for table, ddl in tables.items()}
+    added = [table for table in tables if table not in previous]
+    changed = [table for table in tables if table in previous and previous[table][0] != fingerprints[table]]
+    dropped = [table for table in previous if table not in tables]
+    summary = {
+        "added": added,
+        "changed": changed,
+        "dropped": dropped,
+        "unchanged": len(tables) - len(added) - len(changed),
+        "errors": {},
+    }
+
+    if dry_run:
+        return summary
+
+    # Old DDL of changed and dropped tables is removed, so the model doesn't see two versions of a table
+    stale = {previous[table][1]: table for table in changed + dropped if previous[table][1]}
+    if stale:
+        for row in vn.remove_training_data_bulk(list(stale)).itertuples():
+            if row.status == "error":
+                summary["errors"][stale[row.id]] = row.error
+    for table in dropped:
+        if table not in summary["errors"]:
+            state.delete(db_type, table)
+
+    to_push = added + changed
+    if to_push:
+        results = vn.add_ddl_bulk([tables[table] for table in to_push])
+        for table, row in zip(to_push, results.itertuples()):
+            if row.status == "error":
+                summary["errors"][table] = row.error
+            else:
+                # Duplicates were trained by someone else; keep the fingerprint so they aren't retried
+                state.set(db_type, table, fingerprints[table], row.id)
+
+    return summary
+
+
+if __name__ == "__main__":
+    from connect_db import connect_to_db
+    from remote import VannaDefault
+
+    parser = argparse.ArgumentParser(description="Sync live schema DDL into the Vanna model's training data")
+    parser.add_argument("--db", action="append", required=True, choices=["Snowflake", "Redshift", "SQLite3", "DuckDB"])
+    parser.add_argument("--model", default="chinook")
+    parser.add_argument("--state", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema_sync.sqlite"))
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    vn = VannaDefault(api_key=st.secrets.get("VANNA_API_KEY"), model=args.model)
+    state = SchemaSyncState(args.state)
+
+    for db_type in args.db:
+        conn = connect_to_db(db_type)
+        summary = sync_schema(vn, conn, db_type, state, dry_run=args.dry_run)
+        conn.close()
+
+        print(
+            f"{db_type}: {len(summary['added'])} added, {len(summary['changed'])} changed, "
+            f"{len(summary['dropped'])} dropped, {summary['unchanged']} unchanged, {len(summary['errors'])} errors"
+        )
+        for table, error in summary["errors"].items():
+            print(f"  {table}: {error}")
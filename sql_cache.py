@@ -0,0 +1,123 @@
+# sql_cache.py
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize a question so that differences in case, whitespace and trailing punctuation map to the
+    same key. Punctuation inside the question is kept: "total > 10" and "total < 10", or "0.99" and
+    "0 99", ask different things.
+
+    **Example:**
+    ```python
+    normalize_question("  How many   customers are there? ")
+    # 'how many customers are there'
+    ```
+    """
+    question = " ".join(question.lower().split())
+    return re.sub(r"[\s?!.,;:]+$", "", question)
+
+
+class SQLCache:
+    """
+    Persistent, size-bounded cache of generated SQL stored in a SQLite file.
+
+    Entries are keyed on the model, the selected database and the normalized question. They expire
+    after `ttl` seconds, and the least recently used entries are evicted once there are more than
+    `max_entries` of them.
+
+    Args:
+        path (str): Path of the SQLite file holding the cache.
+        ttl (float): Seconds an entry stays valid. None keeps entries until they are evicted.
+        max_entries (int): Maximum number of entries kept on disk.
+    """
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600, max_entries: int = 10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sql_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                selected_db TEXT,
+                question TEXT,
+                sql TEXT,
+                created_at REAL,
+                last_access REAL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sql_cache_last_access ON sql_cache (last_access)")
+        self._conn.commit()
+
+    def _key(self, model: str, selected_db: str, question: str) -> str:
+        return hashlib.sha256(f"{model}\0{selected_db}\0{normalize_question(question)}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, selected_db: str, question: str):
+        """
+        Returns:
+            str or None: The cached SQL, or None on a miss.
+        """
+        key = self._key(model, selected_db, question)
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute("SELECT sql, created_at FROM sql_cache WHERE key = ?", (key,)).fetchone()
+
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE sql_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, model: str, selected_db: str, question: str, sql: str):
+        key = self._key(model, selected_db, question)
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sql_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, selected_db, normalize_question(question), sql, now, now),
+            )
+
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM sql_cache WHERE key IN (SELECT key FROM sql_cache ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                self.evictions += count - self.max_entries
+
+            self._conn.commit()
+
+    def delete(self, model: str, selected_db: str, question: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sql_cache WHERE key = ?", (self._key(model, selected_db, question),))
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": entries}
@@ -0,0 +1,472 @@
+# sql_rewrite.py
+import re
+from dataclasses import dataclass
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.dialects.dialect import Dialect, NormalizationStrategy
+
+from schema_catalog import DIALECTS, unquote_sqlite_strings
+
+# Dialects whose TABLESAMPLE sqlglot can generate
+SAMPLING_DIALECTS = {"snowflake", "duckdb"}
+
+
+@dataclass
+class PreviewRewrite:
+    sql: str
+    limit: int = None
+    sample_percent: float = None
+
+    @property
+    def rewritten(self) -> bool:
+        return self.limit is not None or self.sample_percent is not None
+
+
+def is_aggregate(expression: exp.Expression) -> bool:
+    """
+    Whether a query returns aggregated rows, i.e. every branch of its outermost SELECT groups or
+    aggregates. Window functions don't count, since they return one row per input row.
+    """
+    if isinstance(expression, exp.Union):
+        return is_aggregate(expression.left) and is_aggregate(expression.right)
+    if not isinstance(expression, exp.Select):
+        return False
+    if expression.args.get("group"):
+        return True
+    return any(
+        any(not aggregate.find_ancestor(exp.Window) for aggregate in projection.find_all(exp.AggFunc))
+        for projection in expression.expressions
+    )
+
+
+def _current_limit(expression: exp.Expression):
+    limit = expression.args.get("limit")
+    if limit is None or not isinstance(limit.expression, exp.Literal) or limit.expression.is_string:
+        return None
+    return int(limit.expression.this)
+
+
+def preview_sql(sql: str, db_type: str, limit: int = 1000, sample_percent: float = None) -> PreviewRewrite:
+    """
+    Rewrite an exploratory query into a cheap preview of its result.
+
+    Aggregates are returned unchanged, since their result is small and sampling would change the
+    numbers. Other queries get a LIMIT of `limit` rows (unless they already have a smaller one), and,
+    if `sample_percent` is set and the dialect supports it, the first table of the outermost FROM is
+    read through TABLESAMPLE, so that an ORDER BY or join doesn't have to read the whole table.
+
+    **Example:**
+    ```python
+    preview_sql("SELECT * FROM InvoiceLine ORDER BY UnitPrice", "DuckDB", limit=100, sample_percent=10)
+    # PreviewRewrite(sql='SELECT * FROM InvoiceLine TABLESAMPLE SYSTEM (10 PERCENT) ORDER BY UnitPrice LIMIT 100', ...)
+    ```
+
+    Args:
+        sql (str): The generated SQL query.
+        db_type (str): "Snowflake", "Redshift", "SQLite3" or "DuckDB".
+        limit (int): Maximum number of rows the preview returns.
+        sample_percent (float): Percentage of the driving table to read, or None not to sample.
+
+    Returns:
+        PreviewRewrite: The query to run and what was applied to it; `sql` is the input unchanged if
+        nothing was.
+    """
+    dialect = DIALECTS.get(db_type)
+    try:
+        expressions = sqlglot.parse(sql, read=dialect)
+    except Exception:
+        return PreviewRewrite(sql)
+
+    if len(expressions) != 1 or not isinstance(expressions[0], (exp.Select, exp.Union)):
+        return PreviewRewrite(sql)
+    expression = expressions[0]
+
+    if is_aggregate(expression):
+        return PreviewRewrite(sql)
+
+    applied_limit = None
+    current = _current_limit(expression)
+    if current is None or current > limit:
+        expression = expression.limit(limit)
+        applied_limit = limit
+
+    applied_sample = None
+    if sample_percent and dialect in SAMPLING_DIALECTS and isinstance(expression, exp.Select):
+        # sqlglot renamed the FROM argument from "from" to "from_"
+        from_ = expression.args.get("from_") or expression.args.get("from")
+        table = from_.this if from_ is not None else None
+        if isinstance(table, exp.Table) and table.args.get("sample") is None:
+            table.set("sample", exp.TableSample(method=exp.var("SYSTEM"), percent=exp.Literal.number(sample_percent)))
+            applied_sample = sample_percent
+
+    if applied_limit is None and applied_sample is None:
+        return PreviewRewrite(sql)
+    return PreviewRewrite(expression.sql(dialect=dialect), limit=applied_limit, sample_percent=applied_sample)
+
+
+def _spelled(name: str, dialect: Dialect) -> exp.Identifier:
+    # Quoted only where the dialect would otherwise fold the case, e.g. "Album" on Snowflake
+    identifier = exp.to_identifier(name)
+    case_sensitive = dialect.normalization_strategy != NormalizationStrategy.CASE_INSENSITIVE
+    if case_sensitive and dialect.normalize_identifier(exp.to_identifier(name)).name != name:
+        identifier.set("quoted", True)
+    return identifier
+
+
+# Column types whose values have a fractional part, so dividing by or into them isn't integer division
+_FRACTIONAL = re.compile(r"float|double|real|(decimal|numeric|number)\s*\(\s*\d+\s*,\s*[1-9]", re.IGNORECASE)
+
+
+def _fractional(operand: exp.Expression, column_types: dict) -> bool:
+    # Whether an operand is known to be fractional on SQLite, where only integers divide into an integer
+    operand = operand.unnest()
+    if isinstance(operand, exp.Literal):
+        return not operand.is_string and any(char in operand.this for char in ".eE")
+    if isinstance(operand, exp.Column):
+        types = column_types.get(operand.name.lower())
+        return bool(types) and all(_FRACTIONAL.search(column_type) for column_type in types)
+    if isinstance(operand, exp.Cast):
+        return bool(_FRACTIONAL.search(operand.to.sql()))
+    if isinstance(operand, exp.Avg):
+        return True
+    if isinstance(operand, (exp.Sum, exp.Min, exp.Max, exp.Neg)):
+        return _fractional(operand.this, column_types)
+    if isinstance(operand, (exp.Add, exp.Sub, exp.Mul, exp.Div)):
+        return _fractional(operand.this, column_types) or _fractional(operand.expression, column_types)
+    return False
+
+
+def _keep_sqlite_semantics(expression: exp.Expression, target_db: str, tables: dict):
+    """
+    Rewrite, in place, what SQLite evaluates differently from `target_db`:
+
+    - LIKE ignores case on SQLite, so it becomes ILIKE.
+    - A double-quoted name that isn't a column is a string on SQLite (`Title = "Facelift"`).
+    - SQLite divides integers into an integer, as Redshift does, but Snowflake and DuckDB don't: there,
+      a division is only kept if one side is known to be fractional.
+
+    Raises:
+        ValueError: If the query divides by or into something that may be an integer.
+    """
+    column_types = {}
+    for columns in (tables or {}).values():
+        for column, column_type in columns.items():
+            column_types.setdefault(column.lower(), set()).add(str(column_type))
+
+    if tables:
+        unquote_sqlite_strings(expression, column_types)
+    for like in list(expression.find_all(exp.Like)):
+        like.replace(exp.ILike(this=like.this, expression=like.expression))
+    if target_db != "Redshift":
+        for division in expression.find_all(exp.Div):
+            if not (_fractional(division.this, column_types) or _fractional(division.expression, column_types)):
+                raise ValueError(f"SQLite may divide integers here, which {target_db} doesn't: {division.sql(dialect='sqlite')}")
+
+
+def transpile_sql(sql: str, source_db: str, target_db: str, database: str = None, schema: str = None, tables: dict = None) -> str:
+    """
+    Translate a query written for one database into the dialect of another, locally.
+
+    Unqualified tables are qualified with `schema` and `database`. If the target's catalog is given,
+    table and column names are spelled the way the target stores them, and quoted where the target
+    would otherwise change their case: Snowflake upper-cases unquoted names, so a table copied over
+    as "Album" has to be quoted there. SQLite's case-insensitive LIKE, double-quoted strings and
+    integer division are carried over (see `_keep_sqlite_semantics`).
+
+    **Example:**
+    ```python
+    transpile_sql("SELECT strftime('%Y', InvoiceDate) FROM Invoice", "SQLite3", "Snowflake", database="CHINOOK", schema="PUBLIC")
+    # "SELECT TO_CHAR(CAST(InvoiceDate AS TIMESTAMP), 'yyyy') FROM CHINOOK.PUBLIC.Invoice"
+    ```
+
+    Args:
+        sql (str): The query, in the dialect of `source_db`.
+        source_db (str): The database the query was written for.
+        target_db (str): The database to translate it for.
+        database (str): Database to qualify tables with.
+        schema (str): Schema to qualify tables with.
+        tables (dict): The target's catalog as returned by `SchemaCatalog.tables()`, i.e.
+            {(schema, table): {column: type}}.
+
+    Returns:
+        str: The query in the dialect of `target_db`.
+
+    Raises:
+        ValueError: If `sql` isn't a single statement sqlglot can parse, or it can't be translated
+            without changing its result.
+    """
+    source, target = DIALECTS[source_db], DIALECTS[target_db]
+    try:
+        expressions = [expression for expression in sqlglot.parse(sql, read=source) if expression is not None]
+    except Exception as e:
+        raise ValueError(f"Can't parse the query as {source_db} SQL: {e}") from e
+    if len(expressions) != 1:
+        raise ValueError(f"Expected a single statement, got {len(expressions)}")
+    expression = expressions[0]
+    if source_db == "SQLite3" and target_db != "SQLite3":
+        _keep_sqlite_semantics(expression, target_db, tables)
+
+    dialect = Dialect.get_or_raise(target)
+    table_names = {}
+    column_names = {}
+    for (_, table), columns in (tables or {}).items():
+        table_names.setdefault(table.lower(), table)
+        for column in columns:
+            column_names.setdefault(column.lower(), set()).add(column)
+
+    # Tables defined by the query itself, i.e. CTEs, are neither renamed nor qualified
+    ctes = {cte.alias_or_name.lower() for cte in expression.find_all(exp.CTE)}
+
+    for table in expression.find_all(exp.Table):
+        if not table.name or (not table.db and table.name.lower() in ctes):
+            continue
+        if table.name.lower() in table_names:
+            table.set("this", _spelled(table_names[table.name.lower()], dialect))
+        if schema and not table.db:
+            table.set("db", exp.to_identifier(schema))
+            if database and not table.catalog:
+                table.set("catalog", exp.to_identifier(database))
+
+    for column in expression.find_all(exp.Column):
+        spellings = column_names.get(column.name.lower())
+        # A name spelled differently by different tables can't be resolved without qualifying the query
+        if spellings is not None and len(spellings) == 1:
+            column.set("this", _spelled(next(iter(spellings)), dialect))
+
+    return expression.sql(dialect=target)
+
+
+# Expressions that mean the same in every supported dialect and in DuckDB, so a refinement built from
+# only these returns the same rows locally as on the warehouse, as long as `duckdb_divergence` finds
+# nothing in it. Division is left out as well.
+REFINEMENT_NODES = (
+    exp.Column, exp.Identifier, exp.Literal, exp.Null, exp.Boolean, exp.Star, exp.Alias, exp.Paren,
+    exp.Neg, exp.Not, exp.And, exp.Or, exp.EQ, exp.NEQ, exp.GT, exp.GTE, exp.LT, exp.LTE, exp.In,
+    exp.Between, exp.Is, exp.Like, exp.Add, exp.Sub, exp.Mul, exp.Count, exp.Sum, exp.Min, exp.Max, exp.Avg,
+    exp.Distinct, exp.Ordered, exp.Order, exp.Group, exp.Having, exp.Where, exp.Limit, exp.Tuple,
+)
+
+# Expressions a whole query may be built from to run the same in DuckDB as on the source: the above,
+# plus the statement structure and a few functions that are defined the same everywhere
+DUCKDB_NODES = REFINEMENT_NODES + (
+    exp.Select, exp.From, exp.Join, exp.Table, exp.TableAlias, exp.Subquery, exp.With, exp.CTE, exp.Union,
+    exp.Offset, exp.Round, exp.Abs, exp.Coalesce, exp.Lower, exp.Upper,
+)
+
+_COMPARISONS = (exp.EQ, exp.NEQ, exp.GT, exp.GTE, exp.LT, exp.LTE, exp.In, exp.Between)
+
+# Text SQLite reads as a number when comparing it with a column of numeric affinity
+_NUMBER_LIKE = re.compile(r"\s*[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?\s*")
+
+
+def duckdb_divergence(expression: exp.Expression, db_type: str):
+    """
+    Find what in a query, written for `db_type`, DuckDB may evaluate differently: queries run locally
+    with DuckDB instead of on `db_type` must not contain it.
+
+    Only the expressions in `DUCKDB_NODES` are known to mean the same, except for:
+
+    - Division: SQLite and Redshift divide integers into an integer (7 / 2 is 3), DuckDB doesn't (3.5).
+    - LIKE on SQLite, where it ignores case and DuckDB's doesn't.
+    - AVG on Redshift, which truncates the average of integers and DuckDB's doesn't.
+    - Comparisons with number-like text on SQLite, which compares `InvoiceDate > '2010'` as a number
+      (and less than any text) where the column has numeric affinity, and DuckDB as text.
+
+    Anything else counts as different, e.g. CAST: SQLite truncates CAST(1.98 AS INTEGER) to 1, DuckDB
+    rounds it to 2.
+
+    Returns:
+        str: What differs, e.g. "division" or "CAST", or None if the query is known to run the same.
+    """
+    for node in expression.walk():
+        if isinstance(node, exp.Div):
+            return "division"
+        if isinstance(node, (exp.Like, exp.ILike)) and db_type == "SQLite3":
+            return "LIKE"
+        if isinstance(node, exp.Avg) and db_type == "Redshift":
+            return "AVG"
+        if db_type == "SQLite3" and isinstance(node, exp.Literal) and node.is_string and _NUMBER_LIKE.fullmatch(node.this):
+            parent = node.parent
+            while isinstance(parent, exp.Paren):
+                parent = parent.parent
+            if isinstance(parent, _COMPARISONS):
+                return f"comparison with '{node.this}'"
+        if not isinstance(node, DUCKDB_NODES):
+            return node.key.upper()
+    return None
+
+
+REFINEMENT_TABLE = "previous"
+
+
+def _text_safe(column: exp.Column) -> bool:
+    # A text column may only be selected, grouped, ordered, counted or compared with text: warehouses
+    # convert it to a number where one is expected (Snowflake sums a VARCHAR of numbers), DuckDB doesn't
+    parent = column.parent
+    while isinstance(parent, exp.Paren):
+        parent = parent.parent
+    if isinstance(parent, (exp.Select, exp.Alias, exp.Group, exp.Ordered, exp.Count, exp.Distinct)):
+        return True
+    if not isinstance(parent, (exp.EQ, exp.NEQ, exp.GT, exp.GTE, exp.LT, exp.LTE, exp.In, exp.Between, exp.Is, exp.Like)):
+        return False
+    for operand in parent.iter_expressions():
+        operand = operand.unnest()
+        if operand is column or isinstance(operand, exp.Null) or (isinstance(operand, exp.Literal) and operand.is_string):
+            continue
+        return False
+    return True
+
+
+def _sources(select: exp.Select) -> list:
+    return [select.args.get("from_") or select.args.get("from")] + list(select.args.get("joins") or [])
+
+
+def _conjuncts(select: exp.Select) -> list:
+    where = select.args.get("where")
+    if where is None:
+        return []
+    return list(where.this.flatten()) if isinstance(where.this, exp.And) else [where.this]
+
+
+def refine_from_result(
+    sql: str, previous_sql: str, db_type: str, previous_columns: list, previous_rows: int = None, text_columns: list = None
+):
+    """
+    Rewrite a query into one over the result of an earlier query, if that provably returns the same rows.
+
+    That holds when the earlier query returned its source rows unchanged, i.e. it is a plain SELECT of
+    columns without DISTINCT, grouping, aggregates, window functions or sampling, and with no LIMIT or
+    one it returned fewer rows than (as a preview of a small result does), and the new query reads
+    the same tables with the same joins, keeps every one of its filters, and only adds filters,
+    grouping, aggregates, ordering or a LIMIT over columns the earlier query returned, using
+    expressions that mean the same in every dialect (`REFINEMENT_NODES`) and that DuckDB evaluates
+    the same as `db_type` (`duckdb_divergence`). Columns the earlier result holds as text may only be
+    used as text, since the warehouse may have converted them to numbers where DuckDB can't.
+
+    **Example:**
+    ```python
+    refine_from_result(
+        "SELECT Name FROM Track WHERE Milliseconds > 300000 AND GenreId = 1 ORDER BY Name",
+        "SELECT Name, GenreId, Milliseconds FROM Track WHERE Milliseconds > 300000",
+        "SQLite3",
+        ["Name", "GenreId", "Milliseconds"],
+    )
+    # 'SELECT "Name" FROM previous WHERE "GenreId" = 1 ORDER BY "Name"'
+    ```
+
+    Args:
+        sql (str): The new query.
+        previous_sql (str): The earlier query, whose complete result is at hand.
+        db_type (str): The database both queries are written for.
+        previous_columns (list): The column names of the earlier result.
+        previous_rows (int): The number of rows of the earlier result.
+        text_columns (list): The columns of the earlier result that hold text (or only NULLs).
+
+    Returns:
+        str: DuckDB SQL over a table named `REFINEMENT_TABLE` holding the earlier result, or None if the
+        rewrite isn't provably equivalent.
+    """
+    dialect = DIALECTS.get(db_type)
+    try:
+        expressions = [sqlglot.parse(text, read=dialect) for text in (sql, previous_sql)]
+    except Exception:
+        return None
+    if any(len(parsed) != 1 or not isinstance(parsed[0], exp.Select) for parsed in expressions):
+        return None
+    query, previous = expressions[0][0], expressions[1][0]
+
+    # The earlier result has to hold the source rows as they are
+    if any(previous.args.get(key) for key in ("with", "distinct", "group", "having", "qualify", "offset")):
+        return None
+    if is_aggregate(previous) or previous.find(exp.Window) or previous.find(exp.Subquery) or previous.find(exp.TableSample):
+        return None
+    if previous.args.get("limit") is not None:
+        limit = _current_limit(previous)
+        if limit is None or previous_rows is None or previous_rows >= limit:
+            return None
+    if query.args.get("with") or query.args.get("offset"):
+        return None
+    if duckdb_divergence(query, db_type) is not None:
+        return None
+
+    sources = _sources(previous)
+    if [source.sql(dialect=dialect) for source in sources] != [source.sql(dialect=dialect) for source in _sources(query)]:
+        return None
+
+    previous_filters = {conjunct.sql(dialect=dialect) for conjunct in _conjuncts(previous)}
+    filters = {conjunct.sql(dialect=dialect): conjunct for conjunct in _conjuncts(query)}
+    if not previous_filters <= set(filters):
+        return None
+    remaining = [conjunct for key, conjunct in filters.items() if key not in previous_filters]
+
+    # Source column -> column of the earlier result. With a single table, qualifiers don't matter.
+    single_table = len(sources) == 1
+    lookup = {column.lower(): column for column in previous_columns}
+    if len(lookup) != len(previous_columns):
+        return None
+    mapping = {}
+    star = False
+    for projection in previous.expressions:
+        if isinstance(projection, exp.Star) or (isinstance(projection, exp.Column) and isinstance(projection.this, exp.Star)):
+            if not single_table:
+                return None
+            star = True
+            for column in previous_columns:
+                mapping[("", column.lower())] = column
+            continue
+        inner = projection.unalias()
+        output = lookup.get(projection.alias_or_name.lower())
+        if isinstance(inner, exp.Column) and output is not None:
+            mapping[("" if single_table else inner.table.lower(), inner.name.lower())] = output
+
+    def resolve(column: exp.Column):
+        key = ("" if single_table else column.table.lower(), column.name.lower())
+        if key in mapping:
+            return mapping[key]
+        if not column.table:
+            matches = {output for (_, name), output in mapping.items() if name == column.name.lower()}
+            if len(matches) == 1:
+                return matches.pop()
+        return None
+
+    refined = query.copy()
+    # sqlglot renamed the FROM argument from "from" to "from_"
+    refined.set("from_" if refined.args.get("from_") is not None else "from", exp.From(this=exp.to_table(REFINEMENT_TABLE)))
+    refined.set("joins", None)
+    refined.set("where", exp.Where(this=exp.and_(*[conjunct.copy() for conjunct in remaining])) if remaining else None)
+
+    # Name result columns as the warehouse would: Snowflake upper-cases unquoted aliases, and
+    # expressions are named after their SQL
+    source_dialect = Dialect.get_or_raise(dialect)
+    case_sensitive = source_dialect.normalization_strategy != NormalizationStrategy.CASE_INSENSITIVE
+    for projection in list(refined.expressions):
+        if isinstance(projection, exp.Alias):
+            if case_sensitive and not projection.args["alias"].quoted:
+                projection.set("alias", exp.to_identifier(source_dialect.normalize_identifier(projection.args["alias"].copy()).name, quoted=True))
+        elif not isinstance(projection, (exp.Column, exp.Star)):
+            projection.replace(exp.alias_(projection.copy(), exp.to_identifier(projection.sql(dialect=dialect), quoted=True)))
+
+    text = {column.lower() for column in text_columns or []}
+    own_aliases = {projection.alias.lower() for projection in refined.expressions if isinstance(projection, exp.Alias)}
+    for node in list(refined.walk()):
+        if node is refined or isinstance(node, (exp.From, exp.Table, exp.TableAlias)) or node.find_ancestor(exp.From):
+            continue
+        if not isinstance(node, REFINEMENT_NODES):
+            return None
+        if isinstance(node, exp.Star) and not isinstance(node.parent, exp.Count) and not star:
+            return None
+        if isinstance(node, exp.Column) and not isinstance(node.this, exp.Star):
+            if not node.table and node.name.lower() in own_aliases and node.find_ancestor(exp.Order):
+                continue
+            output = resolve(node)
+            if output is None or (output.lower() in text and not _text_safe(node)):
+                return None
+            replacement = exp.column(exp.to_identifier(output, quoted=True))
+            if node.parent is refined and output.lower() != node.name.lower():
+                # Keep the name the column would have had on the warehouse, not the earlier query's alias
+                name = source_dialect.normalize_identifier(node.this.copy()).name if case_sensitive else node.name
+                replacement = exp.alias_(replacement, exp.to_identifier(name, quoted=True))
+            node.replace(replacement)
+
+    return refined.sql(dialect="duckdb")
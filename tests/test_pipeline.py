@@ -0,0 +1,26 @@
+# tests/test_pipeline.py
+import threading
+
+from pipeline import PipelineRegistry
+
+
+def test_registry_keeps_max_per_session():
+    registry = PipelineRegistry(max_workers=2, max_per_session=3)
+    for i in range(10):
+        registry.get(("a", i), session="a").submit("sql", lambda: "SELECT 1").result()
+    registry.get(("b", 0), session="b")
+
+    assert list(registry._pipelines) == [("a", 7), ("a", 8), ("a", 9), ("b", 0)]
+
+
+def test_registry_keeps_running_pipelines():
+    registry = PipelineRegistry(max_workers=2, max_per_session=1)
+    release = threading.Event()
+    running = registry.get(("a", 0), session="a").submit("sql", release.wait)
+    registry.get(("a", 1), session="a")
+
+    assert ("a", 0) in registry._pipelines
+    release.set()
+    running.result()
+    registry.get(("a", 2), session="a")
+    assert list(registry._pipelines) == [("a", 2)]
@@ -0,0 +1,43 @@
+# tests/test_result_stream.py
+import sqlite3
+
+import pytest
+
+from result_store import ResultStore
+from result_stream import StreamingResult, iter_arrow_chunks
+
+
+@pytest.fixture
+def mixed_column():
+    # Numbers in the first chunk of 3 rows, text in the second
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.execute("CREATE TABLE t (id INTEGER, x)")
+    conn.executemany("INSERT INTO t VALUES (?, ?)", enumerate([1, 2, 3, "a", None, 5]))
+    yield conn
+    conn.close()
+
+
+def stream(conn, store=None) -> StreamingResult:
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, x FROM t ORDER BY id")
+    result = StreamingResult(iter_arrow_chunks(cursor, "SQLite3", chunk_rows=3), store=store)
+    assert result.wait(5)
+    assert result.error is None
+    return result
+
+
+def test_mixed_column_across_chunks_is_read_as_text(mixed_column):
+    result = stream(mixed_column)
+
+    assert result.scannable().column("x").to_pylist() == ["1", "2", "3", "a", None, "5"]
+    df = result.result()
+    assert df["id"].tolist() == [0, 1, 2, 3, 4, 5]
+    assert df["x"].dropna().tolist() == ["1", "2", "3", "a", "5"]
+
+
+def test_mixed_column_across_chunks_spills(mixed_column, tmp_path):
+    result = stream(mixed_column, store=ResultStore(str(tmp_path), spill_bytes=0, janitor_interval=None))
+
+    assert result.spilled
+    assert result.scannable().column("x").to_pylist() == ["1", "2", "3", "a", None, "5"]
+    assert result.page(3, 2)["x"].tolist()[0] == "a"
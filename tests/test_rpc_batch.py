@@ -0,0 +1,64 @@
+# tests/test_rpc_batch.py
+import pytest
+from vanna.types import QuestionSQLPair, StringData
+
+from benchmarks.stub_rpc_server import StubRPCServer
+from remote import VannaDefault
+
+
+class EchoStub(StubRPCServer):
+    # Echoes each add_sql question back as its id, and answers batches in reverse order
+    def handle(self, request):
+        response = StubRPCServer.handle(self, request)
+        if request.get("method") == "add_sql":
+            response = {"result": dict(response["result"], id=request["params"][0]["question"])}
+        return response
+
+
+def add_sql_calls(n: int) -> list:
+    return [("add_sql", [QuestionSQLPair(question=f"q{i}", sql="SELECT 1", tag="test")]) for i in range(n)]
+
+
+@pytest.fixture
+def client():
+    def connect(server):
+        return VannaDefault(model="chinook", api_key="test", config={"endpoint": server.endpoint})
+    return connect
+
+
+def test_responses_come_back_in_request_order(client):
+    with EchoStub() as server:
+        vn = client(server)
+        responses = vn.rpc_batch_call(add_sql_calls(25), batch_size=10)
+
+    assert [d["result"]["id"] for d in responses] == [f"q{i}" for i in range(25)]
+    assert server.calls == 25
+    assert vn._batch_supported
+
+
+def test_partial_errors_stay_with_their_call(client):
+    calls = add_sql_calls(2)
+    calls.insert(1, ("no_such_method", [StringData(data="x")]))
+
+    with EchoStub() as server:
+        responses = client(server).rpc_batch_call(calls)
+
+    assert responses[0]["result"]["id"] == "q0"
+    assert "error" in responses[1]
+    assert responses[2]["result"]["id"] == "q1"
+
+
+def test_rejected_batches_are_sent_one_by_one(client):
+    with EchoStub(batch=False) as server:
+        vn = client(server)
+        first = vn.rpc_batch_call(add_sql_calls(5))
+        assert not vn._batch_supported
+        calls_after_first = server.calls
+
+        # Once rejected, batches aren't tried again
+        second = vn.rpc_batch_call(add_sql_calls(5))
+
+    assert [d["result"]["id"] for d in first] == [f"q{i}" for i in range(5)]
+    assert [d["result"]["id"] for d in second] == [f"q{i}" for i in range(5)]
+    assert calls_after_first == 5
+    assert server.calls == 10
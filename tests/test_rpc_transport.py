@@ -0,0 +1,61 @@
+# tests/test_rpc_transport.py
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from rpc_resilience import CircuitBreaker, ResilientRPC
+from rpc_transport import PooledTransport
+
+
+@pytest.fixture
+def failing_server():
+    # Answers every request with a 503 and a JSON error body
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            calls.append(self.path)
+            body = json.dumps({"error": "Service unavailable"}).encode("utf-8")
+            self.send_response(503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    yield f"http://{host}:{port}/rpc", calls
+    server.shutdown()
+    server.server_close()
+
+
+def test_server_errors_raise(failing_server):
+    endpoint, _ = failing_server
+    with pytest.raises(requests.HTTPError):
+        PooledTransport().post_json(endpoint, headers={"Content-Type": "application/json"}, payload={"method": "x"})
+
+
+def test_server_errors_are_retried_and_open_the_breaker(failing_server):
+    endpoint, calls = failing_server
+    transport = PooledTransport()
+    rpc = ResilientRPC(max_attempts=3, base_delay=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+
+    def send(timeout):
+        return transport.post_json(endpoint, headers={"Content-Type": "application/json"}, payload={}, timeout=timeout)
+
+    d = rpc.call("generate_questions", {"method": "generate_questions"}, send)
+
+    assert "error" in d
+    assert len(calls) == 3
+    assert rpc.breaker.state == "open"
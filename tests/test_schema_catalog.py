@@ -0,0 +1,32 @@
+# tests/test_schema_catalog.py
+import os
+import sqlite3
+
+import pytest
+
+from schema_catalog import SchemaCatalog
+
+CHINOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Chinook.sqlite")
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    catalog = SchemaCatalog("SQLite3")
+    conn = sqlite3.connect(CHINOOK)
+    catalog.refresh(conn)
+    conn.close()
+    return catalog
+
+
+def test_double_quoted_string_on_sqlite(catalog):
+    assert catalog.validate('SELECT * FROM Customer WHERE Country = "Brazil"') == []
+    assert catalog.validate('SELECT "Country" FROM Customer') == []
+
+
+def test_unknown_column(catalog):
+    assert catalog.validate("SELECT Countryy FROM Customer") == ["Unknown column 'countryy'"]
+
+
+def test_system_tables_and_pseudo_columns(catalog):
+    assert catalog.validate("SELECT name FROM sqlite_master") == []
+    assert catalog.validate("SELECT rowid, Name FROM Artist") == []
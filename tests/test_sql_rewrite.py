@@ -0,0 +1,32 @@
+# tests/test_sql_rewrite.py
+import pytest
+
+from sql_rewrite import transpile_sql
+
+TABLES = {
+    ("S", "Album"): {"AlbumId": "NUMBER(38,0)", "Title": "VARCHAR"},
+    ("S", "Track"): {"TrackId": "NUMBER(38,0)", "Milliseconds": "NUMBER(38,0)", "UnitPrice": "NUMBER(10,2)"},
+}
+
+
+@pytest.mark.parametrize("target_db", ["Snowflake", "Redshift", "DuckDB"])
+def test_sqlite_like_ignores_case_everywhere(target_db):
+    sql = transpile_sql("SELECT Title FROM Album WHERE Title LIKE 'the%'", "SQLite3", target_db, tables=TABLES)
+    assert "ILIKE 'the%'" in sql
+
+
+@pytest.mark.parametrize("target_db", ["Snowflake", "Redshift", "DuckDB"])
+def test_sqlite_double_quoted_string_stays_a_string(target_db):
+    sql = transpile_sql('SELECT AlbumId FROM Album WHERE Title = "Facelift"', "SQLite3", target_db, tables=TABLES)
+    assert "= 'Facelift'" in sql
+
+
+@pytest.mark.parametrize("target_db", ["Snowflake", "DuckDB"])
+def test_sqlite_integer_division_is_not_transpiled(target_db):
+    with pytest.raises(ValueError):
+        transpile_sql("SELECT Milliseconds / 1000 FROM Track", "SQLite3", target_db, tables=TABLES)
+
+
+def test_fractional_division_and_redshift_division_are_kept():
+    assert "/" in transpile_sql("SELECT UnitPrice / 2 FROM Track", "SQLite3", "DuckDB", tables=TABLES)
+    assert "/" in transpile_sql("SELECT Milliseconds / 1000 FROM Track", "SQLite3", "Redshift", tables=TABLES)
@@ -0,0 +1,176 @@
+# training_mirror.py
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+COLUMNS = ["id", "training_data_type", "question", "content"]
+
+
+def content_hash(training_data_type: str, question, content) -> str:
+    """
+    Hash of a training entry's type, question and content, used to spot changed and duplicate entries.
+    """
+    question = question if isinstance(question, str) else ""
+    content = content if isinstance(content, str) else ""
+    return hashlib.sha256(f"{training_data_type}\0{question}\0{content}".encode("utf-8")).hexdigest()
+
+
+def parse_training_data(data: str) -> dict:
+    """
+    Parse the JSON returned by the `get_training_data` RPC into column lists, without going
+    through `pd.read_json`. Accepts the `columns`, `split` and `records` orientations.
+
+    Returns:
+        dict: Maps each column name to the list of its values.
+    """
+    parsed = json.loads(data)
+
+    if isinstance(parsed, list):
+        return {column: [row.get(column) for row in parsed] for column in COLUMNS}
+
+    if "columns" in parsed and "data" in parsed:
+        return {column: list(values) for column, values in zip(parsed["columns"], zip(*parsed["data"]))}
+
+    # {"column": {"row": value}}, the pandas default; every column lists the rows in the same order
+    return {column: list(values.values()) for column, values in parsed.items()}
+
+
+class TrainingDataMirror:
+    """
+    Local SQLite copy of a model's training data.
+
+    `sync()` takes a full download of the training set and writes only the entries whose id or
+    content hash changed; `sync_json()` skips even that when the download is the same as the last
+    one. The id and content hash of every entry are kept in memory for the comparison. Reads are then served locally and can be filtered by training data type. Entries
+    added or removed through `VannaDefault` are written through immediately, so a full sync is
+    only needed every `max_age` seconds to pick up changes made elsewhere.
+
+    Args:
+        path (str): Path of the SQLite file holding the mirror.
+        max_age (float): Seconds after which the mirror is considered stale and re-synced.
+    """
+
+    def __init__(self, path: str, max_age: float = 300):
+        self.path = path
+        self.max_age = max_age
+        self.last_sync = None
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS training_data (
+                id TEXT PRIMARY KEY,
+                training_data_type TEXT,
+                question TEXT,
+                content TEXT,
+                content_hash TEXT
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS training_data_type ON training_data (training_data_type)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS training_data_hash ON training_data (content_hash)")
+        self._conn.commit()
+        self._hashes = dict(self._conn.execute("SELECT id, content_hash FROM training_data"))  # id -> content hash
+        self._digest = None  # Digest of the last download synced, while nothing else was written since
+
+    def is_stale(self) -> bool:
+        return self.last_sync is None or time.time() - self.last_sync > self.max_age
+
+    def sync_json(self, data: str) -> dict:
+        """
+        Bring the mirror in line with the JSON returned by the `get_training_data` RPC. A download
+        that is the same as the one synced last, with nothing written in between, isn't parsed or
+        compared again.
+
+        Returns:
+            dict: Number of entries inserted, updated, deleted and unchanged.
+        """
+        digest = hashlib.sha256(data.encode("utf-8")).hexdigest()
+        with self._lock:
+            if digest == self._digest:
+                self.last_sync = time.time()
+                return {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": len(self._hashes)}
+        return self.sync(parse_training_data(data), digest=digest)
+
+    def sync(self, columns: dict, digest: str = None) -> dict:
+        """
+        Bring the mirror in line with a full download of the training data.
+
+        Args:
+            columns (dict): Column lists as returned by `parse_training_data`.
+            digest (str): Digest of the download, see `sync_json`.
+
+        Returns:
+            dict: Number of entries inserted, updated, deleted and unchanged.
+        """
+        ids = columns.get("id", [])
+        missing = [None] * len(ids)
+        remote = {
+            str(id): (training_data_type, question, content, content_hash(training_data_type, question, content))
+            for id, training_data_type, question, content in zip(
+                ids,
+                columns.get("training_data_type", missing),
+                columns.get("question", missing),
+                columns.get("content", missing),
+            )
+        }
+
+        with self._lock:
+            local = self._hashes
+
+            upserts = [(id, *entry) for id, entry in remote.items() if local.get(id) != entry[3]]
+            deletes = [(id,) for id in local.keys() - remote.keys()]
+
+            self._conn.executemany("INSERT OR REPLACE INTO training_data VALUES (?, ?, ?, ?, ?)", upserts)
+            self._conn.executemany("DELETE FROM training_data WHERE id = ?", deletes)
+            self._conn.commit()
+            self._hashes = {id: entry[3] for id, entry in remote.items()}
+            self._digest = digest
+            self.last_sync = time.time()
+
+        inserted = sum(1 for row in upserts if row[0] not in local)
+        return {
+            "inserted": inserted,
+            "updated": len(upserts) - inserted,
+            "deleted": len(deletes),
+            "unchanged": len(remote) - len(upserts),
+        }
+
+    def get(self, training_data_type: str = None) -> pd.DataFrame:
+        with self._lock:
+            if training_data_type is None:
+                rows = self._conn.execute(f"SELECT {', '.join(COLUMNS)} FROM training_data").fetchall()
+            else:
+                rows = self._conn.execute(
+                    f"SELECT {', '.join(COLUMNS)} FROM training_data WHERE training_data_type = ?",
+                    (training_data_type,),
+                ).fetchall()
+        return pd.DataFrame(rows, columns=COLUMNS)
+
+    def has_hash(self, hash: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM training_data WHERE content_hash = ? LIMIT 1", (hash,)).fetchone() is not None
+
+    def upsert(self, id: str, training_data_type: str, question, content):
+        hash = content_hash(training_data_type, question, content)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO training_data VALUES (?, ?, ?, ?, ?)",
+                (id, training_data_type, question, content, hash),
+            )
+            self._conn.commit()
+            self._hashes[id] = hash
+            self._digest = None
+
+    def remove(self, id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM training_data WHERE id = ?", (id,))
+            self._conn.commit()
+            self._hashes.pop(id, None)
+            self._digest = None
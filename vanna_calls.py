@@ -1,25 +1,129 @@
+import asyncio
+import os
+import threading
+import time
+import duckdb
+import pyarrow as pa
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 #from vanna.remote import VannaDefault
-from remote import VannaDefault
+from remote import AsyncVannaDefault
+from rpc_transport import PooledTransport
+from rpc_resilience import CircuitBreaker, ResilientRPC
+from sql_cache import SQLCache
+from question_index import QuestionIndex
+from training_mirror import TrainingDataMirror
+from schema_catalog import SchemaCatalog
+from result_cache import ResultCache, data_version, result_fingerprint
+from result_store import ResultStore
+from replica import DuckDBReplica
+from connect_db import pooled_connection, query_timeout
+from query_control import QueryBudget
+from sql_rewrite import REFINEMENT_TABLE, preview_sql, refine_from_result, transpile_sql
+from result_stream import StreamingResult, iter_arrow_chunks
+from pipeline import PipelineRegistry
+
+@st.cache_resource
+def get_rpc_transport():
+    # One keep-alive connection pool shared by every session and every setup_vanna() instance
+    return PooledTransport(
+        pool_maxsize=int(st.secrets.get("VANNA_POOL_SIZE", 16)),
+        connect_timeout=float(st.secrets.get("VANNA_CONNECT_TIMEOUT", 3.05)),
+        read_timeout=float(st.secrets.get("VANNA_READ_TIMEOUT", 60)),
+        gzip_requests=bool(st.secrets.get("VANNA_GZIP_REQUESTS", False)),
+    )
+
+@st.cache_resource
+def get_rpc_resilience():
+    # Shared so that latency percentiles, the circuit breaker and the fallback answers cover every session
+    return ResilientRPC(
+        max_attempts=int(st.secrets.get("VANNA_MAX_ATTEMPTS", 3)),
+        hedge=bool(st.secrets.get("VANNA_HEDGE_REQUESTS", False)),
+        breaker=CircuitBreaker(
+            failure_threshold=int(st.secrets.get("VANNA_BREAKER_FAILURES", 5)),
+            reset_timeout=float(st.secrets.get("VANNA_BREAKER_RESET", 30)),
+        ),
+    )
+
+@st.cache_resource
+def get_training_mirror():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "training_mirror.sqlite")
+    return TrainingDataMirror(path, max_age=float(st.secrets.get("TRAINING_MIRROR_MAX_AGE", 300)))
 
 @st.cache_resource(ttl=3600)
 def setup_vanna():
     APIKEY=st.secrets.get("VANNA_API_KEY")
     selected_db=st.session_state["selected_db"]
-    vn = VannaDefault(api_key=APIKEY, model='chinook')
+    config = {
+        "transport": get_rpc_transport(),
+        "resilience": get_rpc_resilience(),
+        "training_mirror": get_training_mirror(),
+    }
+    vn = AsyncVannaDefault(api_key=APIKEY, model='chinook', config=config)
     #vn.connect_db_2()
     vn.connect_to_sqlite("https://vanna.ai/Chinook.sqlite")
     return vn
 
+@st.cache_resource
+def get_sql_cache():
+    # Lives next to Chinook.sqlite so generated SQL survives restarts and redeploys
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql_cache.sqlite")
+    return SQLCache(
+        path,
+        ttl=float(st.secrets.get("SQL_CACHE_TTL", 7 * 24 * 3600)),
+        max_entries=int(st.secrets.get("SQL_CACHE_MAX_ENTRIES", 10000)),
+    )
+
+@st.cache_resource(ttl=3600, show_spinner="Loading answered questions ...")
+def get_question_index(selected_db: str, seed_from_training_data: bool):
+    index = QuestionIndex(threshold=float(st.secrets.get("QUESTION_INDEX_THRESHOLD", 0.9)))
+    # The trained question/SQL pairs are written for the default schema, so they are only
+    # reused for databases whose questions don't carry a database/schema assumption
+    if seed_from_training_data:
+        index.add_training_data(setup_vanna().get_training_data())
+    return index
+
+@st.cache_resource
+def get_schema_catalog(selected_db: str):
+    if selected_db == 'Snowflake':
+        return SchemaCatalog(
+            selected_db,
+            database=st.secrets["SNOWFLAKE_DATABASE"],
+            schema=st.secrets["SNOWFLAKE_SCHEMA"],
+            max_age=float(st.secrets.get("SCHEMA_CATALOG_MAX_AGE", 300)),
+        )
+    elif selected_db == 'Redshift':
+        return SchemaCatalog(selected_db, schema=st.secrets["REDSHIFT_SCHEMA"], max_age=float(st.secrets.get("SCHEMA_CATALOG_MAX_AGE", 300)))
+    return SchemaCatalog(selected_db, max_age=float(st.secrets.get("SCHEMA_CATALOG_MAX_AGE", 300)))
+
+def check_sql_offline(sql: str, selected_db: str) -> list:
+    """
+    Check generated SQL against the cached schema catalog, refreshing the catalog first if it is stale.
+
+    Returns:
+        list: Error messages; empty if the query looks valid or the catalog is unavailable.
+    """
+    catalog = get_schema_catalog(selected_db)
+    refresh_schema_catalog(catalog, selected_db)
+    return catalog.validate(sql)
+
+def refresh_schema_catalog(catalog, selected_db: str):
+    if catalog.is_stale():
+        try:
+            with pooled_connection(selected_db) as conn:
+                catalog.refresh(conn)
+        except Exception as e:
+            # Without a catalog, validation falls back to the warehouse and names are transpiled as written
+            print(f"Schema catalog refresh failed: {e}")
+
 @st.cache_data(show_spinner="Generating sample questions ...")
 def generate_questions_cached():
     vn = setup_vanna()
     return vn.generate_questions()
 
 
-@st.cache_data(show_spinner="Generating SQL query ...")
-def generate_sql_cached(question: str, selected_db: str):
+def _generate_sql_remote(question: str, selected_db: str):
     vn = setup_vanna()
     if selected_db =='Snowflake':
         database=st.secrets["SNOWFLAKE_DATABASE"]
@@ -33,43 +137,417 @@ def generate_sql_cached(question: str, selected_db: str):
         assumption=''
         pass
     question_db = question + assumption
-    return vn.generate_sql(question=question_db, allow_llm_to_see_data=True)
 
-@st.cache_data(show_spinner="Checking for valid SQL ...")
-def is_sql_valid_cached(sql: str, selected_db: str):
-    vn = setup_vanna()
-    return vn.is_sql_valid(sql=sql, selected_db=selected_db)
-    #return vn.is_sql_valid(sql=sql)
+    sql_cache = get_sql_cache()
+    sql = sql_cache.get(vn._model, selected_db, question)
+    if sql is not None:
+        return sql
 
-@st.cache_data(show_spinner="Running SQL query ...")
-def run_sql_cached(sql: str):
-    vn = setup_vanna()
-    return vn.run_sql(sql=sql)
+    question_index = get_question_index(selected_db, seed_from_training_data=(assumption == ''))
+    match = question_index.search(question)
+    if match is not None:
+        return match.sql
+
+    sql = vn.generate_sql(question=question_db, allow_llm_to_see_data=True)
+    # Only keep answers that look like SQL, so an explanation or error message isn't replayed after a restart
+    if sql is not None and sql.lstrip().lower().startswith(("select", "with")):
+        sql_cache.set(vn._model, selected_db, question, sql)
+        question_index.add(question, sql)
+    return sql
+
+def get_canonical_db() -> str:
+    # SQL is generated in this database's dialect and transpiled locally for the others
+    return st.secrets.get("SQL_CANONICAL_DB", "SQLite3")
+
+@st.cache_data(show_spinner=False)
+def generate_canonical_sql(question: str):
+    return _generate_sql_remote(question, get_canonical_db())
+
+def qualifying_names(selected_db: str) -> tuple:
+    # (database, schema) that unqualified tables are qualified with on `selected_db`
+    if selected_db == 'Snowflake':
+        return st.secrets["SNOWFLAKE_DATABASE"], st.secrets["SNOWFLAKE_SCHEMA"]
+    elif selected_db == 'Redshift':
+        return st.secrets["REDSHIFT_DBNAME"], st.secrets["REDSHIFT_SCHEMA"]
+    return None, None
+
+def generate_sql_cached(question: str, selected_db: str):
+    """
+    SQL answering `question` on `selected_db`. The model is asked once per question, for the canonical
+    database, and its SQL is transpiled locally for the others, so switching databases doesn't cost
+    another model call. Only if the SQL can't be transpiled is the model asked for `selected_db` itself.
+    """
+    canonical_db = get_canonical_db()
+    sql = generate_canonical_sql(question)
+    if selected_db == canonical_db or sql is None or not sql.lstrip().lower().startswith(("select", "with")):
+        return sql
+
+    catalog = get_schema_catalog(selected_db)
+    refresh_schema_catalog(catalog, selected_db)
+    database, schema = qualifying_names(selected_db)
+    try:
+        return transpile_sql(sql, canonical_db, selected_db, database=database, schema=schema, tables=catalog.tables())
+    except Exception as e:
+        print(f"Transpiling SQL to {selected_db} failed, generating it instead: {e}")
+        return _generate_sql_remote(question, selected_db)
+
+@st.cache_resource
+def get_result_cache():
+    # Shared by every session, so the byte budget bounds the memory of the whole process
+    return ResultCache(
+        max_bytes=int(float(st.secrets.get("RESULT_CACHE_MB", 512)) * 1024 * 1024),
+        probe_interval=float(st.secrets.get("RESULT_CACHE_PROBE_INTERVAL", 30)),
+    )
+
+@st.cache_resource
+def get_result_store():
+    # Results above RESULT_SPILL_MB live in memory-mapped files instead of RAM
+    return ResultStore(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "result_spill"),
+        spill_bytes=int(float(st.secrets.get("RESULT_SPILL_MB", 64)) * 1024 * 1024),
+        max_age=float(st.secrets.get("RESULT_SPILL_MAX_AGE", 3600)),
+    )
+
+def probe_data_version(selected_db: str) -> str:
+    with pooled_connection(selected_db) as conn:
+        if selected_db == 'Snowflake':
+            return data_version(conn, selected_db, schema=st.secrets["SNOWFLAKE_SCHEMA"])
+        elif selected_db == 'Redshift':
+            return data_version(conn, selected_db, schema=st.secrets["REDSHIFT_SCHEMA"])
+        elif selected_db == 'SQLite3':
+            return data_version(conn, selected_db, path=st.secrets["SQLITE3_DB_PATH"])
+        return data_version(conn, selected_db, path=st.secrets["DUCKDB_DB_PATH"])
+
+def rewrite_for_preview(sql: str, selected_db: str):
+    # Aggregates run in full; anything else is capped at PREVIEW_ROWS rows and, where the
+    # dialect allows it, reads a PREVIEW_SAMPLE_PERCENT sample of its driving table
+    sample_percent = st.secrets.get("PREVIEW_SAMPLE_PERCENT")
+    return preview_sql(
+        sql,
+        selected_db,
+        limit=int(st.secrets.get("PREVIEW_ROWS", 1000)),
+        sample_percent=float(sample_percent) if sample_percent else None,
+    )
+
+@st.cache_resource
+def get_replica(selected_db: str):
+    """
+    The local DuckDB replica of `selected_db`, if REPLICA_DATABASES lists it, refreshed in the
+    background every REPLICA_REFRESH_INTERVAL seconds. REPLICA_TABLES limits it to some tables.
+    """
+    if selected_db not in st.secrets.get("REPLICA_DATABASES", []):
+        return None
+    directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replica")
+    os.makedirs(directory, exist_ok=True)
+    replica = DuckDBReplica(os.path.join(directory, f"{selected_db}.duckdb"), selected_db)
+    replica.start_schedule(lambda: refresh_replica(replica, selected_db), float(st.secrets.get("REPLICA_REFRESH_INTERVAL", 3600)))
+    return replica
+
+def refresh_replica(replica, selected_db: str) -> bool:
+    catalog = get_schema_catalog(selected_db)
+    refresh_schema_catalog(catalog, selected_db)
+    selected = {table.lower() for table in st.secrets.get("REPLICA_TABLES", [])}
+    tables = [key for key in catalog.tables() if not selected or key[1].lower() in selected]
+    if not tables:
+        return False
+
+    # Probed before copying, so changes made while copying bring on another refresh
+    version = probe_data_version(selected_db)
+    database, schema = qualifying_names(selected_db)
+    with pooled_connection(selected_db) as conn:
+        return replica.refresh(conn, version, tables, database=database, schema=schema)
+
+@st.cache_resource
+def get_query_budget():
+    return QueryBudget(
+        max_concurrent=int(st.secrets.get("QUERY_MAX_CONCURRENT", 2)),
+        max_runtime=float(st.secrets.get("QUERY_MAX_RUNTIME", 900)),
+        window=float(st.secrets.get("QUERY_BUDGET_WINDOW", 3600)),
+    )
+
+def current_session() -> str:
+    return get_script_run_ctx().session_id
+
+def current_user() -> str:
+    # The signed-in user if authentication is configured, otherwise the browser session
+    try:
+        if st.user.is_logged_in:
+            return st.user.email
+    except Exception:
+        pass
+    return current_session()
+
+def result_limits() -> dict:
+    return dict(
+        chunk_rows=int(st.secrets.get("RESULT_CHUNK_ROWS", 10000)),
+        max_rows=int(st.secrets.get("RESULT_MAX_ROWS", 1_000_000)),
+        max_bytes=int(float(st.secrets.get("RESULT_MAX_MB", 256)) * 1024 * 1024),
+    )
+
+def result_frame(result):
+    # The chart, summary and follow-up stages only get the first RESULT_STAGE_ROWS rows of a spilled result
+    return result.frame(max_rows=int(st.secrets.get("RESULT_STAGE_ROWS", 10_000)))
 
-@st.cache_data(show_spinner="Checking if we should generate a chart ...")
-def should_generate_chart_cached(question, sql, df):
+def refine_from_cache(sql: str, selected_db: str, version: str):
+    """
+    Answer a query locally with DuckDB over a cached earlier result, if `refine_from_result` can prove
+    that returns the same rows as the warehouse would. The local query runs before its result is handed
+    out, so if DuckDB fails on it the warehouse answers instead.
+
+    Returns:
+        StreamingResult: The result, or None if no cached result can answer the query.
+    """
+    for previous_sql, previous in get_result_cache().recent(selected_db, version):
+        if not previous.done or previous.error is not None or previous.truncated or previous.cancelled or previous.expired:
+            continue
+
+        conn = None
+        try:
+            table = previous.scannable()
+            schema = table.schema if isinstance(table, pa.Table) else pa.Schema.from_pandas(table, preserve_index=False)
+            text_columns = [
+                field.name for field in schema
+                if pa.types.is_string(field.type) or pa.types.is_large_string(field.type) or pa.types.is_null(field.type)
+            ]
+            local_sql = refine_from_result(
+                sql, previous_sql, selected_db, previous.columns, previous_rows=previous.rows, text_columns=text_columns
+            )
+            if local_sql is None:
+                continue
+
+            conn = duckdb.connect()
+            conn.register(REFINEMENT_TABLE, table)
+            conn.execute(local_sql)
+        except Exception as e:
+            print(f"Not answering from the cached result: {e}")
+            if conn is not None:
+                conn.close()
+            continue
+
+        limits = result_limits()
+        result = StreamingResult(
+            iter_arrow_chunks(conn, "DuckDB", limits["chunk_rows"]),
+            max_rows=limits["max_rows"],
+            max_bytes=limits["max_bytes"],
+            on_close=conn.close,
+            on_cancel=conn.interrupt,
+            store=get_result_store(),
+        )
+        result.served_by = "cached result of an earlier query"
+        return result
+    return None
+
+def run_sql_streaming(sql: str, selected_db: str, charge_budget: bool = True):
+    """
+    Start a query whose result is fetched in the background, up to the RESULT_MAX_ROWS / RESULT_MAX_MB budget.
+    Reruns get the same result back from the result cache until the data of the database changes.
+    Queries the schema catalog can already tell are broken never reach the warehouse.
+    With `charge_budget=False` the caller accounts for the query in the user's budget itself.
+    """
+    result_cache = get_result_cache()
+    version = result_cache.version(selected_db, lambda: probe_data_version(selected_db))
+    result = result_cache.get(selected_db, sql, version)
+    if result is not None:
+        if result.started_by != current_session():
+            # Now read by more than one session, so none of them may cancel it for the others
+            result.started_by = None
+        return result
+
+    # Refinements of a complete earlier result are answered from it, without the warehouse
+    result = refine_from_cache(sql, selected_db, version)
+    if result is not None:
+        result.started_by = current_session()
+        result.fingerprint = result_fingerprint(selected_db, sql, version)
+        result_cache.set(selected_db, sql, version, result)
+        return result
+
+    errors = check_sql_offline(sql, selected_db)
+    if errors:
+        raise ValueError("; ".join(errors))
+
+    # Queries the local replica can answer at the source's current data version run there instead
+    replica, replica_sql = None, None
+    try:
+        replica = get_replica(selected_db)
+        if replica is not None:
+            replica_sql = replica.route(sql, version, schema=qualifying_names(selected_db)[1])
+    except Exception as e:
+        print(f"Not routing to the replica: {e}")
+
+    # Only queries that reach the database count against the user's budget. The slot is taken right
+    # before the query starts, so that nothing can fail between taking and handing it back.
+    user = current_user()
+    budget = get_query_budget()
+    if charge_budget:
+        budget.acquire(user)
+    try:
+        vn = setup_vanna()
+        result = vn.stream_sql(
+            sql=replica_sql or sql,
+            selected_db="DuckDB" if replica_sql else selected_db,
+            timeout=query_timeout(),
+            store=get_result_store(),
+            pool=replica.pool if replica_sql else None,
+            **result_limits(),
+        )
+    except Exception:
+        if charge_budget:
+            budget.release(user, 0)
+        raise
+    if charge_budget:
+        result.add_done_callback(lambda result: budget.release(user, result.elapsed))
+    if replica_sql:
+        result.served_by = "local DuckDB replica"
+    result.started_by = current_session()
+    # Identifies this result for the downstream caches without hashing its rows
+    result.fingerprint = result_fingerprint(selected_db, sql, version)
+    result_cache.set(selected_db, sql, version, result)
+    return result
+
+def forget_sql_result(sql: str, selected_db: str):
+    get_result_cache().delete(selected_db, sql)
+
+def _generate_sql_timed(question: str, selected_db: str):
+    start = time.perf_counter()
+    return generate_sql_cached(question=question, selected_db=selected_db), time.perf_counter() - start
+
+async def fan_out_question(question: str, targets: list):
+    """
+    Ask one question on several databases at once. SQL is generated for every target concurrently, and
+    each target's query starts on that database's connection pool as soon as its SQL is ready, so the
+    slowest target sets the latency instead of the sum of all of them.
+
+    The fan-out counts as one query against the user's budget, charged with the summed runtime of its
+    queries once all of them have finished.
+
+    Yields:
+        tuple: (target, sql, seconds spent generating the SQL, StreamingResult or None, error or None),
+        as each target's query starts or fails to.
+
+    Raises:
+        BudgetExceeded: If the user can't start another query.
+    """
+    user = current_user()
+    budget = get_query_budget()
+    budget.acquire(user)
+
+    since = time.monotonic()
+    started = []
+    try:
+        stages = {target: (_generate_sql_timed, dict(question=question, selected_db=target)) for target in targets}
+        async for target, (sql, seconds) in run_stages_concurrently(stages):
+            if not sql or not sql.lstrip().lower().startswith(("select", "with")):
+                yield target, sql, seconds, None, ValueError("No SQL was generated for this database")
+                continue
+            try:
+                result = run_sql_streaming(sql=sql, selected_db=target, charge_budget=False)
+            except Exception as e:
+                yield target, sql, seconds, None, e
+                continue
+            started.append(result)
+            yield target, sql, seconds, result, None
+    finally:
+        # Results served from the result cache ran earlier and were charged then
+        _release_when_done(budget, user, [result for result in started if result.started_at >= since])
+
+def _release_when_done(budget, user, results: list):
+    if not results:
+        budget.release(user, 0)
+        return
+
+    lock = threading.Lock()
+    pending = [len(results)]
+
+    def done(_):
+        with lock:
+            pending[0] -= 1
+            if pending[0]:
+                return
+        budget.release(user, sum(result.elapsed for result in results))
+
+    for result in results:
+        result.add_done_callback(done)
+
+# The stages below take the result as `_df`, which st.cache_data doesn't hash, and are keyed on
+# `df_key` instead: the fingerprint run_sql_streaming computed once for the result
+@st.cache_data(show_spinner=False)
+def should_generate_chart_cached(question, sql, df_key, _df):
     vn = setup_vanna()
-    return vn.should_generate_chart(df=df)
+    return vn.should_generate_chart(df=_df)
 
-@st.cache_data(show_spinner="Generating Plotly code ...")
-def generate_plotly_code_cached(question, sql, df):
+@st.cache_data(show_spinner=False)
+def generate_plotly_code_cached(question, sql, df_key, _df):
     vn = setup_vanna()
-    code = vn.generate_plotly_code(question=question, sql=sql, df=df)
+    code = vn.generate_plotly_code(question=question, sql=sql, df=_df)
     return code
 
 
-@st.cache_data(show_spinner="Running Plotly code ...")
-def generate_plot_cached(code, df):
+@st.cache_data(show_spinner=False)
+def generate_plot_cached(code, df_key, _df):
     vn = setup_vanna()
-    return vn.get_plotly_figure(plotly_code=code, df=df)
+    return vn.get_plotly_figure(plotly_code=code, df=_df)
 
 
-@st.cache_data(show_spinner="Generating followup questions ...")
-def generate_followup_cached(question, sql, df):
+@st.cache_data(show_spinner=False)
+def generate_followup_cached(question, sql, df_key, _df):
     vn = setup_vanna()
-    return vn.generate_followup_questions(question=question, sql=sql, df=df)
+    return vn.generate_followup_questions(question=question, sql=sql, df=_df)
 
-@st.cache_data(show_spinner="Generating summary ...")
-def generate_summary_cached(question, df):
+@st.cache_data(show_spinner=False)
+def generate_summary_cached(question, df_key, _df):
     vn = setup_vanna()
-    return vn.generate_summary(question=question, df=df)
+    return vn.generate_summary(question=question, df=_df)
+
+@st.cache_resource
+def get_pipelines():
+    return PipelineRegistry(
+        max_workers=int(st.secrets.get("PIPELINE_WORKERS", 8)),
+        max_bytes=int(float(st.secrets.get("PIPELINE_MAX_MB", 64)) * 1024 * 1024),
+        max_per_session=int(st.secrets.get("PIPELINE_MAX_PER_SESSION", 16)),
+    )
+
+def submit_stage(pipeline, key, fn, reuse: bool = True, **kwargs):
+    """
+    Run a stage of `pipeline` on the shared workers, unless it is already running or has finished.
+    The worker runs with this script run's context, so st.cache_data, secrets and `current_user()`
+    behave as they would in the script.
+
+    Returns:
+        concurrent.futures.Future: The stage's future.
+    """
+    ctx = get_script_run_ctx()
+
+    def call():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        try:
+            return fn(**kwargs)
+        finally:
+            add_script_run_ctx(threading.current_thread(), None)
+
+    return pipeline.submit(key, call, reuse=reuse)
+
+async def run_stages_concurrently(stages: dict):
+    """
+    Run independent *_cached stages at the same time and yield (name, result) as each one finishes.
+
+    Args:
+        stages (dict): Maps a stage name to a (function, kwargs) tuple.
+    """
+    # Worker threads share this script run's context so st.cache_data and spinners keep working
+    ctx = get_script_run_ctx()
+
+    def call(fn, kwargs):
+        # Pool threads are reused, so whatever context the thread had is put back afterwards
+        thread = threading.current_thread()
+        previous = get_script_run_ctx(suppress_warning=True)
+        add_script_run_ctx(thread, ctx)
+        try:
+            return fn(**kwargs)
+        finally:
+            add_script_run_ctx(thread, previous)
+
+    async def run(name, fn, kwargs):
+        return name, await asyncio.to_thread(call, fn, kwargs)
+
+    for next_done in asyncio.as_completed([run(name, fn, kwargs) for name, (fn, kwargs) in stages.items()]):
+        yield await next_done